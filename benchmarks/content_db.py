@@ -0,0 +1,224 @@
+"""Builds a synthetic SQLite stand-in for the EQEmu content tables EQDB reads
+
+Every column the site queries exists, filled with seeded random values, so the same scale and seed always build the
+same database.  Run from an EQDB checkout:
+
+    python benchmarks/content_db.py content.db --scale 4
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..'))
+
+import utils
+
+
+def _columns(prefix, count, column_type='INTEGER DEFAULT 0'):
+    return [f'{prefix}{idx} {column_type}' for idx in range(1, count + 1)]
+
+
+# Integer item columns, all of which default to 0
+ITEM_INT = ['hp', 'mana', 'endur', 'ac', 'damage', 'aagi', 'acha', 'adex', 'aint', 'asta', 'astr', 'awis',
+            'heroic_agi', 'heroic_cha', 'heroic_dex', 'heroic_int', 'heroic_sta', 'heroic_str', 'heroic_wis', 'cr',
+            'dr', 'fr', 'mr', 'pr', 'heroic_cr', 'heroic_dr', 'heroic_fr', 'heroic_mr', 'heroic_pr', 'attack',
+            'haste', 'regen', 'manaregen', 'enduranceregen', 'healamt', 'spelldmg', 'accuracy', 'avoidance',
+            'combateffects', 'damageshield', 'dotshielding', 'shielding', 'spellshield', 'strikethrough',
+            'stunresist', 'delay', 'proceffect', 'focuseffect', 'clickeffect', 'banedmgamt', 'banedmgbody',
+            'banedmgrace', 'banedmgraceamt', 'elemdmgamt', 'elemdmgtype', 'clicklevel2', 'proclevel2',
+            'backstabdmg', 'bardeffect', 'worneffect', 'procrate', 'bagtype', 'bagslots', 'bagwr', 'bagsize',
+            'skillmodvalue', 'skillmodmax', 'skillmodtype', 'icon', 'casttime', 'maxcharges', 'augtype',
+            'augrestrict', 'color', 'scrolleffect', 'classes', 'slots', 'itemtype', 'augslot1type',
+            'augslot2type', 'augslot3type', 'augslot4type', 'augslot5type', 'norent', 'tradeskills',
+            'focustype', 'dsmitigation']
+
+SCHEMA = {
+    'zone': ['id INTEGER PRIMARY KEY', 'zoneidnumber INTEGER', 'short_name TEXT', 'long_name TEXT',
+             'expansion INTEGER', 'zone_exp_multiplier REAL', 'safe_x REAL', 'safe_y REAL', 'canbind INTEGER',
+             'canlevitate INTEGER', 'castoutdoor INTEGER', 'version INTEGER DEFAULT 0'],
+    'zone_points': ['id INTEGER PRIMARY KEY', 'zone TEXT', 'number INTEGER', 'target_zone_id INTEGER'],
+    'items': ['id INTEGER PRIMARY KEY', 'Name TEXT', 'lore TEXT'] + [f'{c} INTEGER DEFAULT 0' for c in ITEM_INT],
+    'spawn2': ['id INTEGER PRIMARY KEY', 'spawngroupID INTEGER', 'zone TEXT', 'x REAL', 'y REAL', 'z REAL',
+               'respawntime INTEGER'],
+    'spawnentry': ['spawngroupID INTEGER', 'npcID INTEGER', 'chance INTEGER', 'PRIMARY KEY (spawngroupID, npcID)'],
+    'spawngroup': ['id INTEGER PRIMARY KEY', 'name TEXT'],
+    'npc_types': ['id INTEGER PRIMARY KEY', 'name TEXT', 'lastname TEXT', 'level INTEGER', 'hp INTEGER',
+                  'race INTEGER', 'class INTEGER', 'bodytype INTEGER', 'loottable_id INTEGER',
+                  'merchant_id INTEGER', 'npc_faction_id INTEGER', 'npc_spells_id INTEGER',
+                  'npcspecialattks TEXT', 'mindmg INTEGER', 'maxdmg INTEGER', 'AC INTEGER', 'MR INTEGER',
+                  'CR INTEGER', 'DR INTEGER', 'FR INTEGER', 'PR INTEGER'],
+    'npc_spells': ['id INTEGER PRIMARY KEY', 'name TEXT', 'attack_proc INTEGER', 'proc_chance INTEGER',
+                   'defensive_proc INTEGER', 'dproc_chance INTEGER', 'range_proc INTEGER', 'rproc_chance INTEGER'],
+    'npc_spells_entries': ['id INTEGER PRIMARY KEY', 'npc_spells_id INTEGER', 'spellid INTEGER'],
+    'merchantlist': ['merchantid INTEGER', 'slot INTEGER', 'item INTEGER', 'min_expansion INTEGER',
+                     'PRIMARY KEY (merchantid, slot)'],
+    'loottable': ['id INTEGER PRIMARY KEY', 'name TEXT'],
+    'loottable_entries': ['loottable_id INTEGER', 'lootdrop_id INTEGER', 'multiplier INTEGER',
+                          'droplimit INTEGER', 'mindrop INTEGER', 'probability REAL',
+                          'PRIMARY KEY (loottable_id, lootdrop_id)'],
+    'lootdrop': ['id INTEGER PRIMARY KEY', 'name TEXT'],
+    'lootdrop_entries': ['lootdrop_id INTEGER', 'item_id INTEGER', 'chance REAL',
+                         'PRIMARY KEY (lootdrop_id, item_id)'],
+    'spells_new': (['id INTEGER PRIMARY KEY', 'name TEXT', 'teleport_zone TEXT', 'cast_on_you TEXT',
+                    'cast_on_other TEXT', 'spell_fades TEXT', 'range INTEGER', 'aoerange INTEGER',
+                    'cast_time INTEGER', 'recast_time INTEGER', 'mana INTEGER', 'resisttype INTEGER',
+                    'ResistDiff INTEGER', 'skill INTEGER', 'targettype INTEGER', 'new_icon INTEGER',
+                    'buffduration INTEGER', 'buffdurationformula INTEGER', 'RecourseLink INTEGER DEFAULT 0',
+                    'goodEffect INTEGER', 'spellgroup INTEGER DEFAULT 0'] +
+                   _columns('effectid', 12, 'INTEGER DEFAULT 254') + _columns('effect_base_value', 12) +
+                   _columns('effect_limit_value', 12) + _columns('max', 12) + _columns('formula', 12, 'INTEGER DEFAULT 100') +
+                   _columns('classes', 16, 'INTEGER DEFAULT 255') + _columns('components', 4, 'INTEGER DEFAULT -1') +
+                   _columns('component_counts', 4)),
+    'forage': ['id INTEGER PRIMARY KEY', 'zoneid INTEGER', 'Itemid INTEGER', 'chance INTEGER'],
+    'ground_spawns': ['id INTEGER PRIMARY KEY', 'zoneid INTEGER', 'item INTEGER', 'min_x REAL', 'min_y REAL',
+                      'respawn_timer INTEGER'],
+    'tradeskill_recipe': ['id INTEGER PRIMARY KEY', 'name TEXT', 'tradeskill INTEGER', 'skillneeded INTEGER',
+                          'trivial INTEGER', 'nofail INTEGER', 'replace_container INTEGER', 'must_learn INTEGER',
+                          'enabled INTEGER', 'min_expansion INTEGER'],
+    'tradeskill_recipe_entries': ['id INTEGER PRIMARY KEY', 'recipe_id INTEGER', 'item_id INTEGER',
+                                  'successcount INTEGER', 'failcount INTEGER', 'componentcount INTEGER',
+                                  'iscontainer INTEGER'],
+    'npc_faction_entries': ['npc_faction_id INTEGER', 'faction_id INTEGER', 'value INTEGER',
+                            'PRIMARY KEY (npc_faction_id, faction_id)'],
+    'faction_list': ['id INTEGER PRIMARY KEY', 'name TEXT'],
+    'pets': ['id INTEGER PRIMARY KEY', 'type TEXT', 'petpower INTEGER', 'npcID INTEGER', 'temp INTEGER'],
+}
+
+
+def build(path, scale=1, seed=1):
+    """Writes a content database with roughly 5000 * scale base items to path, replacing any existing file."""
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.unlink(path)
+    conn = sqlite3.connect(path)
+    for table, columns in SCHEMA.items():
+        conn.execute(f'CREATE TABLE {table} ({", ".join(columns)})')
+    eras = {'Classic': 0, 'Kunark': 1, 'Velious': 2, 'Luclin': 3, 'Planes': 4}
+    zone_rows = []
+    pk = 1
+    for era, exp in eras.items():
+        for zid in utils.get_era_zones(era):
+            zone_rows.append((pk, zid, f'zone{zid}', f'Zone Number {zid}', exp, 1.0, 0, 0, 1, 1, 1))
+            pk += 1
+    conn.executemany('INSERT INTO zone (id, zoneidnumber, short_name, long_name, expansion, zone_exp_multiplier,'
+                     ' safe_x, safe_y, canbind, canlevitate, castoutdoor) VALUES (?,?,?,?,?,?,?,?,?,?,?)',
+                     zone_rows)
+    n_spells = 2000 * scale
+    spell_rows = []
+    for sid in range(1, n_spells + 1):
+        effects = [rng.choice([0, 1, 2, 4, 11, 15, 46, 69, 97, 124, 125, 127, 254, 254]) for _ in range(12)]
+        bases = [rng.randint(-200, 200) for _ in range(12)]
+        spell_rows.append([sid, f'Spell {sid}', f'pet{sid % 50}' if sid % 40 == 0 else '', '', '', '', 100, 0,
+                           3000, 6000, 50, rng.randint(0, 5), 0, 14, rng.choice([5, 6, 14]), sid % 200,
+                           rng.choice([0, 10, 100]), rng.choice([0, 3, 5]), 0, rng.randint(0, 1), 0] +
+                          effects + bases + [0] * 12 + [0] * 12 + [100] * 12 +
+                          [rng.choice([255, rng.randint(1, 65)]) for _ in range(16)] + [-1] * 4 + [0] * 4)
+    placeholders = ','.join('?' * len(spell_rows[0]))
+    conn.executemany(f'INSERT INTO spells_new VALUES ({placeholders})', spell_rows)
+    n_items = 5000 * scale
+    item_cols = ['id', 'Name', 'lore'] + ITEM_INT
+    item_rows = []
+    for iid in range(1001, 1001 + n_items):
+        row = {c: 0 for c in ITEM_INT}
+        for c in ['hp', 'mana', 'ac', 'astr', 'asta', 'aagi', 'adex', 'awis', 'aint', 'acha', 'cr', 'fr', 'mr',
+                  'dr', 'pr', 'attack', 'heroic_str', 'heroic_sta', 'heroic_mr']:
+            row[c] = rng.randint(0, 30)
+        row['damage'] = rng.randint(0, 40)
+        row['delay'] = rng.choice([0, 20, 30, 40])
+        row['classes'] = rng.choice([65535, 1, 2, 4 | 8, 8192, 4096 | 2048])
+        row['slots'] = rng.choice([1, 2, 4, 8192, 16384, 24576, 131072, 524288])
+        row['itemtype'] = rng.choice([0, 1, 2, 3, 4, 5, 7, 8, 10, 27, 35, 45])
+        row['norent'] = 1
+        row['focuseffect'] = rng.choice([0, 0, rng.randint(1, n_spells)])
+        row['clickeffect'] = rng.choice([0, 0, rng.randint(1, n_spells)])
+        row['proceffect'] = rng.choice([0, 0, rng.randint(1, n_spells)])
+        row['worneffect'] = rng.choice([0, 0, rng.randint(1, n_spells)])
+        row['clicklevel2'] = rng.randint(0, 65)
+        row['augtype'] = rng.choice([0, 0, 0, 7])
+        row['icon'] = 500 + iid % 300
+        row['maxcharges'] = rng.choice([-1, 0, 5])
+        item_rows.append([iid, f'Item {iid}', ''] + [row[c] for c in ITEM_INT])
+    item_ids = [r[0] for r in item_rows]
+    # Every base item also has Enchanted (+1000000) and Legendary (+2000000) versions with stronger stats
+    stat_columns = ITEM_INT.index('stunresist') + 1
+    for offset, prefix, factor in ((1000000, 'Enchanted', 1.25), (2000000, 'Legendary', 1.5)):
+        for base in item_rows[:len(item_ids)]:
+            stats = [int(value * factor) for value in base[3:3 + stat_columns]]
+            item_rows.append([base[0] + offset, f'{prefix} {base[1]}', ''] + stats + base[3 + stat_columns:])
+    conn.executemany(f'INSERT INTO items ({",".join(item_cols)}) VALUES ({",".join("?" * len(item_cols))})',
+                     item_rows)
+    npc_id_list = []
+    npc_rows = []
+    loot_id = 1
+    ltes, ldes, lds, lts = [], [], [], []
+    sg_rows, se_rows, s2_rows = [], [], []
+    merch_rows = []
+    for zrow in zone_rows:
+        zid, short = zrow[1], zrow[2]
+        for n in range(20 * scale):
+            npc_id = zid * 1000 + n
+            npc_id_list.append(npc_id)
+            npc_rows.append((npc_id, f'a_mob_{n}', '', rng.randint(1, 65), rng.randint(100, 50000), rng.randint(1, 300),
+                             rng.randint(1, 16), rng.randint(1, 30), loot_id, npc_id if n == 0 else 0,
+                             1 + n % 50, 1 + n % 100, 'ESR', 5, 50, 100, 10, 10, 10, 10, 10))
+            lts.append((loot_id, f'loot {loot_id}'))
+            lds.append((loot_id, f'drop {loot_id}'))
+            ltes.append((loot_id, loot_id, 1, 1, 0, 100))
+            for it in rng.sample(item_ids, 4):
+                ldes.append((loot_id, it, 10.0))
+            sg_rows.append((npc_id, f'sg_{npc_id}'))
+            se_rows.append((npc_id, npc_id, 100))
+            s2_rows.append((npc_id, npc_id, short, rng.random() * 1000, rng.random() * 1000, 0, 640))
+            if n == 0:
+                for slot, it in enumerate(rng.sample(item_ids, 10)):
+                    merch_rows.append((npc_id, slot, it, 0))
+            loot_id += 1
+    conn.executemany('INSERT INTO npc_types VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)', npc_rows)
+    conn.executemany('INSERT INTO loottable VALUES (?,?)', lts)
+    conn.executemany('INSERT INTO lootdrop VALUES (?,?)', lds)
+    conn.executemany('INSERT INTO loottable_entries VALUES (?,?,?,?,?,?)', ltes)
+    conn.executemany('INSERT OR IGNORE INTO lootdrop_entries VALUES (?,?,?)', ldes)
+    conn.executemany('INSERT INTO spawngroup VALUES (?,?)', sg_rows)
+    conn.executemany('INSERT INTO spawnentry VALUES (?,?,?)', se_rows)
+    conn.executemany('INSERT INTO spawn2 VALUES (?,?,?,?,?,?,?)', s2_rows)
+    conn.executemany('INSERT INTO merchantlist VALUES (?,?,?,?)', merch_rows)
+    conn.executemany('INSERT INTO npc_spells VALUES (?,?,?,?,?,?,?,?)',
+                     [(i, f'set {i}', rng.randint(1, n_spells), 5, rng.randint(1, n_spells), 5, 0, 0)
+                      for i in range(1, 101)])
+    conn.executemany('INSERT INTO npc_spells_entries (npc_spells_id, spellid) VALUES (?,?)',
+                     [(i, rng.randint(1, n_spells)) for i in range(1, 101) for _ in range(5)])
+    conn.executemany('INSERT INTO faction_list VALUES (?,?)', [(i, f'Faction {i}') for i in range(1, 201)])
+    conn.executemany('INSERT OR IGNORE INTO npc_faction_entries VALUES (?,?,?)',
+                     [(i, rng.randint(1, 200), rng.randint(-50, 50)) for i in range(1, 51) for _ in range(5)])
+    conn.executemany('INSERT INTO pets VALUES (?,?,?,?,?)',
+                     [(i, f'pet{i}', 0, npc_id_list[i], 0) for i in range(50)])
+    conn.executemany('INSERT INTO zone_points (zone, number, target_zone_id) VALUES (?,?,?)',
+                     [(z[2], 1, rng.choice(zone_rows)[1]) for z in zone_rows])
+    conn.executemany('INSERT INTO forage (zoneid, Itemid, chance) VALUES (?,?,?)',
+                     [(rng.choice(zone_rows)[1], rng.choice(item_ids), 10) for _ in range(200)])
+    conn.executemany('INSERT INTO ground_spawns (zoneid, item, min_x, min_y, respawn_timer) VALUES (?,?,?,?,?)',
+                     [(rng.choice(zone_rows)[1], rng.choice(item_ids), 0, 0, 300) for _ in range(200)])
+    conn.executemany('INSERT INTO tradeskill_recipe VALUES (?,?,?,?,?,?,?,?,?,?)',
+                     [(i, f'Recipe {i}', 60, 0, rng.randint(1, 300), 0, 0, 0, 1, 0) for i in range(1, 501)])
+    conn.executemany('INSERT INTO tradeskill_recipe_entries (recipe_id, item_id, successcount, failcount,'
+                     ' componentcount, iscontainer) VALUES (?,?,?,?,?,?)',
+                     [(i, rng.choice(item_ids), s, 0, c, 0) for i in range(1, 501)
+                      for s, c in ((1, 0), (0, 1), (0, 2))])
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='SQLite file to write')
+    parser.add_argument('--scale', type=int, default=1, help='Multiplies the number of items, spells and NPCs')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    build(args.path, args.scale, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Runs many parallel item identification submitters against a scratch local database
+
+Run from a configured EQDB checkout:
+
+    python benchmarks/identify_concurrency.py --threads 16 --submissions 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import Session
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..'))
+
+import local_models
+import spell  # Loads logic in the same order the app does
+import local
+
+User = namedtuple('User', ['id', 'name'])
+
+
+def build_database(path, users):
+    """Creates a scratch local database holding the anonymous contributor and the given users."""
+    engine = create_engine(f'sqlite:///{path}')
+    local_models.LocalBase.metadata.create_all(engine)
+    with Session(bind=engine) as session:
+        session.add(local.Contributor(name='Anonymous', id=-1, contributed=1))
+        for user in users:
+            session.add(local.Contributor(name=user.name, id=user.id, contributed=30))
+        session.commit()
+    engine.dispose()
+
+
+def submitter(user, submissions, item_ids, seed, errors):
+    rand = random.Random(seed)
+    for _ in range(submissions):
+        data = {'item_id': rand.choice(item_ids), 'expansion': 0, 'source': 'Drop', 'zone_id': 1}
+        try:
+            local.add_item_identification(data, user=user if rand.random() > 0.1 else None)
+        except Exception as error:
+            errors.append(repr(error))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--submissions', type=int, default=200, help='Submissions per thread')
+    parser.add_argument('--items', type=int, default=50, help='Distinct items being identified')
+    args = parser.parse_args()
+
+    users = [User(idx, f'user_{idx}') for idx in range(1, args.threads + 1)]
+    item_ids = list(range(1000, 1000 + args.items))
+    errors = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'identify.db')
+        build_database(path, users)
+        local.local_engine = local.create_local_engine(f'sqlite:///{path}')
+
+        threads = [threading.Thread(target=submitter, args=(user, args.submissions, item_ids, idx, errors))
+                   for idx, user in enumerate(users)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        with Session(bind=local.local_engine) as session:
+            identified = session.query(func.count(local.IdentifiedItems.iiid)).scalar()
+            pending = session.query(func.count(local.IDEntry.ideid)).scalar()
+            left_over = session.query(func.count(local.IDEntry.ideid)).\
+                filter(local.IDEntry.item_id == local.IdentifiedItems.item_id).scalar()
+        local.local_engine.dispose()
+
+    total = args.threads * args.submissions
+    print(f'{total} submissions from {args.threads} threads in {elapsed:.2f}s ({total / elapsed:.0f}/s)')
+    print(f'{identified} items identified, {pending} partial identifications pending')
+    if errors:
+        print(f'{len(errors)} submissions failed, first: {errors[0]}')
+    if left_over:
+        print(f'{left_over} partial identifications left behind for identified items')
+    if errors or left_over or identified > args.items:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Checks the in-memory item search returns what the SQL item search does, and times both
+
+Runs a grid of item search form filters and weights through item_search.get_items_with_filters and
+logic.get_items_with_filters against a synthetic content database (see content_db.py) and reports any search
+whose items, weights, sources or shown columns differ.  Each search is also asked for one page of PAGE items, which
+both engines have to return as that slice of the full results.  Run from a configured EQDB checkout:
+
+    python benchmarks/item_search_parity.py --scale 2
+"""
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..'))
+
+import content_db
+
+ALL_ERAS = ['Classic', 'Kunark', 'Velious', 'Luclin', 'Planes']
+
+FORMS = [{'g_class_1': 'Warrior'},
+         {'g_class_1': 'Cleric', 'g_class_2': 'Shaman', 'g_slot': 'Chest'},
+         {'g_slot': 'Primary', 'i_type': 'Any 1H Weapon'},
+         {'g_slot': 'Primary', 'i_type': 'Exclude 2H Weapon', 'delay': '30'},
+         {'i_type': 'Augment'},
+         {'pet_search': True},
+         {'item_name': 'item 1'},
+         {'skillmodtype': 'All'},
+         {'proc': True, 'proclevel2': '40'},
+         {'proc_type': 'Healing'},
+         {'proc_type': '2'},
+         {'click': True, 'clicklevel2': '30'},
+         {'focus_type': 'Beneficial', 'sub_type': 'Haste'},
+         {'focus_type': 'Melee', 'sub_type': 'Parry'},
+         {'focus_type': 'Detrimental', 'sub_type': 'Damage (Fire)'},
+         {'focus_type': 'Bard', 'sub_type': 'Wind'},
+         {'hp': 10.0, 'astr': 5.0},
+         {'banedmgbody': 14},
+         {'g_class_1': 'Magician', 'mana': 15.0, 'procrate': '0'}]
+
+WEIGHTS = [({}, True),
+           ({'hp': 1, 'ac': 2}, True),
+           ({'pr': 1.5, 'w_eff': 10, 'mana': -1}, True),
+           ({'bane_damage': 2, 'astr': 0.5}, False)]
+
+ERA_CHOICES = [ALL_ERAS, ['Classic'], ['Kunark', 'Planes']]
+
+# (limit, offset) of the page each search is also asked for
+PAGE = (10, 5)
+
+
+def summarize(result):
+    """Reduces a search's results to what must match, leaving out which dropping NPC was picked."""
+    items, show_focus, show_worn, show_inst, total = result
+    rows = [(entry.id, entry.weight, entry.w_eff, min(entry.npc_id, 0)) for entry in items]
+    return rows, show_focus, show_worn, show_inst, total
+
+
+def get_page(summary, limit, offset):
+    """Returns the page of summary a search with limit and offset should return."""
+    rows, show_focus, show_worn, show_inst, total = summary
+    return rows[offset:offset + limit], show_focus, show_worn, show_inst, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=1, help='Scale of the synthetic content database')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', help='Reuse this synthetic content database instead of building one')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = args.database
+        if not path:
+            path = os.path.join(tmp_dir, 'content.db')
+            content_db.build(path, args.scale, args.seed)
+        # Has to be set before logic is first imported, as that is when the engine is created
+        os.environ['EQDB_CONTENT_URL'] = f'sqlite:///{os.path.abspath(path)}'
+
+        import spell  # Loads logic in the same order the app does
+        import item_search
+        import logic
+
+        start = time.perf_counter()
+        item_search.warm()
+        print(f'Loaded the in-memory indexes in {time.perf_counter() - start:.2f}s')
+
+        mismatches = 0
+        searches = 0
+        sql_time = 0.0
+        memory_time = 0.0
+        for form, (weights, ignore_zero), eras in itertools.product(FORMS, WEIGHTS, ERA_CHOICES):
+            kwargs = dict(form, eras=eras)
+            start = time.perf_counter()
+            expected = summarize(logic.get_items_with_filters(weights, ignore_zero, **kwargs))
+            sql_time += time.perf_counter() - start
+            start = time.perf_counter()
+            actual = summarize(item_search.get_items_with_filters(weights, ignore_zero, **kwargs))
+            memory_time += time.perf_counter() - start
+            searches += 1
+            if actual != expected:
+                mismatches += 1
+                print(f'MISMATCH weights={weights} ignore_zero={ignore_zero} filters={kwargs}')
+
+            limit, offset = PAGE
+            page = get_page(expected, limit, offset)
+            for name, search in (('SQL', logic.get_items_with_filters),
+                                 ('in memory', item_search.get_items_with_filters)):
+                if summarize(search(weights, ignore_zero, limit=limit, offset=offset, **kwargs)) != page:
+                    mismatches += 1
+                    print(f'PAGE MISMATCH ({name}) weights={weights} ignore_zero={ignore_zero} filters={kwargs}')
+
+        print(f'{searches} searches, {mismatches} mismatches')
+        print(f'SQL {sql_time:.2f}s, in memory {memory_time:.2f}s')
+        logic.engine.dispose()
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
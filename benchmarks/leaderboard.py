@@ -0,0 +1,92 @@
+"""Benchmarks the identification leaderboard against a synthetic local database
+
+Run from a configured EQDB checkout:
+
+    python benchmarks/leaderboard.py --contributors 10000 --entries 1000000 --legacy
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..'))
+
+import local_models
+import spell  # Loads logic in the same order the app does
+import local
+
+
+def build_database(path, contributors, entries):
+    """Creates a local database with the given number of contributors and identification entries."""
+    engine = create_engine(f'sqlite:///{path}')
+    local_models.LocalBase.metadata.create_all(engine)
+    engine.dispose()
+
+    rand = random.Random(0)
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO contributor (name, id, contributed) VALUES (?, ?, ?)',
+                     ((f'contributor_{idx}', idx, rand.randint(1, 500)) for idx in range(contributors)))
+    conn.executemany('INSERT INTO id_entry (item_id, cid, expansion, source, zone_id) VALUES (?, ?, ?, ?, ?)',
+                     ((rand.randint(1000, 200000), rand.randrange(contributors), rand.randint(0, 10), 'Drop',
+                       rand.randint(1, 500)) for _ in range(entries)))
+    conn.commit()
+    conn.close()
+
+
+def legacy_leaderboard():
+    """The leaderboard as it was computed before, one id_entry load per contributor."""
+    with Session(bind=local.local_engine) as session:
+        query = session.query(local.Contributor)
+        result = query.all()
+
+    contributors = []
+    for entry in result:
+        entry = entry.__dict__
+        contributor = {'contributor': entry['name'], 'contributed': entry['contributed']}
+        with Session(bind=local.local_engine) as session:
+            query = session.query(local.IDEntry).filter(local.IDEntry.cid == entry['id'])
+            result = query.all()
+        contributor.update({'identifications': len(result)})
+        contributors.append(contributor)
+    return contributors
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--contributors', type=int, default=10000)
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--legacy', action='store_true', help='Also time the old per-contributor queries')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'leaderboard.db')
+        build_time, _ = timed(lambda: build_database(path, args.contributors, args.entries))
+        print(f'Built {args.contributors} contributors and {args.entries} entries in {build_time:.2f}s')
+
+        local.local_engine = create_engine(f'sqlite:///{path}')
+        elapsed, result = timed(local.get_leaderboard)
+        print(f'get_leaderboard: {elapsed:.3f}s')
+        if args.legacy:
+            legacy_elapsed, legacy_result = timed(legacy_leaderboard)
+            print(f'legacy leaderboard: {legacy_elapsed:.3f}s')
+            if legacy_result != result:
+                print('MISMATCH between legacy and current leaderboard')
+                sys.exit(1)
+        local.local_engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
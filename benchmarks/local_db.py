@@ -0,0 +1,111 @@
+"""Measures the local database workload before and after the schema migrations and connection tuning
+
+Run from a configured EQDB checkout:
+
+    python benchmarks/local_db.py --users 5000 --entries 500000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+from sqlalchemy import create_engine
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..'))
+
+import migrate_local_db
+import spell  # Loads logic in the same order the app does
+import local
+
+User = namedtuple('User', ['id', 'name'])
+STATS = ['hp', 'mana', 'ac', 'astr', 'asta', 'aagi', 'adex', 'awis', 'aint']
+
+
+def build_database(path, users, entries):
+    """Creates a database at the first schema version, then fills it with synthetic users and identifications."""
+    engine = create_engine(f'sqlite:///{path}')
+    migrate_local_db.upgrade(engine, target=1)
+    engine.dispose()
+
+    rand = random.Random(0)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.executemany('INSERT INTO contributor (name, id, contributed) VALUES (?, ?, ?)',
+                     ((f'user_{idx}', idx, rand.randint(1, 50)) for idx in range(1, users + 1)))
+    for table, set_table, set_id in [('weights', 'weight_entry', 'wid'), ('restricts', 'restrict_entry', 'rid')]:
+        conn.executemany(f'INSERT INTO {table} (uid, name) VALUES (?, ?)',
+                         ((uid, f'set_{idx}') for uid in range(1, users + 1) for idx in range(3)))
+        conn.executemany(f'INSERT INTO {set_table} ({set_id}, stat, value) VALUES (?, ?, ?)',
+                         ((row_id, stat, rand.randint(1, 10)) for row_id in range(1, users * 3 + 1)
+                          for stat in STATS))
+    conn.executemany('INSERT INTO id_entry (item_id, cid, expansion, source, zone_id) VALUES (?, ?, ?, ?, ?)',
+                     ((rand.randint(1000, 200000), rand.randint(1, users), rand.randint(0, 10), 'Drop',
+                       rand.randint(1, 500)) for _ in range(entries)))
+    conn.commit()
+    conn.close()
+
+
+def run_workload(users, lookups, submissions):
+    """Times the local database calls the site makes, returning {name: seconds}."""
+    rand = random.Random(1)
+    sample = [User(rand.randint(1, users), 'bench') for _ in range(lookups)]
+    timings = {}
+
+    start = time.perf_counter()
+    for user in sample:
+        local.get_weights_sets(user)
+        local.get_restrict_sets(user)
+    timings['weight and restrict sets'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for user in sample:
+        local.get_user_data(user)
+    timings['user data'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    local.get_leaderboard()
+    timings['leaderboard'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for user in sample[:submissions]:
+        data = {'item_id': rand.randint(300000, 400000), 'expansion': 0, 'source': 'Drop', 'zone_id': 1}
+        local.add_item_identification(data, user=user)
+    timings['identification submissions'] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--entries', type=int, default=500000)
+    parser.add_argument('--lookups', type=int, default=200, help='Users whose sets are looked up')
+    parser.add_argument('--submissions', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'local.db')
+        build_database(path, args.users, args.entries)
+
+        # Before: no lookup indexes and default connection settings
+        local.local_engine = create_engine(f'sqlite:///{path}')
+        before = run_workload(args.users, args.lookups, args.submissions)
+        local.local_engine.dispose()
+
+        # After: every migration applied and the site's tuned connections
+        migrate_local_db.upgrade(create_engine(f'sqlite:///{path}'))
+        local.local_engine = local.create_local_engine(f'sqlite:///{path}')
+        after = run_workload(args.users, args.lookups, args.submissions)
+        local.local_engine.dispose()
+
+    print(f'{"scenario":<30}{"before":>10}{"after":>10}{"speedup":>10}')
+    for name in before:
+        print(f'{name:<30}{before[name]:>9.3f}s{after[name]:>9.3f}s{before[name] / after[name]:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
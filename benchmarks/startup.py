@@ -0,0 +1,52 @@
+"""Times content schema reflection with and without the reflection cache
+
+Run from a configured EQDB checkout:
+
+    python benchmarks/startup.py --repeat 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..'))
+
+import spell  # Loads logic in the same order the app does
+import logic
+from database import reflect_metadata, schema_fingerprint
+
+
+def timed(func, repeat):
+    """Returns the best time out of repeat runs of func."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    engine = logic.engine
+    used = logic.CONTENT_TABLES
+    with tempfile.TemporaryDirectory() as cache_dir:
+        scenarios = [('reflect every table', lambda: reflect_metadata(engine, only=None)),
+                     ('reflect used tables', lambda: reflect_metadata(engine, only=used)),
+                     ('schema fingerprint', lambda: schema_fingerprint(engine, only=used))]
+        # Prime the cache so the last scenario measures a warm start
+        reflect_metadata(engine, cache_dir, only=used)
+        scenarios.append(('cached used tables', lambda: reflect_metadata(engine, cache_dir, only=used)))
+
+        for name, func in scenarios:
+            print(f'{name:<24}{timed(func, args.repeat) * 1000:>10.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
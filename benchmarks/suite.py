@@ -0,0 +1,150 @@
+"""Times the main content lookups against a synthetic content database and prints the results as JSON
+
+Builds benchmarks/content_db.py's database at the requested scale (or reuses --database), points the site at it and
+times each scenario once with empty caches and then --repeat more times warm.  Run from a configured EQDB checkout
+and keep the output to compare against other commits:
+
+    python benchmarks/suite.py --scale 4 --repeat 5 --output before.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..'))
+
+import content_db
+import utils
+
+ERAS = ['Classic', 'Kunark', 'Velious', 'Luclin', 'Planes']
+
+
+def get_scenarios():
+    """Returns (name, function) pairs for every scenario, importing the site against EQDB_CONTENT_URL."""
+    import spell  # Loads logic in the same order the app does
+    import eqdb
+    import item
+    import logic
+    import npc
+    import zone
+
+    zone_id = utils.get_era_zones('Classic')[0]
+    # The first NPC of every zone is a merchant, see content_db.build
+    npc_id = zone_id * 1000
+    client = eqdb.app.test_client()
+
+    def api(url):
+        def run():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} returned {response.status_code}')
+            return response.get_json()
+        return run
+
+    return [('get_items_with_filters', lambda: logic.get_items_with_filters(
+                {'hp': 1, 'ac': 2, 'astr': 0.5}, True, eras=ERAS, g_class_1='Warrior', i_type='Any')),
+            ('get_items_with_filters_stat_filters', lambda: logic.get_items_with_filters(
+                {'hp': 1, 'mana': 1, 'pr': 2, 'w_eff': 5}, True, eras=ERAS, i_type='Any', hp=20.0, astr=10.0)),
+            ('get_items_with_filters_page', lambda: logic.get_items_with_filters(
+                {'hp': 1, 'ac': 2, 'astr': 0.5}, True, limit=100, eras=ERAS, g_class_1='Warrior', i_type='Any')),
+            ('get_items_with_filters_focus', lambda: logic.get_items_with_filters(
+                {'hp': 1}, True, eras=ERAS, i_type='Any', focus_type='Beneficial', sub_type='Haste')),
+            ('get_items_with_filters_one_era', lambda: logic.get_items_with_filters(
+                {'hp': 1}, True, eras=['Classic'], i_type='Any')),
+            ('get_click_items_stats', lambda: item.get_click_items('Statistics', 'Stats', eras=ERAS, min_level=65)),
+            ('get_item_data_full', lambda: logic.get_item_data(1001, full=True)),
+            ('get_item_data_full_legendary', lambda: logic.get_item_data(2001001, full=True)),
+            ('get_npc_detail', lambda: npc.get_npc_detail(npc_id)),
+            ('get_zone_detail', lambda: zone.get_zone_detail(zone_id)),
+            ('get_spells_by_class', lambda: spell.get_spells_by_class(2)),
+            ('api_items', api('/api/v1/items?name=Item 10')),
+            ('api_npcs', api(f'/api/v1/npcs?id={npc_id}')),
+            ('api_spells', api('/api/v1/spells?name=Spell 12')),
+            ('api_trades', api('/api/v1/trades?name=Recipe 1')),
+            ('api_loot', api(f'/api/v1/loot?npc_id={npc_id}'))]
+
+
+def run_scenario(func, repeat):
+    """Times func once with empty caches, then repeat times warm."""
+    import cache
+
+    cache.clear()
+    start = time.perf_counter()
+    func()
+    cold = time.perf_counter() - start
+
+    warm = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        warm.append(time.perf_counter() - start)
+    return {'cold': cold,
+            'best': min(warm),
+            'median': statistics.median(warm),
+            'mean': statistics.mean(warm),
+            'repeat': repeat}
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.join(here, '..'),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=1, help='Scale of the synthetic content database')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', help='Reuse this synthetic content database instead of building one')
+    parser.add_argument('--repeat', type=int, default=5, help='Warm runs per scenario')
+    parser.add_argument('--only', nargs='*', help='Only run the named scenarios')
+    parser.add_argument('--output', help='Write the JSON results here as well as to stdout')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = args.database
+        build_time = None
+        if not path:
+            path = os.path.join(tmp_dir, 'content.db')
+            start = time.perf_counter()
+            content_db.build(path, args.scale, args.seed)
+            build_time = time.perf_counter() - start
+        # Has to be set before logic is first imported, as that is when the engine is created
+        os.environ['EQDB_CONTENT_URL'] = f'sqlite:///{os.path.abspath(path)}'
+
+        scenarios = get_scenarios()
+        results = {}
+        for name, func in scenarios:
+            if args.only and name not in args.only:
+                continue
+            results[name] = run_scenario(func, args.repeat)
+            print(f'{name:<40}cold {results[name]["cold"] * 1000:>9.1f}ms   '
+                  f'best {results[name]["best"] * 1000:>9.1f}ms', file=sys.stderr)
+
+        import logic
+        logic.engine.dispose()
+
+    report = {'commit': get_commit(),
+              'python': platform.python_version(),
+              'scale': None if args.database else args.scale,
+              'seed': None if args.database else args.seed,
+              'database': args.database,
+              'build_time': build_time,
+              'results': results}
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
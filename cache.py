@@ -0,0 +1,186 @@
+"""EQDB Logic File for caching static content data"""
+import configparser
+import os
+import threading
+import time
+from collections import OrderedDict
+
+here = os.path.dirname(__file__)
+ini_path = os.path.join(here, 'configuration.ini')
+
+# How often (in seconds) the configuration file is re-read to see if the content version has been bumped.
+_check_interval = 60
+_content_version = None
+_last_check = 0.0
+_lock = threading.RLock()
+_store = {}
+# Bumped per name by clear, so a value built from data read before then is never stored
+_generations = {}
+# One lock per name held while its value is built, so a slow build only holds up lookups of that name
+_build_locks = {}
+# Hits and misses per cached name, as [hits, misses]
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _count(name, hit):
+    """Counts one lookup of name."""
+    with _stats_lock:
+        counts = _stats.setdefault(name, [0, 0])
+        counts[0 if hit else 1] += 1
+
+
+def _read_content_version():
+    """Reads the content version from the configuration file."""
+    global _check_interval
+    site_config = configparser.RawConfigParser()
+    with open(ini_path) as fh:
+        site_config.read_file(fh)
+    _check_interval = site_config.getint('cache', 'version_check_interval', fallback=60)
+    # Fall back on the site version so existing configurations keep working
+    return site_config.get('cache', 'content_version', fallback=site_config.get('DEFAULT', 'site_version'))
+
+
+def get_content_version():
+    """Returns the current content version, re-reading the configuration at most every check interval."""
+    global _content_version, _last_check
+    now = time.monotonic()
+    if _content_version is None or now - _last_check >= _check_interval:
+        with _lock:
+            if _content_version is None or now - _last_check >= _check_interval:
+                _content_version = _read_content_version()
+                _last_check = now
+    return _content_version
+
+
+def _build_lock(name):
+    """Returns the lock held while the value for name is built."""
+    with _lock:
+        return _build_locks.setdefault(name, threading.Lock())
+
+
+def _publish(name, generation, entry):
+    """Stores entry for name unless name was cleared since generation was read."""
+    with _lock:
+        if _generations.get(name, 0) == generation:
+            _store[name] = entry
+
+
+def get_versioned(name, builder):
+    """Returns the cached value for name, calling builder to (re)build it when the content version changes."""
+    version = get_content_version()
+    entry = _store.get(name)
+    if entry is not None and entry[0] == version:
+        _count(name, True)
+        return entry[1]
+    with _build_lock(name):
+        # Another thread may have built this while we waited on the lock
+        entry = _store.get(name)
+        if entry is not None and entry[0] == version:
+            _count(name, True)
+            return entry[1]
+        generation = _generations.get(name, 0)
+        value = builder()
+        _publish(name, generation, (version, value))
+        _count(name, False)
+    return value
+
+
+def get_timed(name, builder, ttl):
+    """Returns the cached value for name, calling builder to rebuild it once it is older than ttl seconds."""
+    now = time.monotonic()
+    entry = _store.get(name)
+    if entry is not None and now - entry[0] < ttl:
+        _count(name, True)
+        return entry[1]
+    with _build_lock(name):
+        entry = _store.get(name)
+        if entry is not None and now - entry[0] < ttl:
+            _count(name, True)
+            return entry[1]
+        generation = _generations.get(name, 0)
+        value = builder()
+        _publish(name, generation, (time.monotonic(), value))
+        _count(name, False)
+    return value
+
+
+def _get_items(name):
+    """Returns the keyed store for name, starting a fresh one when the content version changes.  Call with _lock."""
+    version = get_content_version()
+    entry = _store.get(name)
+    if entry is None or entry[0] != version:
+        entry = (version, OrderedDict())
+        _store[name] = entry
+    return entry[1]
+
+
+def _put_items(name, generation, items, values, maxsize):
+    """Stores values into items, dropping the least recently used keys past maxsize.  Stores nothing if name was
+    cleared since generation was read, as the values may have been built from data since changed.
+    """
+    with _lock:
+        if _generations.get(name, 0) != generation:
+            return
+        for key, value in values.items():
+            items[key] = value
+            items.move_to_end(key)
+        while len(items) > maxsize:
+            items.popitem(last=False)
+
+
+def get_versioned_item(name, key, builder, maxsize=1024):
+    """Returns the cached value of key within name, keeping at most maxsize recently used keys per content version."""
+    with _lock:
+        items = _get_items(name)
+        generation = _generations.get(name, 0)
+        _count(name, key in items)
+        if key in items:
+            items.move_to_end(key)
+            return items[key]
+    # Build outside of the lock so one slow key doesn't block every other lookup
+    value = builder()
+    _put_items(name, generation, items, {key: value}, maxsize)
+    return value
+
+
+def get_versioned_items(name, keys, builder, maxsize=1024):
+    """Returns {key: value} for every key given, calling builder once with the list of keys that aren't cached.
+
+    builder must return a dict holding a value for every key it was given.
+    """
+    found = {}
+    missing = []
+    with _lock:
+        items = _get_items(name)
+        generation = _generations.get(name, 0)
+        for key in dict.fromkeys(keys):
+            _count(name, key in items)
+            if key in items:
+                items.move_to_end(key)
+                found[key] = items[key]
+            else:
+                missing.append(key)
+    if missing:
+        built = builder(missing)
+        _put_items(name, generation, items, built, maxsize)
+        found.update(built)
+    return found
+
+
+def get_stats():
+    """Returns {name: {'hits': hits, 'misses': misses}} for every cached name looked up so far."""
+    with _stats_lock:
+        return {name: {'hits': counts[0], 'misses': counts[1]} for name, counts in _stats.items()}
+
+
+def clear(name=None):
+    """Drops one (or every) cached value so that it is rebuilt on next access."""
+    with _lock:
+        if name is None:
+            for cached_name in _store:
+                _generations[cached_name] = _generations.get(cached_name, 0) + 1
+            _store.clear()
+        else:
+            _generations[name] = _generations.get(name, 0) + 1
+            _store.pop(name, None)
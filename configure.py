@@ -1,6 +1,7 @@
 import os
 import sys
 import configparser
+import secrets
 
 here = os.path.dirname(__file__)
 if os.path.exists(os.path.join(here, 'configuration.ini')):
@@ -16,20 +17,52 @@ site_config['DEFAULT'] = {'site_fqdn': 'localhost',
 
 site_config['thj'] = {'expansion': 5}
 
+site_config['flask'] = {'secret_key': secrets.token_hex(32)}
+
 site_config['database'] = {'driver': '',
                            'user': '',
                            'password': '',
                            'database': '',
                            'host': '',
-                           'port': ''}
+                           'port': '',
+                           'pool_size': 5,
+                           'max_overflow': 10,
+                           'pool_timeout': 30,
+                           'pool_recycle': 3600,
+                           'pool_pre_ping': True,
+                           'statement_timeout': 0,
+                           'reflect_tables': 'used',
+                           'reflection_cache': os.path.join(here, 'reflection_cache')}
+
+site_config['cache'] = {'content_version': '1',
+                        'version_check_interval': 60}
+
+site_config['local_database'] = {'connection': 'sqlite:///local_db.db',
+                                 'busy_timeout': 5000,
+                                 'mmap_size': 268435456,
+                                 'cache_size': -20000}
+
+site_config['instrumentation'] = {'query_budget': 25}
+
+site_config['metrics'] = {'enabled': False}
+
+site_config['item_search'] = {'engine': 'memory', 'page_size': 100}
 
-site_config['local_database'] = {'connection': 'sqlite:///local_db.db'}
+site_config['profiler'] = {'enabled': False,
+                           'threshold_ms': 1000,
+                           'sample_rate': 0.0,
+                           'interval_ms': 5,
+                           'output_dir': os.path.join(here, 'profiles')}
 
 site_config['path'] = {'app_log': 'c:\\site\\eqdb\\eqdb.log',
                        'flask_log': 'c:\\site\\eqdb\\flask.log'}
 
 site_config['discord'] = {'client_id': '',
-                          'client_secret': ''}
+                          'client_secret': '',
+                          'identity_provider': 'discord',
+                          'identity_ttl': 3600,
+                          'stub_user_id': 1,
+                          'stub_user_name': 'Developer'}
 
 with open(os.path.join(here, 'configuration.ini')) as fh:
     site_config.write(fh)
@@ -0,0 +1,196 @@
+"""EQDB Logic File for the content database engine and its connection pool"""
+import glob
+import hashlib
+import os
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+
+import sqlalchemy
+from flask import g, has_app_context
+from sqlalchemy import MetaData, create_engine, event, exc, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    """Running totals of how often, and how long, connections were waited on."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited, timed_out=False):
+        with self.lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if timed_out:
+                self.timeouts += 1
+
+
+def _metered_pool_class(stats):
+    """Returns a QueuePool that records checkout waits into stats, and keeps doing so if the pool is recreated."""
+    class MeteredQueuePool(QueuePool):
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                connection = super().connect()
+            except exc.TimeoutError:
+                stats.record(time.perf_counter() - start, timed_out=True)
+                raise
+            stats.record(time.perf_counter() - start)
+            return connection
+
+    return MeteredQueuePool
+
+
+def create_content_engine(url, site_config):
+    """Creates the content database engine using the [database] pool settings."""
+    stats = PoolStats()
+    engine = create_engine(url,
+                           poolclass=_metered_pool_class(stats),
+                           pool_size=site_config.getint('database', 'pool_size', fallback=5),
+                           max_overflow=site_config.getint('database', 'max_overflow', fallback=10),
+                           pool_timeout=site_config.getfloat('database', 'pool_timeout', fallback=30),
+                           pool_recycle=site_config.getint('database', 'pool_recycle', fallback=3600),
+                           pool_pre_ping=site_config.getboolean('database', 'pool_pre_ping', fallback=True))
+    engine.pool_stats = stats
+
+    # Milliseconds a single statement may run before the server cancels it, 0 leaves it unlimited
+    statement_timeout = site_config.getint('database', 'statement_timeout', fallback=0)
+    if statement_timeout and engine.dialect.name == 'mysql':
+        @event.listens_for(engine, 'connect')
+        def _set_statement_timeout(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('SELECT VERSION()')
+            if 'MariaDB' in cursor.fetchone()[0]:
+                cursor.execute(f'SET SESSION max_statement_time = {statement_timeout / 1000}')
+            else:
+                cursor.execute(f'SET SESSION max_execution_time = {statement_timeout}')
+            cursor.close()
+
+    return engine
+
+
+def get_pool_stats(engine):
+    """Returns a snapshot of the engine's connection pool."""
+    pool = engine.pool
+    stats = engine.pool_stats
+    with stats.lock:
+        return {'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow(),
+                'checkouts': stats.checkouts,
+                'timeouts': stats.timeouts,
+                'wait_total': stats.wait_total,
+                'wait_max': stats.wait_max,
+                'wait_avg': stats.wait_total / stats.checkouts if stats.checkouts else 0.0}
+
+
+def schema_fingerprint(engine, only=None):
+    """Returns a short hash of the database's table and column definitions."""
+    with engine.connect() as conn:
+        if engine.dialect.name == 'sqlite':
+            query = text("SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'index') ORDER BY name")
+        else:
+            query = text('SELECT table_name, column_name, column_type, is_nullable, column_key, column_default '
+                         'FROM information_schema.columns WHERE table_schema = DATABASE() '
+                         'ORDER BY table_name, ordinal_position')
+        result = conn.execute(query).all()
+
+    digest = hashlib.sha1()
+    # Pickled metadata is only good for the SQLAlchemy version that wrote it
+    digest.update(sqlalchemy.__version__.encode())
+    digest.update(repr(sorted(only) if only else 'all').encode())
+    for entry in result:
+        digest.update(repr(tuple(entry)).encode())
+    return digest.hexdigest()[:16]
+
+
+def reflect_metadata(engine, cache_dir=None, only=None):
+    """Reflects the engine's tables (or just those in only), reusing a pickled copy while the schema is unchanged."""
+    if not cache_dir:
+        metadata = MetaData()
+        metadata.reflect(bind=engine, only=only)
+        return metadata
+
+    name = os.path.splitext(os.path.basename(engine.url.database or 'memory'))[0]
+    path = os.path.join(cache_dir, f'{name}-{schema_fingerprint(engine, only)}.pickle')
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as fh:
+                return pickle.load(fh)
+        except (OSError, EOFError, AttributeError, pickle.UnpicklingError):
+            # Unreadable, so reflect it again below
+            pass
+
+    metadata = MetaData()
+    metadata.reflect(bind=engine, only=only)
+
+    # Swap the new copy in, dropping the ones written for older schemas
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as fh:
+        pickle.dump(metadata, fh)
+    os.replace(tmp_path, path)
+    for old_path in glob.glob(os.path.join(cache_dir, f'{name}-*.pickle')):
+        if old_path != path:
+            os.remove(old_path)
+    return metadata
+
+
+@contextmanager
+def get_session(bind):
+    """Yields the current request's session for bind, so a request checks out one connection however many blocks
+    it opens.  Outside of a request this is just a short lived Session(bind=bind).
+    """
+    if not has_app_context():
+        with Session(bind=bind) as session:
+            yield session
+        return
+
+    sessions = g.setdefault('db_sessions', {})
+    if bind not in sessions:
+        sessions[bind] = [Session(bind=bind), 0]
+    entry = sessions[bind]
+    entry[1] += 1
+    try:
+        yield entry[0]
+    except Exception:
+        # Leave the session usable for the rest of the request
+        entry[0].rollback()
+        raise
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            # Detach what was loaded as closing the session used to, but hold on to the connection
+            entry[0].expunge_all()
+
+
+def get_request_checkouts():
+    """Returns how many connections the current request has checked out of the pool."""
+    return g.get('db_checkouts', 0)
+
+
+def init_app(app, engine):
+    """Ties request scoped sessions to the app context and counts each request's connection checkouts."""
+    @event.listens_for(engine, 'checkout')
+    def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+        if has_app_context():
+            g.db_checkouts = g.get('db_checkouts', 0) + 1
+
+    @app.after_request
+    def _add_checkout_header(response):
+        response.headers['X-DB-Checkouts'] = str(get_request_checkouts())
+        return response
+
+    @app.teardown_appcontext
+    def _close_sessions(error):
+        for session, _ in g.pop('db_sessions', {}).values():
+            session.close()
@@ -0,0 +1,63 @@
+"""EQDB Logic File for the spell effect index used by click item searches"""
+from collections import namedtuple
+
+from sqlalchemy import func
+
+import cache
+from database import get_session
+
+# The effect id of an unused spell slot, left out of the index
+BLANK_EFFECT = 254
+
+# One spell slot holding an effect
+EffectSlot = namedtuple('EffectSlot', ['spell_id', 'slot', 'base_value', 'limit_value', 'duration', 'target_type'])
+
+
+def _build_effect_index(engine, SpellsNew):
+    columns = [SpellsNew.id, func.coalesce(SpellsNew.buffduration, 0), func.coalesce(SpellsNew.targettype, 0)]
+    for idx in range(1, 13):
+        columns += [getattr(SpellsNew, f'effectid{idx}'),
+                    func.coalesce(getattr(SpellsNew, f'effect_base_value{idx}'), 0),
+                    func.coalesce(getattr(SpellsNew, f'effect_limit_value{idx}'), 0)]
+    with get_session(engine) as session:
+        result = session.query(*columns).order_by(SpellsNew.id).all()
+
+    index = {}
+    for entry in result:
+        spell_id, duration, target_type = entry[:3]
+        for idx in range(12):
+            effect_id, base_value, limit_value = entry[3 + idx * 3:6 + idx * 3]
+            if effect_id is None or effect_id == BLANK_EFFECT:
+                continue
+            index.setdefault(effect_id, []).append(EffectSlot(spell_id, idx + 1, base_value, limit_value, duration,
+                                                              target_type))
+    return index
+
+
+def get_effect_index(engine, SpellsNew):
+    """Returns {effect id: [EffectSlot, ...]} for every slot of every spell, spells in id order."""
+    return cache.get_versioned('effect_index', lambda: _build_effect_index(engine, SpellsNew))
+
+
+def get_spell_ids(engine, SpellsNew, effects):
+    """Returns the ids of the spells with a slot matching any of effects, each (effect id, compare, value) where
+    compare(base value, value) has to hold, or compare is None to match any base value.
+    """
+    index = get_effect_index(engine, SpellsNew)
+    spell_ids = set()
+    for effect_id, compare, value in effects:
+        for entry in index.get(effect_id, ()):
+            if compare is None or compare(entry.base_value, value):
+                spell_ids.add(entry.spell_id)
+    return spell_ids
+
+
+def _load_click_spell_ids(engine, Item):
+    with get_session(engine) as session:
+        result = session.query(Item.clickeffect).filter(Item.clickeffect > 0).distinct().all()
+    return frozenset(entry[0] for entry in result)
+
+
+def get_click_spell_ids(engine, Item):
+    """Returns the ids of every spell an item clicks."""
+    return cache.get_versioned('click_spell_ids', lambda: _load_click_spell_ids(engine, Item))
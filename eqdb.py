@@ -1,15 +1,22 @@
 import configparser
-import json
 import logging
 import os
+import threading
 
 from flask import Flask, render_template, request, flash, redirect, url_for
-from flask_discord import DiscordOAuth2Session, requires_authorization, Unauthorized
-
+from flask_discord import DiscordOAuth2Session, Unauthorized
+
+import cache
+import database
+import identity
+import instrumentation
+import metrics
+import profiler
 import spell
 import utils
 import local
 import logic
+import item_search as memory_search
 from routes import apis, pets, spells, zones, tradeskills, npcs, items, factions
 
 # Application Setup
@@ -24,7 +31,11 @@ SITE_VERSION = site_config.get('DEFAULT', 'site_version')
 app = Flask(__name__)
 fh = logging.FileHandler(site_config.get('path', 'flask_log'))
 app.logger.addHandler(fh)
-app.secret_key = 'this_is_a_secret'
+# Signs the session cookie, which remembers who the user is, so it has to be private to this install
+SECRET_KEY = site_config.get('flask', 'secret_key', fallback='')
+if not SECRET_KEY or SECRET_KEY == 'this_is_a_secret':
+    raise ValueError('Set [flask] secret_key in configuration.ini to a long random value')
+app.secret_key = SECRET_KEY
 app.config['SITE_TYPE'] = SITE_TYPE
 app.config['SITE_VERSION'] = SITE_VERSION
 app.config['DISCORD_CLIENT_ID'] = site_config.get('discord', 'client_id')
@@ -38,6 +49,7 @@ app.config['DISCORD_BOT_TOKEN'] = ""
 
 
 discord = DiscordOAuth2Session(app)
+database.init_app(app, logic.engine)
 
 app_path = site_config.get('path', 'app_log')
 formatter = logging.Formatter(
@@ -49,7 +61,27 @@ afh = logging.FileHandler(app_path)
 afh.setFormatter(formatter)
 app_log.addHandler(afh)
 app_log.setLevel(logging.DEBUG)
+# Requests running more SQL statements than this are logged as warnings
+QUERY_BUDGET = site_config.getint('instrumentation', 'query_budget', fallback=25)
+instrumentation.init_app(app, [logic.engine, local.local_engine], app_log, QUERY_BUDGET)
+# /metrics has no authentication, so it is off unless enabled for a deployment that firewalls it
+if site_config.getboolean('metrics', 'enabled', fallback=False):
+    metrics.init_app(app, logic.engine)
+if site_config.getboolean('profiler', 'enabled', fallback=False):
+    profiler.init_app(app, site_config.get('profiler', 'output_dir', fallback=os.path.join(here, 'profiles')),
+                      threshold=site_config.getint('profiler', 'threshold_ms', fallback=1000) / 1000,
+                      sample_rate=site_config.getfloat('profiler', 'sample_rate', fallback=0.0),
+                      interval=site_config.getint('profiler', 'interval_ms', fallback=5) / 1000,
+                      log=app_log)
 ALLOWED_EXTENSIONS = {'txt'}
+# Seconds the identification leaderboard data is shared before it is rebuilt
+LEADERBOARD_TTL = 60
+# 'memory' answers item searches from item_search.py's in-memory indexes, 'sql' queries the content database each time
+ITEM_SEARCH_ENGINE = site_config.get('item_search', 'engine', fallback='sql')
+if ITEM_SEARCH_ENGINE == 'memory':
+    threading.Thread(target=memory_search.warm, name='eqdb-item-search-warm', daemon=True).start()
+# Item search results shown per page, 0 shows them all on one page
+ITEM_SEARCH_PAGE_SIZE = site_config.getint('item_search', 'page_size', fallback=100)
 
 """ BLUEPRINTS """
 app.register_blueprint(apis.api_pages)
@@ -81,9 +113,9 @@ def login():
 
 
 @app.route("/user/restrict/delete/<int:rid>")
-@requires_authorization
+@identity.requires_login
 def delete_restrict_set(rid):
-    user = discord.fetch_user()
+    user = identity.get_user()
     success = local.delete_restrict_set(user, rid)
     if not success:
         flash('You are not allowed to view, modify, or delete this set.')
@@ -93,9 +125,9 @@ def delete_restrict_set(rid):
 
 
 @app.route("/user/restrict/<int:rid>")
-@requires_authorization
+@identity.requires_login
 def get_restrict_set(rid):
-    user = discord.fetch_user()
+    user = identity.get_user()
     data = local.get_restrict_set(rid, user)
     if not data:
         flash('You are not allowed to view or modify this set.')
@@ -104,9 +136,9 @@ def get_restrict_set(rid):
 
 
 @app.route("/user/restrict/update/<int:rid>", methods=['POST'])
-@requires_authorization
+@identity.requires_login
 def update_restrict_set(rid):
-    user = discord.fetch_user()
+    user = identity.get_user()
 
     filters = {}
     for i in range(1, 100):
@@ -132,9 +164,9 @@ def update_restrict_set(rid):
 
 
 @app.route("/user/restrict/create", methods=['GET', 'POST'])
-@requires_authorization
+@identity.requires_login
 def create_restrict_set():
-    user = discord.fetch_user()
+    user = identity.get_user()
     if request.method == 'GET':
         return render_template("create_restrict.html")
     else:
@@ -164,9 +196,9 @@ def create_restrict_set():
 
 
 @app.route("/user/weights/delete/<int:wid>")
-@requires_authorization
+@identity.requires_login
 def delete_weights_set(wid):
-    user = discord.fetch_user()
+    user = identity.get_user()
     success = local.delete_weights_set(user, wid)
     if not success:
         flash('You are not allowed to view, modify, or delete this set.')
@@ -176,9 +208,9 @@ def delete_weights_set(wid):
 
 
 @app.route("/user/weights/update/<int:wid>", methods=['POST'])
-@requires_authorization
+@identity.requires_login
 def update_weights_set(wid):
-    user = discord.fetch_user()
+    user = identity.get_user()
 
     filters = {}
     for i in range(1, 100):
@@ -204,9 +236,9 @@ def update_weights_set(wid):
 
 
 @app.route("/user/weights/<int:wid>")
-@requires_authorization
+@identity.requires_login
 def get_weights_set(wid):
-    user = discord.fetch_user()
+    user = identity.get_user()
     data = local.get_weight_set(wid, user)
     if not data:
         flash('You are not allowed to view or modify this set.')
@@ -215,9 +247,9 @@ def get_weights_set(wid):
 
 
 @app.route("/user/weights/create", methods=['GET', 'POST'])
-@requires_authorization
+@identity.requires_login
 def create_weights_set():
-    user = discord.fetch_user()
+    user = identity.get_user()
     if request.method == 'GET':
         return render_template("create_weights.html")
     else:
@@ -247,20 +279,20 @@ def create_weights_set():
 
 
 @app.route("/user/gear/delete/<int:glid>", methods=['POST'])
-@requires_authorization
+@identity.requires_login
 def delete_gear_list(glid):
     """NOTE: THIS FEATURE IS CURRENTLY DARK AS IT IS BEING EVALUATED WHETHER EQDB SHOULD PROVIDE THIS OR NOT"""
     return 'Not Implemented'
-    user = discord.fetch_user()
+    user = identity.get_user()
     return 'NYI'
 
 
 @app.route("/user/gear/update/<int:item_id>", methods=['POST'])
-@requires_authorization
+@identity.requires_login
 def update_gear_list(item_id):
     """NOTE: THIS FEATURE IS CURRENTLY DARK AS IT IS BEING EVALUATED WHETHER EQDB SHOULD PROVIDE THIS OR NOT"""
     return 'Not Implemented'
-    user = discord.fetch_user()
+    user = identity.get_user()
     glid = None
     slot = None
     aug_slot = None
@@ -288,21 +320,21 @@ def update_gear_list(item_id):
 
 
 @app.route("/user/gear/<int:glid>")
-@requires_authorization
+@identity.requires_login
 def get_gear_list(glid):
     """NOTE: THIS FEATURE IS CURRENTLY DARK AS IT IS BEING EVALUATED WHETHER EQDB SHOULD PROVIDE THIS OR NOT"""
     return 'Not Implemented'
-    user = discord.fetch_user()
+    user = identity.get_user()
     data = local.get_gear_list(user, glid)
     return render_template('gear_list_detail.html', data=data)
 
 
 @app.route("/user/gear/create", methods=['GET', 'POST'])
-@requires_authorization
+@identity.requires_login
 def create_gear_list():
     """NOTE: THIS FEATURE IS CURRENTLY DARK AS IT IS BEING EVALUATED WHETHER EQDB SHOULD PROVIDE THIS OR NOT"""
     return 'Not Implemented'
-    user = discord.fetch_user()
+    user = identity.get_user()
     if request.method == 'GET':
         return render_template('create_gear_list.html')
     else:
@@ -320,9 +352,9 @@ def create_gear_list():
 
 
 @app.route("/user/")
-@requires_authorization
+@identity.requires_login
 def user_home():
-    user = discord.fetch_user()
+    user = identity.get_user()
     data = local.get_user_data(user)
     return render_template('user_home.html', data=data)
 
@@ -330,6 +362,8 @@ def user_home():
 @app.route("/callback/")
 def callback():
     discord.callback()
+    # Remember who logged in so later pages don't need to ask Discord
+    identity.refresh_user()
     return redirect(url_for("user_home"))
 
 
@@ -347,12 +381,12 @@ def redirect_unauthorized(e):
 
 
 @app.route("/identify/attributed/", methods=['GET', 'POST'])
-@requires_authorization
+@identity.requires_login
 def identify_attributed():
     if SITE_TYPE == 'Beta':
         flash('Item Identification is not supported on Beta site')
         return redirect(url_for('error'))
-    user = discord.fetch_user()
+    user = identity.get_user()
     if request.method == 'GET':
         item = local.get_unidentified_item(user=user)
         return render_template('identify.html', item=item)
@@ -403,7 +437,8 @@ def identify_leaderboard():
     if SITE_TYPE == 'Beta':
         flash('Item Identification is not supported on Beta site')
         return redirect(url_for('error'))
-    data = local.get_leaderboard()
+    # The leaderboard only needs to be roughly current, so share its data for a short while
+    data = cache.get_timed('identify_leaderboard', local.get_leaderboard, LEADERBOARD_TTL)
     return render_template('identify_leaderboard.html', data=data)
 
 
@@ -708,58 +743,72 @@ def item_search():
                     else:
                         filters.update({'banedmgrace': bane_id})
 
+    # Handle the results page
+    page = 1
+    limit = None
+    offset = 0
+    if ITEM_SEARCH_PAGE_SIZE > 0:
+        if data.get('page', '').isdigit():
+            page = max(int(data['page']), 1)
+        limit = ITEM_SEARCH_PAGE_SIZE
+        offset = (page - 1) * limit
+
     # Oh god, we've got everything...lets get a list of items
-    ret_items, focus, worn, inst = logic.get_items_with_filters(weights, ignore_zero, **filters)
+    search = logic.get_items_with_filters
+    if ITEM_SEARCH_ENGINE == 'memory':
+        search = memory_search.get_items_with_filters
+    ret_items, focus, worn, inst, total = search(weights, ignore_zero, limit=limit, offset=offset, **filters)
+    pages = 1
+    if limit:
+        pages = max(-(-total // limit), 1)
+        if page > pages:
+            # Asked for a page past the end, show the last one instead
+            page = pages
+            offset = (page - 1) * limit
+            ret_items, focus, worn, inst, total = search(weights, ignore_zero, limit=limit, offset=offset, **filters)
     return render_template('item_search_results.html', data=ret_items, reduce=reduce_restrictions,
                            show_dmg_delay=show_dmg_delay, show_focus=focus, full_detail=full_detail,
                            show_values=show_values, show_click=show_click, show_proc=show_proc, show_worn=worn,
-                           show_inst=inst, show_spells=show_spells)
+                           show_inst=inst, show_spells=show_spells, page=page, pages=pages, total=total,
+                           first=offset + 1, last=offset + len(ret_items))
 
 
 @app.route("/search/weapon", methods=['GET', 'POST'])
 def weapon_search():
-    if discord.is_user_logged_in():
-        user = discord.fetch_user()
+    if identity.is_logged_in():
+        user = identity.get_user()
     else:
         user = None
     if request.method == 'GET':
         skills = utils.get_all_skills()
-        if user:
-            restricts = local.get_restrict_sets(user)
-            weights = local.get_weights_sets(user)
-        else:
-            restricts = []
-            weights = []
+        restricts, restrict_json = local.get_restrict_sets_and_json(user)
+        weights, weights_json = local.get_weights_sets_and_json(user)
         return render_template('weapon_search.html',
                                skills=skills,
                                restricts=restricts,
-                               restrict_json=json.dumps(restricts),
+                               restrict_json=restrict_json,
                                weights=weights,
-                               weights_json=json.dumps(weights))
+                               weights_json=weights_json)
     else:
         return redirect(url_for('item_search'), code=307)
 
 
 @app.route("/search/armor", methods=['GET', 'POST'])
 def armor_search():
-    if discord.is_user_logged_in():
-        user = discord.fetch_user()
+    if identity.is_logged_in():
+        user = identity.get_user()
     else:
         user = None
     if request.method == 'GET':
         skills = utils.get_all_skills()
-        if user:
-            restricts = local.get_restrict_sets(user)
-            weights = local.get_weights_sets(user)
-        else:
-            restricts = []
-            weights = []
+        restricts, restrict_json = local.get_restrict_sets_and_json(user)
+        weights, weights_json = local.get_weights_sets_and_json(user)
         return render_template('item_search.html',
                                skills=skills,
                                restricts=restricts,
-                               restrict_json=json.dumps(restricts),
+                               restrict_json=restrict_json,
                                weights=weights,
-                               weights_json=json.dumps(weights))
+                               weights_json=weights_json)
     else:
         return redirect(url_for('item_search'), code=307)
 
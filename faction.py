@@ -1,12 +1,14 @@
-from sqlalchemy.orm import Session
+import cache
+from database import get_session
+from logic import FactionList, engine, NPCFactionEntries, NPCTypes
+from zone import get_zone_catalog
 
-from logic import FactionList, engine, NPCFactionEntries, NPCTypes, Zone
 
-
-def get_factions(name):
+def get_factions(name, limit=50, offset=0):
     partial = "%%%s%%" % name
-    with Session(bind=engine) as session:
-        query = session.query(FactionList.name, FactionList.id).filter(FactionList.name.like(partial))
+    with get_session(engine) as session:
+        query = session.query(FactionList.name, FactionList.id).filter(FactionList.name.like(partial)).\
+            order_by(FactionList.id).offset(offset).limit(limit)
         result = query.all()
 
     out_factions = []
@@ -17,28 +19,32 @@ def get_factions(name):
 
 
 def get_faction(faction_id):
-    # Get name
     if faction_id == 5013 or faction_id == 242:
         return []
+    return cache.get_versioned_item('faction', faction_id, lambda: _build_faction(faction_id))
+
+
+def _build_faction(faction_id):
     base_data = {}
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
+        # Get name
         query = session.query(FactionList.name).filter(FactionList.id == faction_id)
         result = query.first()
-    if not result:
-        return None
+        if not result:
+            return None
 
-    base_data.update({'name': result[0]})
+        base_data.update({'name': result[0]})
 
-    # Get all the NPCs associated with this faction
-    pos_zones = {}
-    neg_zones = {}
-    zone_lookup = {}
-    with Session(bind=engine) as session:
+        # Get all the NPCs associated with this faction
         query = session.query(NPCFactionEntries.value, NPCTypes.id, NPCTypes.name).\
             filter(NPCFactionEntries.faction_id == faction_id).\
             filter(NPCFactionEntries.npc_faction_id == NPCTypes.npc_faction_id)
         result = query.all()
 
+    pos_zones = {}
+    neg_zones = {}
+    catalog = get_zone_catalog()
+
     for entry in result:
         value = entry[0]
         npc_id = entry[1]
@@ -47,17 +53,11 @@ def get_faction(faction_id):
         npc = {'npc_id': npc_id,
                'npc_name': npc_name,
                'value': value}
-        if zone not in zone_lookup:
-            with Session(bind=engine) as session:
-                query = session.query(Zone.long_name).filter(Zone.zoneidnumber == zone)
-                result = query.first()
-                if not result:
-                    zone_name = "Unknown"
-                else:
-                    zone_name = result[0]
-                zone_lookup.update({zone: zone_name})
+        zone_record = catalog.get(zone)
+        if not zone_record:
+            zone_name = "Unknown"
         else:
-            zone_name = zone_lookup[zone]
+            zone_name = zone_record.long_name
 
         if value < 0:
             if zone_name in neg_zones:
@@ -0,0 +1,79 @@
+"""EQDB Logic File for the logged in user's identity"""
+import configparser
+import functools
+import hashlib
+import hmac
+import os
+import time
+from collections import namedtuple
+
+from flask import current_app, session
+from flask_discord import Unauthorized
+
+here = os.path.dirname(__file__)
+site_config = configparser.RawConfigParser()
+ini_path = os.path.join(here, 'configuration.ini')
+site_config.read_file(open(ini_path))
+
+# 'discord' asks Discord who the user is, 'stub' always logs in the configured stub user (Development only)
+provider = site_config.get('discord', 'identity_provider', fallback='discord')
+identity_ttl = site_config.getint('discord', 'identity_ttl', fallback=3600)
+if provider == 'stub' and site_config.get('DEFAULT', 'site_type') != 'Development':
+    raise ValueError('The stub identity provider can only be used on Development sites')
+
+IDENTITY_KEY = 'eqdb_identity'
+Identity = namedtuple('Identity', ['id', 'name'])
+
+
+def _fetch_identity():
+    """Asks the identity provider who the current user is."""
+    if provider == 'stub':
+        return Identity(site_config.getint('discord', 'stub_user_id', fallback=1),
+                        site_config.get('discord', 'stub_user_name', fallback='Developer'))
+    user = current_app.discord.fetch_user()
+    return Identity(user.id, user.name)
+
+
+def _token_digest():
+    """Returns a digest of the session's OAuth token, which the remembered identity has to match."""
+    if provider == 'stub':
+        return ''
+    token = current_app.discord.get_authorization_token() or {}
+    return hashlib.sha256(str(token.get('access_token', '')).encode()).hexdigest()
+
+
+def is_logged_in():
+    """Returns True if the current session belongs to a logged in user."""
+    if provider == 'stub':
+        return True
+    return current_app.discord.authorized
+
+
+def refresh_user():
+    """Fetches the current user from the identity provider and remembers them in the session."""
+    user = _fetch_identity()
+    session[IDENTITY_KEY] = {'id': user.id, 'name': user.name, 'expires': time.time() + identity_ttl,
+                             'token': _token_digest()}
+    return user
+
+
+def get_user():
+    """Returns the current user, only going to the identity provider when the remembered identity has expired or
+    was remembered for a different OAuth token.
+    """
+    cached = session.get(IDENTITY_KEY)
+    if cached and cached['expires'] > time.time() and hmac.compare_digest(cached.get('token', ''), _token_digest()):
+        return Identity(cached['id'], cached['name'])
+    return refresh_user()
+
+
+def requires_login(view):
+    """Flask view decorator that raises Unauthorized unless the user is logged in."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_logged_in():
+            session.pop(IDENTITY_KEY, None)
+            raise Unauthorized
+        return view(*args, **kwargs)
+
+    return wrapper
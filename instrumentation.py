@@ -0,0 +1,74 @@
+"""EQDB Logic File for per request SQL instrumentation"""
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+
+
+def _new_stats():
+    return {'queries': 0, 'db_time': 0.0, 'rows': 0, 'slowest_time': 0.0, 'slowest_statement': None}
+
+
+def get_request_stats():
+    """Returns the SQL statistics gathered so far for the current request."""
+    if not has_app_context():
+        return _new_stats()
+    if 'query_stats' not in g:
+        g.query_stats = _new_stats()
+    return g.query_stats
+
+
+def instrument_engine(engine):
+    """Times every statement run on engine and adds it to the current request's statistics."""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's own context, which is dropped along with it if the statement fails
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_start
+        if not has_app_context():
+            return
+        stats = get_request_stats()
+        stats['queries'] += 1
+        stats['db_time'] += elapsed
+        # Drivers report -1 when they don't know the row count (SQLite for SELECTs)
+        if cursor.rowcount > 0:
+            stats['rows'] += cursor.rowcount
+        if elapsed > stats['slowest_time']:
+            stats['slowest_time'] = elapsed
+            stats['slowest_statement'] = statement
+
+
+def init_app(app, engines, log, query_budget):
+    """Reports each request's SQL statistics in a Server-Timing header and the app log.
+
+    Requests running more than query_budget statements are logged as warnings.
+    """
+    for engine in engines:
+        instrument_engine(engine)
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.context_processor
+    def _add_query_stats():
+        return {'query_stats': get_request_stats, 'query_budget': query_budget}
+
+    @app.after_request
+    def _report_query_stats(response):
+        stats = get_request_stats()
+        total = time.perf_counter() - g.get('request_start', time.perf_counter())
+        response.headers['Server-Timing'] = (f'db;dur={stats["db_time"] * 1000:.1f};desc="{stats["queries"]} queries", '
+                                             f'app;dur={total * 1000:.1f}')
+        line = (f'path={request.path} endpoint={request.endpoint} status={response.status_code} '
+                f'queries={stats["queries"]} db_ms={stats["db_time"] * 1000:.1f} rows={stats["rows"]} '
+                f'slowest_ms={stats["slowest_time"] * 1000:.1f} total_ms={total * 1000:.1f}')
+        if stats['queries'] > query_budget:
+            slowest = ' '.join((stats['slowest_statement'] or '').split())[:200]
+            log.warning(f'{line} over_budget={query_budget} slowest="{slowest}"')
+        else:
+            log.info(line)
+        return response
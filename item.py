@@ -1,8 +1,11 @@
+import operator
+
 from sqlalchemy import and_, or_
-from sqlalchemy.orm import Session
 
+import effect_index
 import spell
 import utils
+from database import get_session
 from logic import engine, Item, LootTable, LootTableEntries, LootDrop, LootDropEntries, NPCTypes, get_era_items, \
     create_lookup_table, SpellsNew
 
@@ -16,9 +19,10 @@ def get_click_items(click_category, click_type, **kwargs):
     # Create the lookup table
     item_ids, lookup_table = create_lookup_table(base_items, tradeskill_items, quest_items, special_items)
 
-    item_params = or_(*item_ids)
+    item_params = Item.id.in_(item_ids)
     filters = []
-    effect_or_filters = []
+    # (effect id, compare, value) of the spell slots a click type looks for, see effect_index.get_spell_ids
+    effects = []
 
     # Now, we need to do some additional filtering based on click type
     if click_category == 'Sympathetic':
@@ -30,255 +34,171 @@ def get_click_items(click_category, click_type, **kwargs):
             filters.append(Item.clickeffect <= 24443)
     elif click_category == 'Statistics':
         if click_type == 'AC':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 1,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
+            effects.append((1, operator.gt, 0))
         elif click_type == 'ATK':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 2,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
+            effects.append((2, operator.gt, 0))
         elif click_type == 'HPRegen':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 0,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
+            effects.append((0, operator.gt, 0))
         elif click_type == 'ManaRegen':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 15,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
+            effects.append((15, operator.gt, 0))
         elif click_type == 'MaxHP':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 69,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
+            effects.append((69, operator.gt, 0))
         elif click_type == 'MaxMana':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 97,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
+            effects.append((97, operator.gt, 0))
         elif click_type == 'Resists':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 46,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 47,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 48,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 49,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 50,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 111,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
+            effects.append((46, operator.gt, 0))
+            effects.append((47, operator.gt, 0))
+            effects.append((48, operator.gt, 0))
+            effects.append((49, operator.gt, 0))
+            effects.append((50, operator.gt, 0))
+            effects.append((111, operator.gt, 0))
         elif click_type == 'Haste':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 11,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 100))
+            effects.append((11, operator.gt, 100))
         elif click_type == 'Overhaste':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 119,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 100))
+            effects.append((119, operator.gt, 100))
         elif click_type == 'Stats':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 4,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 5,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 6,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 7,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 8,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 9,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 10,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
+            effects.append((4, operator.gt, 0))
+            effects.append((5, operator.gt, 0))
+            effects.append((6, operator.gt, 0))
+            effects.append((7, operator.gt, 0))
+            effects.append((8, operator.gt, 0))
+            effects.append((9, operator.gt, 0))
+            effects.append((10, operator.gt, 0))
         elif click_type == 'Singing':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 118,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
+            effects.append((118, operator.gt, 0))
         filters.append(SpellsNew.buffduration > 0)
         filters.append(SpellsNew.targettype != 14)
     elif click_category == 'Buffs':
         if click_type == 'Enduring Breath':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 14)
+            effects.append((14, None, None))
         elif click_type == 'SummonItems':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 32)
+            effects.append((32, None, None))
         elif click_type == 'Illusion':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 58)
+            effects.append((58, None, None))
         elif click_type == 'Invis':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 12)
+            effects.append((12, None, None))
         elif click_type == 'InvisToUndead':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 28)
+            effects.append((28, None, None))
         elif click_type == 'InvisToAnimal':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 29)
+            effects.append((29, None, None))
         elif click_type == 'Misc':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 65)
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 87)
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 67)
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 75)
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 66)
+            effects.append((65, None, None))
+            effects.append((87, None, None))
+            effects.append((67, None, None))
+            effects.append((75, None, None))
+            effects.append((66, None, None))
         elif click_type == 'ProcBuff':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 85)
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 428)
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 339)
+            effects.append((85, None, None))
+            effects.append((428, None, None))
+            effects.append((339, None, None))
         elif click_type == 'DamageShield':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 59)
+            effects.append((59, None, None))
         elif click_type == 'Levitate':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 57)
+            effects.append((57, None, None))
         elif click_type == 'MovementSpeed':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 3,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
+            effects.append((3, operator.gt, 0))
         elif click_type == 'SeeInvis':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 13)
+            effects.append((13, None, None))
         elif click_type == 'Invuln':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 40)
+            effects.append((40, None, None))
         filters.append(SpellsNew.buffduration > 0)
     elif click_category == 'Defensive':
         if click_type == 'Heal':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 0,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 79,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                filters.append(SpellsNew.buffduration == 0)
+            effects.append((0, operator.gt, 0))
+            effects.append((79, operator.gt, 0))
+            filters.append(SpellsNew.buffduration == 0)
         elif click_type == 'Mana':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 15,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
-                filters.append(SpellsNew.buffduration == 0)
+            effects.append((15, operator.gt, 0))
+            filters.append(SpellsNew.buffduration == 0)
         elif click_type == 'CurePoison':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 36,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') < 0))
+            effects.append((36, operator.lt, 0))
         elif click_type == 'CureDisease':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 35,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') < 0))
+            effects.append((35, operator.lt, 0))
         elif click_type == 'CureCurse':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 116,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') < 0))
+            effects.append((116, operator.lt, 0))
         elif click_type == 'Rune':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 55)
+            effects.append((55, None, None))
         elif click_type == 'SpellRune':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 78)
+            effects.append((78, None, None))
         elif click_type == 'Endurance':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 189,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 0))
+            effects.append((189, operator.gt, 0))
     elif click_category == 'Offensive':
         if click_type == 'DispelBene':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 209)
+            effects.append((209, None, None))
         elif click_type == 'Dispel':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 27)
+            effects.append((27, None, None))
         elif click_type == 'DOT':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 0,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') < 0))
-                filters.append(SpellsNew.buffduration > 0)
+            effects.append((0, operator.lt, 0))
+            filters.append(SpellsNew.buffduration > 0)
         elif click_type == 'Slow':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 11,
-                                         getattr(SpellsNew, f'effect_base_value{idx}') < 100))
+            effects.append((11, operator.lt, 100))
         elif click_type == 'SwarmPet':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 152)
+            effects.append((152, None, None))
         elif click_type == 'Root':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 99)
+            effects.append((99, None, None))
         elif click_type == 'DD':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 0,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') < 0))
-                filters.append(SpellsNew.buffduration == 0)
+            effects.append((0, operator.lt, 0))
+            filters.append(SpellsNew.buffduration == 0)
         elif click_type == 'Lifetap':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 0,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') < 0))
-                filters.append(SpellsNew.targettype == 13)
+            effects.append((0, operator.lt, 0))
+            filters.append(SpellsNew.targettype == 13)
         elif click_type == 'Snare':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 3,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') < 0))
+            effects.append((3, operator.lt, 0))
         elif click_type == 'Fear':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 23)
+            effects.append((23, None, None))
         elif click_type == 'Stun':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 21)
+            effects.append((21, None, None))
         elif click_type == 'Blind':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 20,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') == -1))
+            effects.append((20, operator.eq, -1))
         elif click_type == 'Charm':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 22)
+            effects.append((22, None, None))
         elif click_type == 'DecreaseATK':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 2,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') < 0))
+            effects.append((2, operator.lt, 0))
     elif click_category == 'Pets':
         filters.append(SpellsNew.targettype == 14)
     elif click_category == 'Misc':
         if click_type == 'Misc':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 68)
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 61)
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 42)
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 91)
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 20,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') == 1))
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 33)
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 56)
+            effects.append((68, None, None))
+            effects.append((61, None, None))
+            effects.append((42, None, None))
+            effects.append((91, None, None))
+            effects.append((20, operator.eq, 1))
+            effects.append((33, None, None))
+            effects.append((56, None, None))
         elif click_type == 'SummonItem':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 32)
+            effects.append((32, None, None))
         elif click_type == 'Transport':
-            for idx in range(1, 13):
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 26)
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 83)
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 104)
-                effect_or_filters.append(getattr(SpellsNew, f'effectid{idx}') == 88)
+            effects.append((26, None, None))
+            effects.append((83, None, None))
+            effects.append((104, None, None))
+            effects.append((88, None, None))
         elif click_type == 'Shrink':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 89,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') < 100))
+            effects.append((89, operator.lt, 100))
         elif click_type == 'Grow':
-            for idx in range(1, 13):
-                effect_or_filters.append(and_(getattr(SpellsNew, f'effectid{idx}') == 89,
-                                              getattr(SpellsNew, f'effect_base_value{idx}') > 100))
+            effects.append((89, operator.gt, 100))
     if 'charges' in kwargs:
         filters.append(Item.maxcharges < 0)
 
     filters.append(Item.clicklevel2 <= kwargs['min_level'])
 
+    if effects:
+        # Only the spells items click can match, which keeps the IN list short
+        spell_ids = effect_index.get_spell_ids(engine, SpellsNew, effects) & \
+            effect_index.get_click_spell_ids(engine, Item)
+        filters.append(Item.clickeffect.in_(sorted(spell_ids)))
+
     params = and_(*filters)
-    effect_or_params = or_(*effect_or_filters)
 
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(Item.Name, Item.id, SpellsNew.id, SpellsNew.name).\
             filter(SpellsNew.id == Item.clickeffect).\
             filter(Item.id.in_(session.query(Item.id).filter(item_params))).\
-            filter(params).\
-            filter(effect_or_params)
+            filter(params)
         result = query.all()
 
+    # Many items share a click spell, so parse each spell once
+    effects = spell.get_spell_effects([entry[2] for entry in result])
+
     ret_data = []
     for entry in result:
         item_name = entry[0]
@@ -290,9 +210,6 @@ def get_click_items(click_category, click_type, **kwargs):
         zone_name = utils.lookup_zone_name(npc_id)
         npc_name = utils.fix_npc_name(npc_name)
 
-        # Get the spell effects
-        _, effects = spell.get_spell_data(spell_id, basic_data=False)
-
         ret_data.append({'item_name': item_name,
                          'item_id': item_id,
                          'spell_id': spell_id,
@@ -301,7 +218,7 @@ def get_click_items(click_category, click_type, **kwargs):
                          'npc_name': npc_name,
                          'zone_name': zone_name,
                          'zone_id': int(npc_id / 1000),
-                         'effects': effects})
+                         'effects': effects[spell_id]})
     return ret_data
 
 
@@ -334,7 +251,7 @@ def get_fast_item(item_name, tradeskill=None, equippable=None, itype='Base', no_
         filters.append(Item.augtype > 0)
 
     params = and_(*filters)
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         if or_filters:
             or_params = or_(*or_filters)
             query = session.query(Item.id, Item.Name, Item.icon).filter(params).filter(or_params).limit(50)
@@ -363,7 +280,7 @@ def get_item_raw_data(item_id):
     if item_id in excl_list:
         return None
 
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(Item).filter(Item.id == item_id)
         result = query.one()
 
@@ -380,7 +297,7 @@ def get_loot_json(loot_id=None, npc_id=None):
     if npc_id in npc_excl_list:
         return []
 
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         if npc_id:
             query = session.query(NPCTypes.loottable_id).filter(NPCTypes.id == npc_id)
             result = query.one()
@@ -424,7 +341,7 @@ def get_item_json(name=None, item_id=None, i_type=None):
     excl_list = utils.get_exclusion_list('item')
     if item_id in excl_list:
         return []
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         if item_id:
             query = session.query(Item).filter(Item.id == item_id)
             result = query.first()
@@ -464,7 +381,7 @@ def get_item_name(item_id):
     excl_list = utils.get_exclusion_list('item')
     if item_id in excl_list:
         return None
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(Item.Name).filter(Item.id == item_id)
         result = query.one()
     return result[0]
@@ -0,0 +1,132 @@
+"""EQDB Logic File for the item stat matrix used to weight and filter item searches"""
+from sqlalchemy import func
+
+try:
+    import numpy as np
+except ImportError:
+    # Item searches weigh and filter every item one at a time instead
+    np = None
+
+import cache
+from database import get_session
+
+# The numeric item columns item searches weigh, filter and index on, one matrix row each
+STAT_COLUMNS = ['hp', 'mana', 'endur', 'ac', 'damage', 'aagi', 'acha', 'adex', 'aint', 'asta', 'astr', 'awis',
+                'heroic_agi', 'heroic_cha', 'heroic_dex', 'heroic_int', 'heroic_sta', 'heroic_str', 'heroic_wis',
+                'cr', 'dr', 'fr', 'mr', 'pr', 'heroic_cr', 'heroic_dr', 'heroic_fr', 'heroic_mr', 'heroic_pr',
+                'attack', 'haste', 'regen', 'manaregen', 'enduranceregen', 'healamt', 'spelldmg', 'accuracy',
+                'avoidance', 'combateffects', 'damageshield', 'dotshielding', 'shielding', 'spellshield',
+                'strikethrough', 'stunresist', 'delay', 'proceffect', 'focuseffect', 'clickeffect', 'banedmgamt',
+                'banedmgbody', 'banedmgrace', 'banedmgraceamt', 'elemdmgamt', 'elemdmgtype', 'clicklevel2',
+                'proclevel2', 'backstabdmg', 'bardeffect', 'worneffect', 'procrate', 'bagtype', 'bagslots', 'bagwr',
+                'bagsize', 'skillmodvalue', 'skillmodmax', 'skillmodtype', 'icon', 'casttime', 'maxcharges',
+                'augtype', 'augrestrict', 'scrolleffect', 'classes', 'slots', 'itemtype', 'norent']
+
+# Resist weights count the heroic resist as well, see utils.get_stat_weights
+HEROIC_RESISTS = {'pr': 'heroic_pr', 'mr': 'heroic_mr', 'cr': 'heroic_cr', 'dr': 'heroic_dr', 'fr': 'heroic_fr'}
+
+
+class ItemMatrix:
+    """Every item's stats as one row per stat and one column per item, items sorted by id."""
+    __slots__ = ('ids', 'stats', 'rows')
+
+    def __init__(self, ids, stats):
+        self.ids = ids
+        self.stats = stats
+        self.rows = {name: idx for idx, name in enumerate(STAT_COLUMNS)}
+
+    def stat(self, name, columns):
+        return self.stats[self.rows[name], columns]
+
+    def find(self, item_ids):
+        """Returns the ids of item_ids that are items, and their matrix columns."""
+        item_ids = np.unique(np.asarray(item_ids, dtype=np.int64))
+        if not len(self.ids):
+            return item_ids[:0], item_ids[:0]
+        columns = np.searchsorted(self.ids, item_ids)
+        columns[columns == len(self.ids)] = 0
+        found = self.ids[columns] == item_ids
+        return item_ids[found], columns[found]
+
+    def get_weights(self, weights, columns, bane_body=False):
+        """Returns utils.get_stat_weights for the items in columns, all at once."""
+        coefficients = np.zeros(len(STAT_COLUMNS))
+        values = np.zeros(len(columns))
+        for weight, amount in weights.items():
+            if weight == 'w_eff':
+                delay = self.stat('delay', columns)
+                ratio = np.divide(self.stat('damage', columns), delay, out=np.zeros(len(columns)), where=delay != 0)
+                # np.round rounds 1.425 down where round() gives 1.43, so round each distinct ratio the same way
+                distinct, inverse = np.unique(ratio, return_inverse=True)
+                values += np.array([round(value, 2) for value in distinct.tolist()])[inverse] * amount
+            elif 'bane_damage' in weight:
+                coefficients[self.rows['banedmgamt' if bane_body else 'banedmgraceamt']] += amount
+            else:
+                coefficients[self.rows[weight]] += amount
+                if weight in HEROIC_RESISTS:
+                    coefficients[self.rows[HEROIC_RESISTS[weight]]] += amount
+        used = np.flatnonzero(coefficients)
+        if len(used):
+            values += coefficients[used] @ self.stats[np.ix_(used, columns)]
+        return values
+
+    def get_mask(self, filters, columns):
+        """Returns which items in columns pass filters, {stat: minimum} plus the 'proc', 'click' and maximum
+        'delay' filters of get_items_with_filters.  Stats the matrix doesn't hold are left to the database.
+        """
+        mask = np.ones(len(columns), dtype=bool)
+        for name, value in filters.items():
+            if name == 'proc':
+                mask &= self.stat('proceffect', columns) >= 1
+            elif name == 'click':
+                mask &= self.stat('clickeffect', columns) >= 1
+            elif name == 'delay':
+                mask &= self.stat('delay', columns) <= float(value)
+            elif name in self.rows:
+                mask &= self.stat(name, columns) >= float(value)
+        return mask
+
+    def narrow(self, item_ids, weights, filters, ignore_zero, bane_body=False):
+        """Returns the item_ids that pass filters (and have a weight unless ignore_zero is off), and
+        {item id: weight} for each of them.
+        """
+        ids, columns = self.find(item_ids)
+        mask = self.get_mask(filters, columns)
+        ids = ids[mask]
+        columns = columns[mask]
+        if not weights:
+            return ids.tolist(), {}
+
+        values = self.get_weights(weights, columns, bane_body=bane_body)
+        if ignore_zero:
+            nonzero = values != 0
+            ids = ids[nonzero]
+            values = values[nonzero]
+        ids = ids.tolist()
+        return ids, dict(zip(ids, values.tolist()))
+
+    def covers(self, weights):
+        """Returns True if every one of weights can be worked out from the matrix."""
+        return all(weight in self.rows or weight == 'w_eff' or 'bane_damage' in weight for weight in weights)
+
+
+def _build_item_matrix(engine, Item):
+    with get_session(engine) as session:
+        query = session.query(Item.id, *[func.coalesce(getattr(Item, name), 0) for name in STAT_COLUMNS]).\
+            order_by(Item.id)
+        result = query.all()
+
+    # NumPy reads plain tuples several times faster than Rows
+    table = np.array([tuple(row) for row in result], dtype=np.int64).reshape(len(result), len(STAT_COLUMNS) + 1)
+    stats = table[:, 1:]
+    if len(stats) and stats.min() >= np.iinfo(np.int32).min and stats.max() <= np.iinfo(np.int32).max:
+        stats = stats.astype(np.int32)
+    # One contiguous row per stat, as searches read a handful of stats for many items
+    return ItemMatrix(table[:, 0].copy(), np.ascontiguousarray(stats.T))
+
+
+def get_item_matrix(engine, Item):
+    """Returns the item stat matrix, or None when NumPy isn't installed."""
+    if np is None:
+        return None
+    return cache.get_versioned('item_matrix', lambda: _build_item_matrix(engine, Item))
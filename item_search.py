@@ -0,0 +1,343 @@
+"""EQDB Logic File for the in-memory item search"""
+import re
+from collections import namedtuple
+
+from sqlalchemy import and_, or_
+
+import cache
+import item_matrix
+import logic
+import utils
+from database import get_session
+from logic import engine, Item, NPCTypes, SpellsNew, FocusSpell, ClickSpell, ProcSpell, WornSpell, BardSpell
+
+np = item_matrix.np
+
+# The eras the item search form offers
+ERAS = ['Classic', 'Kunark', 'Velious', 'Luclin', 'Planes']
+# Item rows kept for building results, enough for every item the eras above can find
+ROW_CACHE_SIZE = 100000
+
+# Items NPCs in an era's zones drop, {base item id: (npc id, npc name)}, plus the ids listed in its item files
+EraItems = namedtuple('EraItems', ['drops', 'quest_ids', 'special_ids', 'ts_ids', 'names'])
+ProcSpellRecord = namedtuple('ProcSpellRecord', ['targettype', 'buffduration', 'effectid1', 'effect_base_value1',
+                                                 'resisttype'])
+
+# Filters get_items_with_filters doesn't apply itself, or applies in get_era_items
+SKIP_FILTERS = ['item_name', 'g_class_1', 'g_class_2', 'g_class_3', 'g_slot', 'i_type', 'no_rent', 'sub_type',
+                'sympathetic', 'eras', 'w_eff', 'pet_search', 'skillmodtype']
+
+
+def _to_ids(values):
+    """Returns the item ids among the strings read from an item file, as the database would match them."""
+    ids = []
+    for value in values:
+        try:
+            ids.append(int(value))
+        except ValueError:
+            continue
+    return ids
+
+
+def _load_era_items(era):
+    zone_or_filters = [NPCTypes.id.like(f'{zone_id}___') for zone_id in utils.get_era_zones(era)]
+    with get_session(engine) as session:
+        query = session.query(Item.id, NPCTypes.id.label('npc_id'), NPCTypes.name.label('npc_name'), Item.Name).\
+            filter(or_(*zone_or_filters)).\
+            filter(and_(*logic._get_link_filters())).\
+            group_by(Item.id)
+        result = query.all()
+
+    drops = {}
+    names = {}
+    for entry in result:
+        drops[entry.id] = (entry.npc_id, entry.npc_name)
+        names[entry.id] = entry.Name
+
+    quest_ids, special_ids, ts_ids = (_to_ids(ids) for ids in logic.get_era_item_ids(era))
+    listed = set(quest_ids + special_ids + ts_ids)
+    if listed:
+        with get_session(engine) as session:
+            query = session.query(Item.id, Item.Name).filter(Item.id.in_(listed))
+            names.update(query.all())
+    return EraItems(drops, quest_ids, special_ids, ts_ids, names)
+
+
+def get_era_items(era):
+    """Returns the EraItems of an era."""
+    return cache.get_versioned_item('item_search_eras', era, lambda: _load_era_items(era))
+
+
+def _load_proc_spells():
+    with get_session(engine) as session:
+        proc_ids = session.query(Item.proceffect).filter(Item.proceffect > 0)
+        query = session.query(SpellsNew.id, SpellsNew.targettype, SpellsNew.buffduration, SpellsNew.effectid1,
+                              SpellsNew.effect_base_value1, SpellsNew.resisttype).\
+            filter(SpellsNew.id.in_(proc_ids))
+        result = query.all()
+    return {entry[0]: ProcSpellRecord(*entry[1:]) for entry in result}
+
+
+def get_proc_spells():
+    """Returns {spell id: ProcSpellRecord} for every spell an item procs."""
+    return cache.get_versioned('item_search_proc_spells', _load_proc_spells)
+
+
+def _load_item_rows(item_ids):
+    rows = dict.fromkeys(item_ids)
+    # Keep each IN list well under the bound parameter limits
+    for start in range(0, len(item_ids), 500):
+        with get_session(engine) as session:
+            query = session.query(*logic._get_arg_list()).\
+                join(FocusSpell, FocusSpell.id == Item.focuseffect, isouter=True).\
+                join(ClickSpell, ClickSpell.id == Item.clickeffect, isouter=True).\
+                join(ProcSpell, ProcSpell.id == Item.proceffect, isouter=True).\
+                join(WornSpell, WornSpell.id == Item.worneffect, isouter=True).\
+                join(BardSpell, BardSpell.id == Item.bardeffect, isouter=True).\
+                filter(Item.id.in_(item_ids[start:start + 500])).\
+                group_by(Item.id)
+            for entry in query.all():
+                rows[entry.id] = dict(entry._mapping)
+    return rows
+
+
+def get_item_rows(item_ids):
+    """Returns the item search row of every one of item_ids that is an item, in the order given."""
+    rows = cache.get_versioned_items('item_search_rows', item_ids, _load_item_rows, maxsize=ROW_CACHE_SIZE)
+    return [rows[item_id] for item_id in item_ids if rows[item_id] is not None]
+
+
+def warm(eras=None):
+    """Loads everything searches over eras (by default every era the form offers) need."""
+    if np is None:
+        return
+    item_matrix.get_item_matrix(engine, Item)
+    get_proc_spells()
+    utils.get_all_focus_ids(engine, SpellsNew)
+    item_ids = set()
+    for era in eras or ERAS:
+        era_items = get_era_items(era)
+        item_ids.update(item_id + 2000000 for item_id in era_items.drops)
+        item_ids.update(era_items.quest_ids + era_items.special_ids + era_items.ts_ids)
+    get_item_rows(sorted(item_ids))
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _like(pattern):
+    """Returns a function matching names as SQL's case insensitive LIKE pattern would."""
+    parts = ['.*' if char == '%' else '.' if char == '_' else re.escape(char) for char in pattern]
+    regex = re.compile(''.join(parts), re.IGNORECASE | re.DOTALL)
+    return lambda name: name is not None and regex.fullmatch(name) is not None
+
+
+def _item_mask(matrix, item_ids, columns, names, kwargs):
+    """Returns which items pass the item filters get_era_items applies."""
+    mask = np.ones(len(columns), dtype=bool)
+    if 'item_name' in kwargs:
+        matches = _like(f"%{kwargs['item_name']}%")
+        mask &= np.array([matches(names.get(item_id)) for item_id in item_ids.tolist()], dtype=bool)
+
+    class_mask = None
+    for name in ('g_class_1', 'g_class_2', 'g_class_3'):
+        if name in kwargs:
+            class_value = utils.lookup_class(kwargs[name])
+            if class_value is None:
+                matched = np.zeros(len(columns), dtype=bool)
+            else:
+                matched = (matrix.stat('classes', columns) & class_value) == class_value
+            class_mask = matched if class_mask is None else class_mask | matched
+    if class_mask is not None:
+        mask &= class_mask
+
+    if 'g_slot' in kwargs:
+        slot_value = utils.lookup_slot(kwargs['g_slot'])
+        mask &= (matrix.stat('slots', columns) & slot_value) == slot_value
+    if 'skillmodtype' in kwargs:
+        if kwargs['skillmodtype'] == 'All':
+            mask &= matrix.stat('skillmodtype', columns) >= 0
+        else:
+            mask &= matrix.stat('skillmodtype', columns) == _number(kwargs['skillmodtype'])
+
+    if 'i_type' in kwargs:
+        itemtype = matrix.stat('itemtype', columns)
+        if kwargs['i_type'] == 'Augment':
+            mask &= matrix.stat('augtype', columns) > 0
+        elif kwargs['i_type'] in ('Any 1H Weapon', 'Exclude 1H Weapon'):
+            one_hand = np.isin(itemtype, [utils.lookup_weapon_types(name) for name in
+                                          ('One Hand Slash', 'One Hand Blunt', 'One Hand Piercing', 'Hand to Hand')])
+            mask &= one_hand if kwargs['i_type'] == 'Any 1H Weapon' else ~one_hand
+        elif kwargs['i_type'] in ('Any 2H Weapon', 'Exclude 2H Weapon'):
+            two_hand = np.isin(itemtype, [utils.lookup_weapon_types(name) for name in
+                                          ('Two Hand Slash', 'Two Hand Blunt', 'Two Hand Piercing')])
+            mask &= two_hand if kwargs['i_type'] == 'Any 2H Weapon' else ~two_hand
+        else:
+            mask &= itemtype == utils.lookup_weapon_types(kwargs['i_type'])
+
+    if 'pet_search' not in kwargs:
+        mask &= matrix.stat('norent', columns) == 1
+    return mask
+
+
+def _proc_spell_ids(proc_type):
+    """Returns the ids of the proc spells a proc_type filter keeps."""
+    spells = get_proc_spells()
+    if proc_type == 'Lifetap':
+        return [spell_id for spell_id, spell in spells.items() if spell.targettype == 13]
+    elif proc_type == 'Debuff':
+        return [spell_id for spell_id, spell in spells.items() if spell.buffduration > 0 and spell.effectid1 == 0]
+    elif proc_type == 'Rune':
+        return [spell_id for spell_id, spell in spells.items() if spell.effectid1 == 55]
+    elif proc_type == 'Healing':
+        return [spell_id for spell_id, spell in spells.items()
+                if spell.effectid1 == 0 and spell.effect_base_value1 > 0]
+    resist = _number(proc_type)
+    return [spell_id for spell_id, spell in spells.items()
+            if spell.resisttype == resist and spell.effectid1 == 0 and spell.effect_base_value1 < 0]
+
+
+def _filter_mask(matrix, columns, kwargs):
+    """Returns which items pass the filters get_items_with_filters applies, and whether bane damage is by body type.
+    Returns None for the mask if a filter can't be applied from the matrix.
+    """
+    mask = np.ones(len(columns), dtype=bool)
+    bane_body = False
+    for entry in kwargs:
+        if entry in SKIP_FILTERS:
+            continue
+        elif entry == 'proc_type':
+            mask &= np.isin(matrix.stat('proceffect', columns), _proc_spell_ids(kwargs['proc_type']))
+        elif entry == 'proc':
+            mask &= matrix.stat('proceffect', columns) >= 1
+        elif 'proclevel2' in entry:
+            mask &= matrix.stat('proclevel2', columns) <= _number(kwargs['proclevel2'])
+        elif entry == 'click':
+            mask &= matrix.stat('clickeffect', columns) >= 1
+        elif 'clicklevel2' in entry:
+            mask &= matrix.stat('clicklevel2', columns) <= _number(kwargs['clicklevel2'])
+        elif 'elemdmgtype' in entry:
+            mask &= matrix.stat('elemdmgtype', columns) == _number(kwargs['elemdmgtype'])
+        elif 'banedmgbody' in entry:
+            bane_body = True
+            mask &= matrix.stat('banedmgbody', columns) == _number(kwargs['banedmgbody'])
+        elif 'banedmgrace' in entry:
+            bane_body = False
+            mask &= matrix.stat('banedmgrace', columns) == _number(kwargs['banedmgrace'])
+        elif 'focus_type' in entry:
+            ids = utils.get_focus_ids(kwargs['focus_type'], kwargs['sub_type'], engine, SpellsNew)
+            # No focus ids leaves the results unfiltered, as an empty or_() does in SQL
+            if ids:
+                focus_mask = np.isin(matrix.stat('focuseffect', columns), ids)
+                if kwargs['focus_type'] == 'Melee':
+                    focus_mask |= np.isin(matrix.stat('worneffect', columns), ids)
+                if kwargs['focus_type'] == 'Bard':
+                    focus_mask |= np.isin(matrix.stat('bardeffect', columns), ids)
+                mask &= focus_mask
+        elif 'delay' in entry:
+            mask &= matrix.stat('delay', columns) <= _number(kwargs['delay'])
+        elif 'procrate' in entry:
+            mask &= matrix.stat('procrate', columns) >= int(kwargs[entry])
+        elif entry in matrix.rows:
+            mask &= matrix.stat(entry, columns) >= _number(kwargs[entry])
+        else:
+            return None, bane_body
+    return mask, bane_body
+
+
+def _heaviest(values, count):
+    """Returns which of values are the count largest, the first found winning ties as they do in a stable sort."""
+    if count >= len(values):
+        return np.ones(len(values), dtype=bool)
+    kth = np.partition(values, len(values) - count)[len(values) - count]
+    chosen = values > kth
+    ties = np.flatnonzero(values == kth)
+    chosen[ties[:count - np.count_nonzero(chosen)]] = True
+    return chosen
+
+
+def get_items_with_filters(weights, ignore_zero, limit=None, offset=0, **kwargs):
+    """Returns what logic.get_items_with_filters would, from memory instead of the database.  Falls back to it when
+    NumPy isn't installed or a weight or filter isn't held in memory.
+    """
+    matrix = item_matrix.get_item_matrix(engine, Item)
+    if matrix is None or not matrix.covers(weights):
+        return logic.get_items_with_filters(weights, ignore_zero, limit=limit, offset=offset, **kwargs)
+
+    # The items found in the eras, filtered as get_era_items does
+    drops = {}
+    names = {}
+    quest_ids = []
+    special_ids = []
+    ts_ids = []
+    for era in kwargs['eras']:
+        era_items = get_era_items(era)
+        for item_id, source in era_items.drops.items():
+            drops.setdefault(item_id, source)
+        names.update(era_items.names)
+        quest_ids += era_items.quest_ids
+        special_ids += era_items.special_ids
+        ts_ids += era_items.ts_ids
+
+    def keep(item_ids):
+        ids, columns = matrix.find(item_ids)
+        return set(ids[_item_mask(matrix, ids, columns, names, kwargs)].tolist())
+
+    base_ids = keep(list(drops))
+    quest_ids = keep(quest_ids)
+    special_ids = keep(special_ids)
+    ts_ids = keep(ts_ids)
+    if not base_ids and not quest_ids and not special_ids and not ts_ids:
+        return [], False, False, False, 0
+
+    # Later sources win, as they do in create_lookup_table
+    lookup_table = {}
+    for item_id in base_ids:
+        npc_id, npc_name = drops[item_id]
+        lookup_table[item_id + 2000000] = {'npc_id': npc_id, 'npc_name': npc_name}
+    for item_ids, npc_id, npc_name in ((ts_ids, -2, 'Tradeskills'), (quest_ids, -1, 'Quested'),
+                                       (special_ids, -3, 'Special Drop')):
+        for item_id in item_ids:
+            lookup_table[item_id] = {'npc_id': npc_id, 'npc_name': npc_name}
+
+    ids, columns = matrix.find(list(lookup_table))
+    mask, bane_body = _filter_mask(matrix, columns, kwargs)
+    if mask is None:
+        return logic.get_items_with_filters(weights, ignore_zero, limit=limit, offset=offset, **kwargs)
+    ids = ids[mask]
+    columns = columns[mask]
+
+    excl_list = utils.get_exclusion_list('item')
+    kept = np.array([item_id not in excl_list for item_id in ids.tolist()], dtype=bool)
+    ids = ids[kept]
+    columns = columns[kept]
+
+    values = np.zeros(len(ids))
+    weight_values = {}
+    if weights:
+        values = matrix.get_weights(weights, columns, bane_body=bane_body)
+        if ignore_zero:
+            nonzero = values != 0
+            ids = ids[nonzero]
+            columns = columns[nonzero]
+            values = values[nonzero]
+        weight_values = dict(zip(ids.tolist(), values.tolist()))
+    if not len(ids):
+        return [], False, False, False, 0
+
+    # The spell columns to show depend on every matching item, not just the ones returned
+    show_focus = bool((matrix.stat('focuseffect', columns) > 0).any())
+    show_worn = bool((matrix.stat('worneffect', columns) > 0).any())
+    show_inst = bool((matrix.stat('bardeffect', columns) > 0).any())
+    total = len(ids)
+    if limit is not None:
+        # Only fetch the rows of the items that can make the page
+        ids = ids[_heaviest(values, offset + limit)]
+
+    items = logic.collect_items(get_item_rows(ids.tolist()), lookup_table, weights, weight_values, ignore_zero,
+                                bane_body, kwargs, limit=limit, offset=offset)[0]
+    return items, show_focus, show_worn, show_inst, total
@@ -1,13 +1,18 @@
 """EQDB Logic File for Item Identify"""
 import configparser
+import json
 import os
 import random
+import threading
+from array import array
 
-from sqlalchemy import and_, create_engine, or_
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, create_engine, event, exists, func, or_
+from sqlalchemy.orm import Session, aliased
 from sqlalchemy.ext.automap import automap_base
 
 
+import cache
+from database import get_session, reflect_metadata
 from logic import engine, Item, get_item_data, SpellsNew, LootDropEntries, NPCTypes, LootTableEntries, Zone, \
     TradeskillRecipeEntries
 import utils
@@ -17,9 +22,46 @@ site_config = configparser.RawConfigParser()
 ini_path = os.path.join(here, 'configuration.ini')
 site_config.read_file(open(ini_path))
 local_database = site_config.get('local_database', 'connection')
-local_engine = create_engine(local_database)
-LocalBase = automap_base()
-LocalBase.prepare(autoload_with=local_engine)
+busy_timeout = site_config.getint('local_database', 'busy_timeout', fallback=5000)
+mmap_size = site_config.getint('local_database', 'mmap_size', fallback=268435456)
+cache_size = site_config.getint('local_database', 'cache_size', fallback=-20000)
+
+
+def create_local_engine(connection):
+    """Creates an engine for the local database, setting up SQLite for concurrent submissions."""
+    new_engine = create_engine(connection)
+    if new_engine.dialect.name != 'sqlite':
+        return new_engine
+
+    @event.listens_for(new_engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Uses WAL so readers don't block the writer, and waits on locks rather than failing straight away."""
+        # Let SQLAlchemy emit BEGIN itself so write transactions can ask for an immediate lock
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        # WAL keeps the database consistent on a crash at NORMAL, it only risks the last few commits on power loss
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA mmap_size={mmap_size}')
+        cursor.execute(f'PRAGMA cache_size={cache_size}')
+        cursor.close()
+
+    @event.listens_for(new_engine, 'begin')
+    def _begin_sqlite_transaction(conn):
+        """Takes the write lock up front for transactions that read before they write."""
+        if conn.get_execution_options().get('sqlite_immediate'):
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+        else:
+            conn.exec_driver_sql('BEGIN')
+
+    return new_engine
+
+
+local_engine = create_local_engine(local_database)
+reflection_cache = site_config.get('database', 'reflection_cache', fallback=os.path.join(here, 'reflection_cache'))
+LocalBase = automap_base(metadata=reflect_metadata(local_engine, reflection_cache))
+LocalBase.prepare()
 
 
 IdentifiedItems = LocalBase.classes.identified_items
@@ -31,6 +73,9 @@ Restricts = LocalBase.classes.restricts
 RestrictEntry = LocalBase.classes.restrict_entry
 Weights = LocalBase.classes.weights
 WeightEntry = LocalBase.classes.weight_entry
+UserRevision = LocalBase.classes.user_revision
+
+_sampler_lock = threading.Lock()
 
 
 def get_gear_lists(user):
@@ -95,7 +140,7 @@ def get_gear_list(user, glid):
         item_list.append(Item.id == entry)
     item_params = or_(*item_list)
 
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(Item).filter(item_params)
         result = query.all()
 
@@ -138,7 +183,7 @@ def get_gear_list(user, glid):
         spell_id_list.append(SpellsNew.id == entry)
     spell_params = or_(*spell_id_list)
 
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(SpellsNew.id, SpellsNew.name).filter(spell_params)
         result = query.all()
 
@@ -164,7 +209,7 @@ def update_gear_list(user, glid, item_id, slot, aug_slot):
         return None
 
     # Do a quick check on the item
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(Item.augtype).filter(Item.id == item_id)
         result = query.first()
 
@@ -233,31 +278,20 @@ def delete_weights_set(user, wid):
 
         session.delete(result)
         session.commit()
+    _bump_revision(user_id)
 
     return True
 
 
 def get_weights_sets(user):
-    if not user:
-        return []
-    user_id = user.id
-    with Session(bind=local_engine) as session:
-        query = session.query(Weights).filter(Weights.uid == user_id)
-        result = query.all()
+    return get_weights_sets_and_json(user)[0]
 
-    ret_data = {}
-    for entry in result:
-        with Session(bind=local_engine) as session:
-            query = session.query(WeightEntry).filter(WeightEntry.wid == entry.wid)
-            sub_result = query.all()
-
-        stats = {}
-        for sub_entry in sub_result:
-            stat_name = utils.get_stat_name(sub_entry.stat)
-            stats.update({stat_name: {'value': sub_entry.value,
-                                      'stat': sub_entry.stat}})
-        ret_data.update({entry.name: stats})
-    return ret_data
+
+def get_weights_sets_and_json(user):
+    """Returns (weights sets, serialized weights sets) for the search pages."""
+    if not user:
+        return [], json.dumps([])
+    return _get_user_sets('weights_sets', Weights, WeightEntry, user.id)
 
 
 def update_weights_set(wid, filters, user):
@@ -287,6 +321,7 @@ def update_weights_set(wid, filters, user):
             session.add(weight_entry)
         session.commit()
         session.flush()
+    _bump_revision(user_id)
 
     return True
 
@@ -341,6 +376,7 @@ def add_weights_set(user, name, filters):
             session.add(weight_entry)
         session.commit()
         session.flush()
+    _bump_revision(user_id)
 
     # Return the set id
     return set_id
@@ -362,31 +398,73 @@ def delete_restrict_set(user, rid):
 
         session.delete(result)
         session.commit()
+    _bump_revision(user_id)
 
     return True
 
 
 def get_restrict_sets(user):
+    return get_restrict_sets_and_json(user)[0]
+
+
+def get_restrict_sets_and_json(user):
+    """Returns (restrict sets, serialized restrict sets) for the search pages."""
     if not user:
-        return []
-    user_id = user.id
+        return [], json.dumps([])
+    return _get_user_sets('restrict_sets', Restricts, RestrictEntry, user.id)
+
+
+def _get_revision(user_id):
+    """Returns how many times the user's weight and restrict sets have been written."""
     with Session(bind=local_engine) as session:
-        query = session.query(Restricts).filter(Restricts.uid == user_id)
+        revision = session.query(UserRevision.revision).filter(UserRevision.uid == user_id).scalar()
+    return revision or 0
+
+
+def _bump_revision(user_id):
+    """Moves every worker on from the user's cached sets, called after each write to them."""
+    with Session(bind=local_engine) as session:
+        session.connection(execution_options={'sqlite_immediate': True})
+        query = session.query(UserRevision).filter(UserRevision.uid == user_id)
+        if not query.update({UserRevision.revision: UserRevision.revision + 1}, synchronize_session=False):
+            session.add(UserRevision(uid=user_id, revision=1))
+        session.commit()
+
+
+def _get_user_sets(name, set_class, entry_class, user_id):
+    """Returns (sets, serialized sets) for a user, cached until they next write to their sets."""
+    # The revision lives in the local database, so a write in any worker moves every worker onto a fresh copy
+    key = (user_id, _get_revision(user_id))
+    return cache.get_versioned_item(name, key, lambda: _load_user_sets(set_class, entry_class, user_id),
+                                    maxsize=4096)
+
+
+def _load_user_sets(set_class, entry_class, user_id):
+    """Loads every set a user owns along with its entries in one query."""
+    set_id = set_class.__mapper__.primary_key[0]
+    entry_id = entry_class.__mapper__.primary_key[0]
+    entry_set_id = getattr(entry_class, set_id.name)
+    with Session(bind=local_engine) as session:
+        query = session.query(set_id, set_class.name, entry_class.stat, entry_class.value).\
+            outerjoin(entry_class, entry_set_id == set_id).\
+            filter(set_class.uid == user_id).\
+            order_by(set_id, entry_id)
         result = query.all()
 
     ret_data = {}
+    current_set = None
     for entry in result:
-        with Session(bind=local_engine) as session:
-            query = session.query(RestrictEntry).filter(RestrictEntry.rid == entry.rid)
-            sub_result = query.all()
-
-        stats = {}
-        for sub_entry in sub_result:
-            stat_name = utils.get_stat_name(sub_entry.stat)
-            stats.update({stat_name: {'value': sub_entry.value,
-                                      'stat': sub_entry.stat}})
-        ret_data.update({entry.name: stats})
-    return ret_data
+        if entry[0] != current_set:
+            current_set = entry[0]
+            stats = {}
+            ret_data.update({entry[1]: stats})
+        if entry[2] is None:
+            # A set without any entries
+            continue
+        stat_name = utils.get_stat_name(entry[2])
+        stats.update({stat_name: {'value': entry[3],
+                                  'stat': entry[2]}})
+    return ret_data, json.dumps(ret_data)
 
 
 def update_restrict_set(rid, filters, user):
@@ -416,6 +494,7 @@ def update_restrict_set(rid, filters, user):
             session.add(restrict_entry)
         session.commit()
         session.flush()
+    _bump_revision(user_id)
 
     return True
 
@@ -470,6 +549,7 @@ def add_restrict_set(user, name, filters):
             session.add(restrict_entry)
         session.commit()
         session.flush()
+    _bump_revision(user_id)
 
     # Return the set id
     return set_id
@@ -508,111 +588,103 @@ def add_item_identification(data, user=None):
         user_id = -1
         user_name = 'Anonymous'
 
-    # Does this user already exist in the local db
+    # Everything below happens in one write transaction so concurrent submissions can't interleave
     with Session(bind=local_engine) as session:
-        query = session.query(Contributor).filter(Contributor.id == user_id)
-        result = query.all()
+        session.connection(execution_options={'sqlite_immediate': True})
 
-    if not result:
-        # Add the contributor
-        with Session(bind=local_engine) as session:
-            new_contrib = Contributor(name=user_name,
-                                      id=user_id,
-                                      contributed=1)
-            session.add(new_contrib)
-            session.commit()
+        # Does this user already exist in the local db
+        query = session.query(Contributor.contributed).filter(Contributor.id == user_id)
+        result = query.first()
+        if not result:
+            # Add the contributor
+            session.add(Contributor(name=user_name, id=user_id, contributed=1))
             contrib = {'name': user_name, 'id': user_id, 'contributed': 1}
-    else:
-        contrib = result[0].__dict__
+        else:
+            contrib = {'name': user_name, 'id': user_id, 'contributed': result[0]}
 
-    # Does this item have existing identifications
-    with Session(bind=local_engine) as session:
+        # Someone else may have completed the identification since this item was handed out
+        query = session.query(IdentifiedItems.expansion, IdentifiedItems.source).\
+            filter(IdentifiedItems.item_id == item_id)
+        identified = query.first()
+
+        # Does this item have existing identifications
         args = [IDEntry.expansion, IDEntry.source, IDEntry.item_id, Contributor.contributed, Contributor.id]
         query = session.query(*args).filter(IDEntry.item_id == item_id).filter(IDEntry.cid == Contributor.id)
         result = query.all()
 
-    existing_entries = result
-
-    # Create the data matrix
-    idents = [{'expansion': expansion, 'source': source, 'zone': zone_id}]
-    ident_amt = [contrib.get('contributed')]
-    for entry in result:
-        entry = entry._mapping
-        test_key = {'expansion': entry.get('expansion'), 'source': entry.get('source'), 'zone': entry.get('zone_id')}
-        if test_key in idents:
-            idx = idents.index(test_key)
-            new_val = ident_amt[idx] + entry.get('contributed')
-            ident_amt[idx] = new_val
-        else:
-            idents.append(test_key)
-            ident_amt.append(entry.get('contributed'))
-
-    # Check if we now have an identification:
-    identification = None
-    for entry in ident_amt:
-        if entry >= 100:
-            idx = ident_amt.index(entry)
-            identification = idents[idx]
-            break
-
-    if identification is not None:
-        # Update all the contributors contributions
-        with Session(bind=local_engine) as session:
-            for entry in existing_entries:
+        # Create the data matrix
+        idents = [{'expansion': expansion, 'source': source, 'zone': zone_id}]
+        ident_amt = [contrib.get('contributed')]
+        for entry in result:
+            entry = entry._mapping
+            test_key = {'expansion': entry.get('expansion'), 'source': entry.get('source'),
+                        'zone': entry.get('zone_id')}
+            if test_key in idents:
+                idx = idents.index(test_key)
+                new_val = ident_amt[idx] + entry.get('contributed')
+                ident_amt[idx] = new_val
+            else:
+                idents.append(test_key)
+                ident_amt.append(entry.get('contributed'))
+
+        # Check if we now have an identification:
+        identification = None
+        for entry in ident_amt:
+            if entry >= 100:
+                idx = ident_amt.index(entry)
+                identification = idents[idx]
+                break
+
+        if identified:
+            identification = None
+            ret_dict = {'item_id': item_id,
+                        'result': True,
+                        'expansion': identified[0],
+                        'source': identified[1]}
+        elif identification is not None:
+            # Update all the contributors contributions
+            for entry in result:
                 if entry.id == -1:
                     continue
-                obj = session.query(Contributor).filter(Contributor.id == entry.get('id'))
-                obj.update({'contributed': entry.get('contributed') + 1})
-                session.commit()
+                obj = session.query(Contributor).filter(Contributor.id == entry.id)
+                obj.update({'contributed': entry.contributed + 1}, synchronize_session=False)
             if user_id != -1:
                 obj = session.query(Contributor).filter(Contributor.id == user_id)
-                obj.update({'contributed': contrib.get('contributed') + 1})
-                session.commit()
+                obj.update({'contributed': contrib.get('contributed') + 1}, synchronize_session=False)
                 contrib['contributed'] += 1
 
-        # Add this item to identified items.
-        with Session(bind=local_engine) as session:
-            new_item = IdentifiedItems(item_id=item_id,
-                                       expansion=identification.get('expansion'),
-                                       source=identification.get('source'),
-                                       zone_id=identification.get('zone_id'))
-            session.add(new_item)
-            session.commit()
+            # Add this item to identified items.
+            session.add(IdentifiedItems(item_id=item_id,
+                                        expansion=identification.get('expansion'),
+                                        source=identification.get('source'),
+                                        zone_id=identification.get('zone_id')))
 
-        # Remove the item from existing identifications
-        with Session(bind=local_engine) as session:
-            for entry in existing_entries:
-                obj = IDEntry.query.filter_by(item_id == entry.get('item_id'))
-                session.delete(obj)
-                session.commit()
-
-        # Report back
-        ret_dict = {'item_id': item_id,
-                    'result': True,
-                    'expansion': expansion,
-                    'source': source}
-    else:
-        # Add this to Idents
-        with Session(bind=local_engine) as session:
-            new_entry = IDEntry(item_id=item_id,
+            # Remove the item from existing identifications
+            session.query(IDEntry).filter(IDEntry.item_id == item_id).delete(synchronize_session=False)
+
+            # Report back
+            ret_dict = {'item_id': item_id,
+                        'result': True,
+                        'expansion': expansion,
+                        'source': source}
+        else:
+            # Add this to Idents
+            session.add(IDEntry(item_id=item_id,
                                 cid=contrib.get('id'),
                                 expansion=expansion,
                                 source=source,
-                                zone_id=zone_id)
-            session.add(new_entry)
-            session.commit()
-        ret_dict = {'item_id': item_id,
-                    'result': False,
-                    'expansion': None,
-                    'source': None}
-    if user:
-        # Get the number of identifications the user has submitted
-        with Session(bind=local_engine) as session:
-            query = session.query(IDEntry.item_id).filter(IDEntry.cid == user.id)
-            result = query.all()
-
-        ret_dict.update({'user_contrib': contrib.get('contributed'),
-                         'user_identify': len(result)})
+                                zone_id=zone_id))
+            ret_dict = {'item_id': item_id,
+                        'result': False,
+                        'expansion': None,
+                        'source': None}
+
+        if user:
+            # Get the number of identifications the user has submitted
+            query = session.query(func.count(IDEntry.ideid)).filter(IDEntry.cid == user.id)
+            ret_dict.update({'user_contrib': contrib.get('contributed'),
+                             'user_identify': query.scalar()})
+        session.commit()
     return ret_dict
 
 
@@ -625,59 +697,65 @@ def get_unidentified_item(user=None):
             pick_new = True
         if not pick_new:
             # Get a partially identified item that the user hasn't weighed in on
+            user_entry = aliased(IDEntry)
+            voted = exists().where(and_(user_entry.item_id == IDEntry.item_id, user_entry.cid == user.id))
             with Session(bind=local_engine) as session:
-                query = session.query(IDEntry.item_id).filter(IDEntry.cid == user.id)
-                result = query.all()
-            exclude_ids = []
-            for entry in result:
-                exclude_ids.append(IDEntry.item_id != entry[0])
-            exclude_params = and_(*exclude_ids)
-
-            with Session(bind=local_engine) as session:
-                query = session.query(IDEntry.item_id).filter(exclude_params)
-                result = query.all()
+                query = session.query(IDEntry.item_id).filter(~voted).order_by(func.random()).limit(1)
+                result = query.first()
             if result:
-                choice = random.choice(result)
-                return get_item_data(choice[0])
+                return get_item_data(result[0])
 
-    # Get all the identified items IDs from the local db.
+    item_id = _pick_unidentified_item_id()
+    if item_id is None:
+        return None
+    return get_item_data(item_id)
+
+
+def _build_unidentified_sampler():
+    """Builds a compact array of the item ids that exist and haven't been identified yet."""
     with Session(bind=local_engine) as session:
         query = session.query(IdentifiedItems.item_id)
         result = query.all()
-    ided_items = [item for t in result for item in t]
+    ided_items = set(entry[0] for entry in result)
 
     # Anything from 1000 to 1000000 is a potentially valid item ID.
-    pos_items = list(range(1000, 1000000))
+    with get_session(engine) as session:
+        query = session.query(Item.id).filter(Item.id >= 1000).filter(Item.id < 1000000)
+        result = query.all()
+    return array('I', (entry[0] for entry in result if entry[0] not in ided_items))
 
-    unid = list(set(pos_items) - set(ided_items))
 
-    while True:
-        check_id = random.choice(unid)
-        # See if this item ID exists on THJ
-        with Session(bind=engine) as session:
-            query = session.query(Item.id).filter(Item.id == check_id)
-            result = query.all()
-        if not result:
-            continue
-        # We have a valid ID!  Return it!
-        return get_item_data(result[0][0])
+def _pick_unidentified_item_id():
+    """Picks a random unidentified item id, or None if every item has been identified."""
+    unid = cache.get_versioned('unidentified_sampler', _build_unidentified_sampler)
+    with _sampler_lock:
+        while unid:
+            idx = random.randrange(len(unid))
+            item_id = unid[idx]
+            # Any worker may have identified it since the sampler was built
+            with Session(bind=local_engine) as session:
+                identified = session.query(exists().where(IdentifiedItems.item_id == item_id)).scalar()
+            if not identified:
+                return item_id
+            # Swap it with the last id and drop it
+            unid[idx] = unid[-1]
+            unid.pop()
+    return None
 
 
 def get_leaderboard():
     """Gets the data identification leaderboard"""
-    # Get all contributors
+    # Count every contributor's identification entries in one pass
     with Session(bind=local_engine) as session:
-        query = session.query(Contributor)
+        query = session.query(Contributor.name, Contributor.contributed, func.count(IDEntry.ideid)).\
+            outerjoin(IDEntry, IDEntry.cid == Contributor.id).\
+            group_by(Contributor.cid).\
+            order_by(Contributor.cid)
         result = query.all()
 
     contributors = []
     for entry in result:
-        entry = entry.__dict__
-        contributor = {'contributor': entry['name'], 'contributed': entry['contributed']}
-        with Session(bind=local_engine) as session:
-            query = session.query(IDEntry).filter(IDEntry.cid == entry['id'])
-            result = query.all()
-        contributor.update({'identifications': len(result)})
-        contributors.append(contributor)
-
+        contributors.append({'contributor': entry[0],
+                             'contributed': entry[1],
+                             'identifications': entry[2]})
     return contributors
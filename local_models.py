@@ -0,0 +1,85 @@
+"""Models of the tables in the local sqlite3 database"""
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+LocalBase = declarative_base()
+
+
+class IdentifiedItems(LocalBase):
+    __tablename__ = 'identified_items'
+    iiid = Column(Integer, primary_key=True)
+    item_id = Column(Integer, unique=True)
+    expansion = Column(Integer)
+    source = Column(String)
+    zone_id = Column(Integer)
+
+
+class Contributor(LocalBase):
+    __tablename__ = 'contributor'
+    cid = Column(Integer, primary_key=True)
+    name = Column(String)
+    id = Column(Integer, unique=True)
+    contributed = Column(Integer)
+
+
+class IDEntry(LocalBase):
+    __tablename__ = 'id_entry'
+    ideid = Column(Integer, primary_key=True)
+    item_id = Column(Integer)
+    cid = Column(Integer)
+    expansion = Column(Integer)
+    source = Column(String)
+    zone_id = Column(Integer)
+
+
+class Weights(LocalBase):
+    __tablename__ = 'weights'
+    wid = Column(Integer, primary_key=True)
+    uid = Column(Integer)
+    name = Column(String)
+
+
+class WeightEntry(LocalBase):
+    __tablename__ = 'weight_entry'
+    weid = Column(Integer, primary_key=True)
+    wid = Column(Integer)
+    stat = Column(String)
+    value = Column(Integer)
+
+
+class Restricts(LocalBase):
+    __tablename__ = 'restricts'
+    rid = Column(Integer, primary_key=True)
+    uid = Column(Integer)
+    name = Column(String)
+
+
+class RestrictEntry(LocalBase):
+    __tablename__ = 'restrict_entry'
+    reid = Column(Integer, primary_key=True)
+    rid = Column(Integer)
+    stat = Column(String)
+    value = Column(Integer)
+
+
+class GearList(LocalBase):
+    __tablename__ = 'gear_list'
+    glid = Column(Integer, primary_key=True)
+    uid = Column(Integer)
+    name = Column(String)
+    private = Column(Integer)
+
+
+class GearListEntry(LocalBase):
+    __tablename__ = 'gear_list_entry'
+    gleid = Column(Integer, primary_key=True)
+    glid = Column(Integer)
+    slot = Column(String)
+    augslot = Column(String)
+    item_id = Column(Integer)
+
+
+class UserRevision(LocalBase):
+    __tablename__ = 'user_revision'
+    uid = Column(Integer, primary_key=True)
+    revision = Column(Integer)
@@ -1,13 +1,16 @@
 """EQDB Logic File"""
 import configparser
 import datetime
+import heapq
 import operator
 import os
 
+import item_matrix
 import utils
+from database import create_content_engine, get_session, reflect_metadata
 
 from sqlalchemy import create_engine, and_, or_, Column, Integer
-from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm import aliased
 from sqlalchemy.ext.automap import automap_base
 
 here = os.path.dirname(__file__)
@@ -23,16 +26,29 @@ database = site_config.get('database', 'database')
 host = site_config.get('database', 'host')
 port = site_config.get('database', 'port')
 
-engine = create_engine(f'{driver}{user}:{password}@{host}:{port}/{database}')
-Base = automap_base()
+# Benchmarks point the site at a synthetic content database through EQDB_CONTENT_URL
+content_url = os.environ.get('EQDB_CONTENT_URL', f'{driver}{user}:{password}@{host}:{port}/{database}')
+engine = create_content_engine(content_url, site_config)
+
+# The content tables EQDB reads.  Reflecting just these ('used') skips the rest of the EQEmu schema, 'all' reflects
+# every table.  Either way the reflection is pickled to the reflection cache and reused until the schema changes.
+CONTENT_TABLES = ['zone', 'zone_points', 'items', 'spawn2', 'spawnentry', 'spawngroup', 'npc_types', 'npc_spells',
+                  'npc_spells_entries', 'merchantlist', 'loottable', 'loottable_entries', 'lootdrop_entries',
+                  'lootdrop', 'spells_new', 'forage', 'ground_spawns', 'tradeskill_recipe',
+                  'tradeskill_recipe_entries', 'npc_faction_entries', 'faction_list', 'pets']
+reflect_tables = site_config.get('database', 'reflect_tables', fallback='used')
+reflection_cache = site_config.get('database', 'reflection_cache', fallback=os.path.join(here, 'reflection_cache'))
+metadata = reflect_metadata(engine, reflection_cache, only=CONTENT_TABLES if reflect_tables == 'used' else None)
+Base = automap_base(metadata=metadata)
 
 
 class ItemRedirection(Base):
     __tablename__ = 'items'
+    __table_args__ = {'extend_existing': True}
     id = Column(Integer, primary_key=True)
 
 
-Base.prepare(autoload_with=engine)
+Base.prepare()
 
 Zone = Base.classes.zone
 ZonePoints = Base.classes.zone_points
@@ -147,7 +163,7 @@ def all_search(name=None):
             'spells': spell.get_spells(name),
             'npcs': npc.get_npcs(name),
             'zones': zone.get_zone(name),
-            'factions': faction.get_factions(name)}
+            'factions': faction.get_factions(name, limit=None)}
 
 
 def get_item_data(item_id, full=False):
@@ -156,7 +172,7 @@ def get_item_data(item_id, full=False):
     if item_id in excl_list:
         return None
 
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         # Get the item
         args = _get_arg_list(tooltip=True)
         query = session.query(*args).filter(Item.id == item_id)
@@ -242,7 +258,7 @@ def get_item_data(item_id, full=False):
         item_id = int(item_id)
         if item_id < 1000000:
             # See if Enchanted and Legendary exist
-            with Session(bind=engine) as session:
+            with get_session(engine) as session:
                 ench = item_id + 1000000
                 lego = item_id + 2000000
                 query = session.query(Item.id).filter(or_(Item.id == ench, Item.id == lego))
@@ -260,7 +276,7 @@ def get_item_data(item_id, full=False):
             item_id = item_id - 1000000
         known_zones = {}
         skip_zones = []
-        with Session(bind=engine) as session:
+        with get_session(engine) as session:
             query = session.query(NPCTypes.id, NPCTypes.name, LootDropEntries.chance).filter(LootDropEntries.item_id == item_id).\
                 filter(LootDropEntries.lootdrop_id == LootTableEntries.lootdrop_id).\
                 filter(LootTableEntries.loottable_id == NPCTypes.loottable_id)
@@ -270,23 +286,14 @@ def get_item_data(item_id, full=False):
                 if zone_id in skip_zones:
                     continue
                 if zone_id not in known_zones:
-                    query = session.query(Zone.long_name, Zone.expansion).filter(Zone.zoneidnumber == zone_id)
-                    sub_result = query.first()
-                    if not sub_result:
-                        # Walk through the spawn points instead
-                        query = session.query(Zone.long_name, Zone.expansion, Zone.short_name). \
-                            filter(SpawnEntry.npcID == entry[0]). \
-                            filter(SpawnEntry.spawngroupID == Spawn2.spawngroupID). \
-                            filter(Spawn2.zone == Zone.short_name)
-                        sub_result = query.first()
-
-                    if not sub_result:
+                    zone_record = zone.get_npc_zone(entry[0], session)
+                    if not zone_record:
                         zone_name = 'Unknown'
                     else:
-                        if sub_result[1] > expansion:
+                        if zone_record.expansion > expansion:
                             skip_zones.append(zone_id)
                             continue
-                        zone_name = sub_result[0]
+                        zone_name = zone_record.long_name
                     known_zones.update({zone_id: zone_name})
                 else:
                     zone_name = known_zones[zone_id]
@@ -302,7 +309,7 @@ def get_item_data(item_id, full=False):
 
         # Get vendors that sell this
         vendors = {}
-        with Session(bind=engine) as session:
+        with get_session(engine) as session:
             query = session.query(NPCTypes.id, NPCTypes.name).filter(MerchantList.item == item_id).\
                 filter(MerchantList.merchantid == NPCTypes.merchant_id).\
                 filter(MerchantList.min_expansion <= expansion)
@@ -313,19 +320,12 @@ def get_item_data(item_id, full=False):
             if zone_id in lookup:
                 zone_name = lookup[zone_id]
             else:
-                query = session.query(Zone.long_name, Zone.expansion).filter(Zone.zoneidnumber == zone_id)
-                sub_result = query.first()
-                if not sub_result:
-                    query = session.query(Zone.long_name, Zone.expansion).\
-                        filter(SpawnEntry.npcID == entry[0]).\
-                        filter(SpawnEntry.spawngroupID == Spawn2.spawngroupID).\
-                        filter(Zone.short_name == Spawn2.zone)
-                    sub_result = query.first()
-                    if not sub_result:
-                        continue
-                if sub_result[1] > expansion:
+                zone_record = zone.get_npc_zone(entry[0], session)
+                if not zone_record:
+                    continue
+                if zone_record.expansion > expansion:
                     continue
-                zone_name = sub_result[0]
+                zone_name = zone_record.long_name
                 lookup.update({zone_id: zone_name})
             if zone_name in vendors:
                 vendor_list = vendors[zone_name]
@@ -339,7 +339,7 @@ def get_item_data(item_id, full=False):
 
         # Get where this is foraged from
         foraged = []
-        with Session(bind=engine) as session:
+        with get_session(engine) as session:
             query = session.query(Zone.zoneidnumber, Zone.long_name, Zone.expansion, Forage.chance).\
                 filter(Forage.Itemid == item_id).\
                 filter(Zone.zoneidnumber == Forage.zoneid)
@@ -354,7 +354,7 @@ def get_item_data(item_id, full=False):
 
         # Get where this is a ground spawn
         ground = []
-        with Session(bind=engine) as session:
+        with get_session(engine) as session:
             query = session.query(Zone.zoneidnumber, Zone.long_name, Zone.expansion,
                                   GroundSpawns.min_x, GroundSpawns.min_y, GroundSpawns.respawn_timer).\
                 filter(GroundSpawns.zoneid == Zone.zoneidnumber).\
@@ -372,7 +372,7 @@ def get_item_data(item_id, full=False):
 
         # Get where this is made by tradeskills
         ts_result = []
-        with Session(bind=engine) as session:
+        with get_session(engine) as session:
             query = session.query(TradeskillRecipeEntries.recipe_id, TradeskillRecipe.name).\
                 filter(TradeskillRecipe.id == TradeskillRecipeEntries.recipe_id).\
                 filter(TradeskillRecipeEntries.item_id == orig_item_id).\
@@ -387,7 +387,7 @@ def get_item_data(item_id, full=False):
 
         # Get where this item is used in tradeskills
         ts_component = []
-        with Session(bind=engine) as session:
+        with get_session(engine) as session:
             query = session.query(TradeskillRecipeEntries.recipe_id, TradeskillRecipe.name).\
                 filter(TradeskillRecipe.id == TradeskillRecipeEntries.recipe_id).\
                 filter(TradeskillRecipeEntries.item_id == orig_item_id).\
@@ -403,6 +403,40 @@ def get_item_data(item_id, full=False):
     return ret_dict
 
 
+def get_era_item_ids(era):
+    """Returns the quest, special drop and tradeskill item ids listed for an era, as the strings in its files."""
+    quest_item_ids = []
+    special_item_ids = []
+    ts_item_ids = []
+    # Now, we need to get the quest items.  These are stored in files
+    with open(os.path.join(here, 'item_files', f'{era}.txt'), 'r') as fh:
+        file_data = fh.read()
+    quest_item_ids += file_data.split('\n')
+
+    if era == 'Kunark':
+        # Add LoY
+        if os.path.exists(os.path.join(here, f'item_files/LoY.txt')):
+            with open(os.path.join(here, 'item_files', f'LoY.txt'), 'r') as fh:
+                file_data = fh.read()
+            quest_item_ids += file_data.split('\n')
+        if os.path.exists(os.path.join(here, f'item_files/LoY_ts.txt')):
+            with open(os.path.join(here, f'item_files/LoY_ts.txt'), 'r') as fh:
+                file_data = fh.read()
+            ts_item_ids += file_data.split('\n')
+
+    # Certain expansions have tradeskill items at the highest level, add those
+    if os.path.exists(os.path.join(here, f'item_files/{era}_ts.txt')):
+        with open(os.path.join(here, f'item_files/{era}_ts.txt'), 'r') as fh:
+            file_data = fh.read()
+        ts_item_ids += file_data.split('\n')
+
+    if os.path.exists(os.path.join(here, f'item_files/{era}_special.txt')):
+        with open(os.path.join(here, f'item_files/{era}_special.txt'), 'r') as fh:
+            file_data = fh.read()
+        special_item_ids += file_data.split('\n')
+    return quest_item_ids, special_item_ids, ts_item_ids
+
+
 def get_era_items(kwargs):
     """Returns all base items with NPC names and IDs, as well as Tradeskill and Quest items."""
     # We need to link through to all the NPCs in all the zones of the era to get all the items they drop.
@@ -415,32 +449,10 @@ def get_era_items(kwargs):
         zone_id_list = utils.get_era_zones(era)
         for zone_id in zone_id_list:
             zone_or_filters.append(NPCTypes.id.like(f'{zone_id}___'))
-        # Now, we need to get the quest items.  These are stored in files
-        with open(os.path.join(here, 'item_files', f'{era}.txt'), 'r') as fh:
-            file_data = fh.read()
-        quest_item_ids += file_data.split('\n')
-
-        if era == 'Kunark':
-            # Add LoY
-            if os.path.exists(os.path.join(here, f'item_files/LoY.txt')):
-                with open(os.path.join(here, 'item_files', f'LoY.txt'), 'r') as fh:
-                    file_data = fh.read()
-                quest_item_ids += file_data.split('\n')
-            if os.path.exists(os.path.join(here, f'item_files/LoY_ts.txt')):
-                with open(os.path.join(here, f'item_files/LoY_ts.txt'), 'r') as fh:
-                    file_data = fh.read()
-                ts_item_ids += file_data.split('\n')
-
-        # Certain expansions have tradeskill items at the highest level, add those
-        if os.path.exists(os.path.join(here, f'item_files/{era}_ts.txt')):
-            with open(os.path.join(here, f'item_files/{era}_ts.txt'), 'r') as fh:
-                file_data = fh.read()
-            ts_item_ids += file_data.split('\n')
-
-        if os.path.exists(os.path.join(here, f'item_files/{era}_special.txt')):
-            with open(os.path.join(here, f'item_files/{era}_special.txt'), 'r') as fh:
-                file_data = fh.read()
-            special_item_ids += file_data.split('\n')
+        era_quest_ids, era_special_ids, era_ts_ids = get_era_item_ids(era)
+        quest_item_ids += era_quest_ids
+        special_item_ids += era_special_ids
+        ts_item_ids += era_ts_ids
 
     filters = []
     class_or_filters = []
@@ -512,7 +524,7 @@ def get_era_items(kwargs):
     symp_or_params = or_(*symp_or_filters)
 
     base_items = []
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(Item.id, NPCTypes.id.label('npc_id'), NPCTypes.name.label('npc_name')).\
             filter(zone_or_params).\
             filter(link_params).\
@@ -529,11 +541,8 @@ def get_era_items(kwargs):
         base_items.append(new_item)
 
     if quest_item_ids:
-        item_id_filters = []
-        for entry in quest_item_ids:
-            item_id_filters.append(Item.id == entry)
-        item_id_params = or_(*item_id_filters)
-        with Session(bind=engine) as session:
+        item_id_params = Item.id.in_(quest_item_ids)
+        with get_session(engine) as session:
             query = session.query(Item.id).\
                 filter(item_id_params).\
                 filter(params).\
@@ -546,11 +555,8 @@ def get_era_items(kwargs):
 
     special_items = []
     if special_item_ids:
-        item_id_filters = []
-        for entry in special_item_ids:
-            item_id_filters.append(Item.id == entry)
-        item_id_params = or_(*item_id_filters)
-        with Session(bind=engine) as session:
+        item_id_params = Item.id.in_(special_item_ids)
+        with get_session(engine) as session:
             query = session.query(Item.id).\
                 filter(item_id_params).\
                 filter(params).\
@@ -563,11 +569,8 @@ def get_era_items(kwargs):
 
     ts_items = []
     if ts_item_ids:
-        item_id_filters = []
-        for entry in ts_item_ids:
-            item_id_filters.append(Item.id == entry)
-        item_id_params = or_(*item_id_filters)
-        with Session(bind=engine) as session:
+        item_id_params = Item.id.in_(ts_item_ids)
+        with get_session(engine) as session:
             query = session.query(Item.id).\
                 filter(item_id_params).\
                 filter(params).\
@@ -581,27 +584,29 @@ def get_era_items(kwargs):
 
 
 def create_lookup_table(base_items, tradeskill_items, quest_items, special_items):
-    """Returns item id filters and an associated lookup table."""
+    """Returns the item ids and an associated lookup table."""
     lookup = {}
     item_ids = []
     for entry in base_items + tradeskill_items + quest_items + special_items:
-        item_ids.append(Item.id == entry['id'])
+        item_ids.append(entry['id'])
         lookup.update({entry['id']: {'npc_id': entry['npc_id'], 'npc_name': entry['npc_name']}})
     return item_ids, lookup
 
 
-def get_items_with_filters(weights, ignore_zero, **kwargs):
-    """Returns all items with filters provided"""
+def get_items_with_filters(weights, ignore_zero, limit=None, offset=0, **kwargs):
+    """Returns all items with filters provided, or only the limit heaviest after the first offset, and how many there
+    were in all"""
     # Get the base items, tradeskill items, and quest items that drop from the zones in the eras requested.
     base_items, special_items, quest_items, tradeskill_items = get_era_items(kwargs)
     if not base_items and not tradeskill_items and not quest_items and not special_items:
-        return [], False, False, False
+        return [], False, False, False, 0
 
     # Create the lookup table
     item_ids, lookup_table = create_lookup_table(base_items, tradeskill_items, quest_items, special_items)
 
-    # Set up basic database filters
+    # Set up basic database filters, and those of them the item stat matrix can also apply
     filters = []
+    stat_filters = {}
     focus_or_filters = []
 
     skip_filters = ['item_name', 'g_class_1', 'g_class_2', 'g_class_3', 'g_slot', 'i_type', 'no_rent', 'sub_type',
@@ -628,10 +633,12 @@ def get_items_with_filters(weights, ignore_zero, **kwargs):
                 filters.append(SpellsNew.effect_base_value1 < 0)
         elif entry == 'proc':
             filters.append(Item.proceffect >= 1)
+            stat_filters['proc'] = True
         elif 'proclevel2' in entry:
             filters.append(Item.proclevel2 <= kwargs['proclevel2'])
         elif entry == 'click':
             filters.append(Item.clickeffect >= 1)
+            stat_filters['click'] = True
         elif 'clicklevel2' in entry:
             filters.append(Item.clicklevel2 <= kwargs['clicklevel2'])
         elif 'elemdmgtype' in entry:
@@ -643,31 +650,41 @@ def get_items_with_filters(weights, ignore_zero, **kwargs):
             bane_body = False
             filters.append(Item.banedmgrace == kwargs['banedmgrace'])
         elif 'focus_type' in entry:
-            ids = utils.get_focus_values(kwargs['focus_type'], kwargs['sub_type'], engine, SpellsNew)
-            for focus_id in ids:
-                focus_or_filters.append(Item.focuseffect == focus_id)
-            if kwargs['focus_type'] == 'Melee':
-                for worn_id in ids:
-                    focus_or_filters.append(Item.worneffect == worn_id)
-            if kwargs['focus_type'] == 'Bard':
-                for bard_id in ids:
-                    focus_or_filters.append(Item.bardeffect == bard_id)
+            ids = utils.get_focus_ids(kwargs['focus_type'], kwargs['sub_type'], engine, SpellsNew)
+            # No focus ids leaves the results unfiltered, as an empty or_() does
+            if ids:
+                focus_or_filters.append(Item.focuseffect.in_(ids))
+                if kwargs['focus_type'] == 'Melee':
+                    focus_or_filters.append(Item.worneffect.in_(ids))
+                if kwargs['focus_type'] == 'Bard':
+                    focus_or_filters.append(Item.bardeffect.in_(ids))
         elif 'delay' in entry:
             filters.append(Item.delay <= kwargs['delay'])
+            stat_filters['delay'] = kwargs['delay']
         elif 'procrate' in entry:
             filters.append(Item.procrate >= int(kwargs[entry]))
+            stat_filters['procrate'] = int(kwargs[entry])
         else:
             filters.append(getattr(Item, entry) >= kwargs[entry])
+            stat_filters[entry] = kwargs[entry]
+
+    # Drop the items that fail the stat filters, or weigh nothing, before asking the database for them
+    weight_values = {}
+    matrix = item_matrix.get_item_matrix(engine, Item)
+    if matrix is not None and matrix.covers(weights):
+        item_ids, weight_values = matrix.narrow(item_ids, weights, stat_filters, ignore_zero, bane_body=bane_body)
+        if not item_ids:
+            return [], False, False, False, 0
 
     # Filters are set, run them!
     and_params = and_(*filters)
     focus_or_params = or_(*focus_or_filters)
-    item_params = or_(*item_ids)
+    item_params = Item.id.in_(item_ids)
 
     arg_list = _get_arg_list()
 
     # BEHOLD, THE QUERY
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(*arg_list). \
             join(FocusSpell, FocusSpell.id == Item.focuseffect, isouter=True). \
             join(ClickSpell, ClickSpell.id == Item.clickeffect, isouter=True). \
@@ -680,22 +697,29 @@ def get_items_with_filters(weights, ignore_zero, **kwargs):
             group_by(Item.id)
         all_items = query.all()
 
-    out_items = []
     # If we don't have any items, that's it, return early.
     if not lookup_table:
-        return out_items
+        return [], False, False, False, 0
+    return collect_items([entry._mapping for entry in all_items], lookup_table, weights, weight_values, ignore_zero,
+                         bane_body, kwargs, limit=limit, offset=offset)
+
+
+def collect_items(rows, lookup_table, weights, weight_values, ignore_zero, bane_body, kwargs, limit=None, offset=0):
+    """Turns the item rows an item search found into its results, heaviest first, which spell columns to show and how
+    many items matched.
+
+    weight_values holds each item's weight when they were worked out already, otherwise they are worked out here.
+    With a limit only the limit heaviest items after the first offset are returned, picked without sorting the rest.
+    """
+    out_items = []
     show_worn = False
     show_inst = False
     show_focus = False
-    for entry in all_items:
-        excl_list = utils.get_exclusion_list('item')
-        if entry.id in excl_list:
+    excl_list = utils.get_exclusion_list('item')
+    for entry in rows:
+        if entry['id'] in excl_list:
             continue
-        entry = utils.ReducedItem((dict(entry._mapping)))
-        entry.npc_id = lookup_table[entry.id]['npc_id']
-        entry.npc_name = lookup_table[entry.id]['npc_name']
-        entry.focus_type = kwargs.get('focus_type')
-        entry.sub_focus = kwargs.get('sub_type')
+        entry = utils.ReducedItem(dict(entry))
         if entry.focuseffect > 0:
             show_focus = True
         if entry.worneffect > 0:
@@ -703,17 +727,32 @@ def get_items_with_filters(weights, ignore_zero, **kwargs):
         if entry.bardeffect > 0:
             show_inst = True
 
-        if 'pet_search' in kwargs:
-            pet_search = True
-        else:
-            pet_search = False
-
-        if weights:
+        if weight_values:
+            entry.weight = weight_values[entry.id]
+            if ignore_zero and entry.weight == 0:
+                continue
+        elif weights:
             entry.weight = utils.get_stat_weights(weights, entry, bane_body=bane_body)
             if ignore_zero and entry.weight == 0:
                 continue
         else:
             entry.weight = 0
+        out_items.append(entry)
+
+    total = len(out_items)
+    if limit is None:
+        out_items.sort(key=operator.attrgetter('weight'), reverse=True)
+        out_items = out_items[offset:]
+    else:
+        # Same order as the full sort, ties keep the order they were found in
+        out_items = heapq.nlargest(offset + limit, out_items, key=operator.attrgetter('weight'))[offset:]
+
+    # Only the items being returned need their source worked out
+    for entry in out_items:
+        entry.npc_id = lookup_table[entry.id]['npc_id']
+        entry.npc_name = utils.fix_npc_name(lookup_table[entry.id]['npc_name'])
+        entry.focus_type = kwargs.get('focus_type')
+        entry.sub_focus = kwargs.get('sub_type')
 
         # Add the weapon efficiency
         if entry.delay > 0:
@@ -722,9 +761,4 @@ def get_items_with_filters(weights, ignore_zero, **kwargs):
             w_eff = 0
         entry.w_eff = w_eff
         entry.zone_name = utils.lookup_zone_name(entry.npc_id)
-        entry.npc_name = utils.fix_npc_name(entry.npc_name)
-        
-        out_items.append(entry)
-
-    out_items.sort(key=operator.attrgetter('weight'), reverse=True)
-    return out_items, show_focus, show_worn, show_inst
+    return out_items, show_focus, show_worn, show_inst, total
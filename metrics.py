@@ -0,0 +1,111 @@
+"""EQDB Logic File for the Prometheus style /metrics endpoint"""
+import bisect
+import threading
+import time
+
+from flask import Response, g, request
+
+import cache
+import database
+import instrumentation
+
+# Upper bounds, in seconds, of the route latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+# {blueprint: [bucket counts..., +Inf count, sum of seconds]}
+_latency = {}
+# {(blueprint, status): count}
+_requests = {}
+# {blueprint: count}
+_queries = {}
+
+
+def observe(blueprint, status, elapsed, queries):
+    """Records one finished request."""
+    with _lock:
+        histogram = _latency.setdefault(blueprint, [0] * (len(LATENCY_BUCKETS) + 2))
+        histogram[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        histogram[-1] += elapsed
+        _requests[(blueprint, status)] = _requests.get((blueprint, status), 0) + 1
+        _queries[blueprint] = _queries.get(blueprint, 0) + queries
+
+
+def _format_le(bound):
+    return f'{bound:g}'
+
+
+def render(engine):
+    """Returns every metric in the Prometheus text exposition format."""
+    with _lock:
+        latency = {blueprint: list(histogram) for blueprint, histogram in _latency.items()}
+        requests = dict(_requests)
+        queries = dict(_queries)
+
+    lines = ['# HELP eqdb_request_duration_seconds Route latency by blueprint.',
+             '# TYPE eqdb_request_duration_seconds histogram']
+    for blueprint, histogram in sorted(latency.items()):
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), histogram[:-1]):
+            total += count
+            le = '+Inf' if bound == float('inf') else _format_le(bound)
+            lines.append(f'eqdb_request_duration_seconds_bucket{{blueprint="{blueprint}",le="{le}"}} {total}')
+        lines.append(f'eqdb_request_duration_seconds_sum{{blueprint="{blueprint}"}} {histogram[-1]:.6f}')
+        lines.append(f'eqdb_request_duration_seconds_count{{blueprint="{blueprint}"}} {total}')
+
+    lines.extend(['# HELP eqdb_requests_total Requests served by blueprint and status.',
+                  '# TYPE eqdb_requests_total counter'])
+    for (blueprint, status), count in sorted(requests.items()):
+        lines.append(f'eqdb_requests_total{{blueprint="{blueprint}",status="{status}"}} {count}')
+
+    lines.extend(['# HELP eqdb_db_queries_total SQL statements run by blueprint.',
+                  '# TYPE eqdb_db_queries_total counter'])
+    for blueprint, count in sorted(queries.items()):
+        lines.append(f'eqdb_db_queries_total{{blueprint="{blueprint}"}} {count}')
+
+    pool = database.get_pool_stats(engine)
+    for name, kind, key, description in [('size', 'gauge', 'size', 'Configured pool size.'),
+                                         ('checked_out', 'gauge', 'checked_out', 'Connections in use.'),
+                                         ('checked_in', 'gauge', 'checked_in', 'Idle connections.'),
+                                         ('overflow', 'gauge', 'overflow', 'Connections beyond pool_size.'),
+                                         ('checkouts_total', 'counter', 'checkouts', 'Connections checked out.'),
+                                         ('timeouts_total', 'counter', 'timeouts', 'Checkouts that timed out.'),
+                                         ('wait_seconds_total', 'counter', 'wait_total',
+                                          'Time spent waiting for a connection.'),
+                                         ('wait_seconds_max', 'gauge', 'wait_max', 'Longest wait for a connection.')]:
+        lines.extend([f'# HELP eqdb_db_pool_{name} {description}',
+                      f'# TYPE eqdb_db_pool_{name} {kind}',
+                      f'eqdb_db_pool_{name} {pool[key]:g}'])
+
+    stats = cache.get_stats()
+    lines.extend(['# HELP eqdb_cache_hits_total Cache lookups answered from the cache.',
+                  '# TYPE eqdb_cache_hits_total counter'])
+    lines.extend(f'eqdb_cache_hits_total{{cache="{name}"}} {counts["hits"]}' for name, counts in sorted(stats.items()))
+    lines.extend(['# HELP eqdb_cache_misses_total Cache lookups that had to be built.',
+                  '# TYPE eqdb_cache_misses_total counter'])
+    lines.extend(f'eqdb_cache_misses_total{{cache="{name}"}} {counts["misses"]}'
+                 for name, counts in sorted(stats.items()))
+    lines.extend(['# HELP eqdb_cache_hit_ratio Fraction of lookups answered from the cache.',
+                  '# TYPE eqdb_cache_hit_ratio gauge'])
+    for name, counts in sorted(stats.items()):
+        lookups = counts['hits'] + counts['misses']
+        lines.append(f'eqdb_cache_hit_ratio{{cache="{name}"}} {counts["hits"] / lookups if lookups else 0:.4f}')
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app, engine):
+    """Times every request by blueprint and serves the totals at /metrics."""
+    @app.before_request
+    def _start_metrics_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_metrics(response):
+        if request.endpoint != 'metrics' and 'metrics_start' in g:
+            observe(request.blueprint or 'main', response.status_code, time.perf_counter() - g.metrics_start,
+                    instrumentation.get_request_stats()['queries'])
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render(engine), mimetype='text/plain; version=0.0.4')
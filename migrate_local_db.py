@@ -0,0 +1,85 @@
+"""Upgrades the local sqlite3 database in place to the current schema version"""
+import argparse
+import configparser
+import os
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+import local_models
+
+here = os.path.dirname(__file__)
+site_config = configparser.RawConfigParser()
+ini_path = os.path.join(here, 'configuration.ini')
+site_config.read(ini_path)
+local_database = site_config.get('local_database', 'connection', fallback='sqlite:///local_db.db')
+
+
+def _create_tables(conn):
+    """Creates any missing tables, and the anonymous contributor."""
+    local_models.LocalBase.metadata.create_all(conn)
+    with Session(bind=conn) as session:
+        query = session.query(local_models.Contributor).filter(local_models.Contributor.id == -1)
+        if not query.first():
+            session.add(local_models.Contributor(name='Anonymous', id=-1, contributed=1))
+            session.flush()
+
+
+def _add_lookup_indexes(conn):
+    """Indexes every column the site looks rows up by."""
+    for table, column in [('id_entry', 'item_id'), ('id_entry', 'cid'),
+                          ('weights', 'uid'), ('weight_entry', 'wid'),
+                          ('restricts', 'uid'), ('restrict_entry', 'rid'),
+                          ('gear_list', 'uid'), ('gear_list_entry', 'glid')]:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})'))
+
+
+def _add_user_revisions(conn):
+    """Adds the table counting each user's weight and restrict set writes, which their cached sets are keyed on."""
+    local_models.UserRevision.__table__.create(conn, checkfirst=True)
+
+
+# Each migration brings the database up to its position in this list (1 based), tracked in PRAGMA user_version
+MIGRATIONS = [_create_tables,
+              _add_lookup_indexes,
+              _add_user_revisions]
+
+
+def get_version(engine):
+    """Returns the schema version of the database."""
+    with engine.connect() as conn:
+        return conn.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def upgrade(engine, target=None):
+    """Runs every migration the database hasn't had yet, up to target (or the latest), each in its own transaction."""
+    if target is None:
+        target = len(MIGRATIONS)
+    version = get_version(engine)
+    for number in range(version + 1, target + 1):
+        with engine.begin() as conn:
+            MIGRATIONS[number - 1](conn)
+            conn.exec_driver_sql(f'PRAGMA user_version = {number}')
+        print(f'Upgraded local database to version {number}')
+
+    # WAL is a property of the database file, so it only needs setting once
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+    return get_version(engine)
+
+
+def main():
+    """Main execution"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database', default=local_database,
+                        help='Local database connection string (default: [local_database] connection)')
+    parser.add_argument('--target', type=int, default=None, help='Schema version to upgrade to (default: latest)')
+    args = parser.parse_args()
+
+    engine = create_engine(args.database)
+    version = upgrade(engine, target=args.target)
+    print(f'Local database is at version {version}')
+
+
+if __name__ == '__main__':
+    main()
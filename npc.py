@@ -1,19 +1,22 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import aliased
 
+import cache
 import utils
+from database import get_session
+from zone import get_zone_catalog, get_npc_zone, ZoneRecord
 from logic import engine, NPCTypes, FactionList, NPCFactionEntries, MerchantList, Item, expansion, NPCSpells, \
-    SpellsNew, NPCSpellsEntries, LootTableEntries, LootDrop, LootDropEntries, Spawn2, SpawnEntry, SpawnGroup, \
-    Zone
+    SpellsNew, NPCSpellsEntries, LootTableEntries, LootDrop, LootDropEntries, Spawn2, SpawnEntry, SpawnGroup
 
 
 def get_npcs(npc_name):
     npc_name = npc_name.replace(' ', '_')
     partial = "%%%s%%" % npc_name
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(NPCTypes.id, NPCTypes.name, NPCTypes.level, NPCTypes.hp).\
             filter(NPCTypes.name.like(partial)).limit(50)
         result = query.all()
 
+    catalog = get_zone_catalog()
     out_data = []
     for entry in result:
         npc_id = entry[0]
@@ -24,24 +27,20 @@ def get_npcs(npc_name):
         zone_id = int(npc_id/1000)
         level = entry[2]
         hp = entry[3]
-        with Session(bind=engine) as session:
-            query = session.query(Zone.long_name, Zone.expansion, Zone.short_name).filter(Zone.zoneidnumber == zone_id)
-            sub_result = query.first()
+        sub_result = catalog.get(zone_id)
 
         if not sub_result:
             continue
 
-        if int(sub_result[1]) > expansion:
+        if int(sub_result.expansion) > expansion:
             continue
 
-        if sub_result[2] in ['cshome', 'hateplane', 'powar', 'soldungc', 'qvicb']:
+        if sub_result.short_name in ['cshome', 'hateplane', 'powar', 'soldungc', 'qvicb']:
             continue
 
-        if not sub_result:
-            sub_result = ['Unknown']
         out_data.append({'npc_id': npc_id,
                          'name': utils.fix_npc_name(npc_name),
-                         'zone': sub_result[0],
+                         'zone': sub_result.long_name,
                          'level': level,
                          'hp': hp})
     return out_data
@@ -52,7 +51,7 @@ def get_npc_detail(npc_id):
     if npc_id in excl_list:
         return None
     # Get basic npc details:
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(NPCTypes).filter(NPCTypes.id == npc_id)
         result = query.first()
     if not result:
@@ -68,7 +67,7 @@ def get_npc_detail(npc_id):
 
     # Get faction changes for defeating this mob
     factions = []
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(FactionList.name, FactionList.id, NPCFactionEntries.value).\
             filter(NPCFactionEntries.npc_faction_id == base_data['npc_faction_id']).\
             filter(FactionList.id == NPCFactionEntries.faction_id)
@@ -84,11 +83,11 @@ def get_npc_detail(npc_id):
     base_data.update({'special_attacks': utils.translate_specials(result.npcspecialattks)})
 
     # Get the spells this NPC uses
-    spells = []
+    spells = get_spell_sets([base_data['npc_spells_id']])[base_data['npc_spells_id']]
     loot_lists = {}
     spawn_groups = []
     merch = []
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         # If this is a merchant, get it's merchant items
         query = session.query(MerchantList.item, Item.Name, MerchantList.min_expansion, Item.icon).\
             filter(MerchantList.merchantid == npc_id).\
@@ -102,55 +101,6 @@ def get_npc_detail(npc_id):
                           'icon': entry[3]})
         base_data['merch'] = merch
 
-        # Get proc spell
-        query = session.query(NPCSpells.attack_proc, SpellsNew.name,
-                              NPCSpells.proc_chance, SpellsNew.new_icon).\
-            filter(NPCSpells.id == base_data['npc_spells_id']).\
-            filter(NPCSpells.attack_proc == SpellsNew.id)
-        result = query.first()
-        if result:
-            spells.append({'spell_type': 'proc',
-                           'spell_name': result[1],
-                           'spell_id': result[0],
-                           'proc_chance': result[2],
-                           'icon': result[3]})
-        # Get defensive proc spell
-        query = session.query(NPCSpells.defensive_proc, SpellsNew.name,
-                              NPCSpells.dproc_chance, SpellsNew.new_icon).\
-            filter(NPCSpells.id == base_data['npc_spells_id']).\
-            filter(NPCSpells.defensive_proc == SpellsNew.id)
-        result = query.first()
-        if result:
-            spells.append({'spell_type': 'defensive',
-                           'spell_name': result[1],
-                           'spell_id': result[0],
-                           'proc_chance': result[2],
-                           'icon': result[3]})
-        # Get ranged proc spell
-        query = session.query(NPCSpells.range_proc, SpellsNew.name,
-                              NPCSpells.rproc_chance, SpellsNew.new_icon).\
-            filter(NPCSpells.id == base_data['npc_spells_id']).\
-            filter(NPCSpells.range_proc == SpellsNew.id)
-        result = query.first()
-        if result:
-            spells.append({'spell_type': 'ranged',
-                           'spell_name': result[1],
-                           'spell_id': result[0],
-                           'proc_chance': result[2],
-                           'icon': result[3]})
-
-        # Get all cast spells
-        query = session.query(NPCSpellsEntries.spellid, SpellsNew.name, SpellsNew.new_icon).\
-            filter(NPCSpellsEntries.npc_spells_id == base_data['npc_spells_id']).\
-            filter(NPCSpellsEntries.spellid == SpellsNew.id)
-        result = query.all()
-        for entry in result:
-            spells.append({'spell_type': 'cast',
-                           'spell_name': entry[1],
-                           'spell_id': entry[0],
-                           'proc_chance': None,
-                           'icon': entry[2]})
-
         # Get the loot lists
         query = session.query(LootTableEntries).\
             filter(LootTableEntries.loottable_id == base_data['loottable_id'])
@@ -214,27 +164,18 @@ def get_npc_detail(npc_id):
         # Translate the spawn ID into a zone id, then get that name
         zone_id = int(npc_id / 1000)
         if zone_id != 0:
-            query = session.query(Zone.long_name, Zone.expansion, Zone.short_name).filter(Zone.zoneidnumber == zone_id)
-            result = query.first()
-            if not result:
-                # Walk through the spawn points instead
-                query = session.query(Zone.long_name, Zone.expansion, Zone.short_name).\
-                    filter(SpawnEntry.npcID == npc_id).\
-                    filter(SpawnEntry.spawngroupID == Spawn2.spawngroupID).\
-                    filter(Spawn2.zone == Zone.short_name)
-                result = query.first()
+            result = get_npc_zone(npc_id, session)
         else:
-            result = ['Unknown', 0, 'Unknown']
+            result = ZoneRecord(0, 'Unknown', 'Unknown', 0, 0)
         if not result:
             base_data['zone_name'] = 'Unknown'
             base_data['expansion'] = 'Unknown'
             base_data['mapping'] = []
         else:
-            base_data['zone_name'] = result[0]
-            base_data['expansion'] = utils.get_era_name(result[1])
-            short_name = result[2]
+            base_data['zone_name'] = result.long_name
+            base_data['expansion'] = utils.get_era_name(result.expansion)
             # Get the mapping
-            base_data['mapping'] = utils.get_map_data(short_name)
+            base_data['mapping'] = utils.get_map_data(result.short_name)
         base_data['zone_id'] = zone_id
         base_data['loot_lists'] = loot_lists
         base_data['spells'] = spells
@@ -246,7 +187,7 @@ def get_npc_raw_data(npc_id=None, name=None, zone=None):
     excl_list = utils.get_exclusion_list('npcs')
     if npc_id in excl_list:
         return None
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         if npc_id:
             query = session.query(NPCTypes).filter(NPCTypes.id == npc_id)
             result = query.one()
@@ -256,9 +197,7 @@ def get_npc_raw_data(npc_id=None, name=None, zone=None):
         else:
             ret_list = []
             if zone:
-                query = session.query(Zone.zoneidnumber).filter(Zone.short_name == zone)
-                result = query.one()
-                zone_id = result[0]
+                zone_id = get_zone_catalog().get_by_short_name(zone).zone_id
                 query = session.query(NPCTypes).filter(NPCTypes.id.like(f'{zone_id}___')).\
                     filter(NPCTypes.name.like('%%%s%%' % name))
             else:
@@ -271,3 +210,58 @@ def get_npc_raw_data(npc_id=None, name=None, zone=None):
                     continue
                 ret_list.append(entry)
             return ret_list
+
+
+def get_spell_sets(npc_spells_ids):
+    """Returns the procs and cast spells of every npc_spells_id given, as {npc_spells_id: [spells]}.
+
+    Spell sets are cached per npc_spells_id, so only ids not seen in this content version hit the database.
+    """
+    return cache.get_versioned_items('npc_spell_sets', npc_spells_ids, _load_spell_sets, maxsize=4096)
+
+
+def _load_spell_sets(npc_spells_ids):
+    """Loads the spell sets of every npc_spells_id given using two queries."""
+    spell_sets = {}
+    for npc_spells_id in npc_spells_ids:
+        spell_sets.update({npc_spells_id: []})
+
+    AttackSpell = aliased(SpellsNew)
+    DefensiveSpell = aliased(SpellsNew)
+    RangedSpell = aliased(SpellsNew)
+    with get_session(engine) as session:
+        # Get the attack, defensive, and ranged procs
+        query = session.query(NPCSpells.id,
+                              NPCSpells.attack_proc, AttackSpell.name, NPCSpells.proc_chance, AttackSpell.new_icon,
+                              NPCSpells.defensive_proc, DefensiveSpell.name, NPCSpells.dproc_chance,
+                              DefensiveSpell.new_icon,
+                              NPCSpells.range_proc, RangedSpell.name, NPCSpells.rproc_chance, RangedSpell.new_icon).\
+            join(AttackSpell, AttackSpell.id == NPCSpells.attack_proc, isouter=True).\
+            join(DefensiveSpell, DefensiveSpell.id == NPCSpells.defensive_proc, isouter=True).\
+            join(RangedSpell, RangedSpell.id == NPCSpells.range_proc, isouter=True).\
+            filter(NPCSpells.id.in_(npc_spells_ids))
+        result = query.all()
+        for entry in result:
+            spells = spell_sets[entry[0]]
+            for spell_type, offset in [('proc', 1), ('defensive', 5), ('ranged', 9)]:
+                if entry[offset + 1] is None:
+                    continue
+                spells.append({'spell_type': spell_type,
+                               'spell_name': entry[offset + 1],
+                               'spell_id': entry[offset],
+                               'proc_chance': entry[offset + 2],
+                               'icon': entry[offset + 3]})
+
+        # Get all cast spells
+        query = session.query(NPCSpellsEntries.npc_spells_id, NPCSpellsEntries.spellid, SpellsNew.name,
+                              SpellsNew.new_icon).\
+            filter(NPCSpellsEntries.npc_spells_id.in_(npc_spells_ids)).\
+            filter(NPCSpellsEntries.spellid == SpellsNew.id)
+        result = query.all()
+        for entry in result:
+            spell_sets[entry[0]].append({'spell_type': 'cast',
+                                         'spell_name': entry[2],
+                                         'spell_id': entry[1],
+                                         'proc_chance': None,
+                                         'icon': entry[3]})
+    return spell_sets
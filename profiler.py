@@ -0,0 +1,84 @@
+"""EQDB Logic File for the sampling request profiler"""
+import collections
+import os
+import random
+import sys
+import threading
+import time
+
+from flask import g, request
+
+_lock = threading.Lock()
+# {thread id: Counter of collapsed stacks} for every request being sampled
+_active = {}
+_sampler = None
+
+
+def _frame_name(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def _collapse(frame):
+    """Returns frame's stack, outermost first, in the collapsed format flamegraph tools read."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _sample_forever(interval):
+    while True:
+        time.sleep(interval)
+        frames = sys._current_frames()
+        with _lock:
+            for thread_id, stacks in _active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[_collapse(frame)] += 1
+
+
+def _start_sampler(interval):
+    global _sampler
+    with _lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_forever, args=(interval,), name='eqdb-profiler', daemon=True)
+            _sampler.start()
+
+
+def write_profile(output_dir, stacks, elapsed):
+    """Writes one request's samples to output_dir and returns the file's path."""
+    os.makedirs(output_dir, exist_ok=True)
+    endpoint = (request.endpoint or 'unknown').replace('.', '-')
+    path = os.path.join(output_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}-{elapsed * 1000:.0f}ms-'
+                                    f'{threading.get_ident()}.folded')
+    with open(path, 'w') as fh:
+        for stack, count in stacks.most_common():
+            fh.write(f'{stack} {count}\n')
+    return path
+
+
+def init_app(app, output_dir, threshold=1.0, sample_rate=0.0, interval=0.005, log=None):
+    """Samples the stack of every request each interval seconds, keeping the samples of requests that took at
+    least threshold seconds plus a random sample_rate fraction of the rest as collapsed stack files in output_dir.
+    """
+    @app.before_request
+    def _start_profile():
+        _start_sampler(interval)
+        g.profile_start = time.perf_counter()
+        g.profile_always = random.random() < sample_rate
+        with _lock:
+            _active[threading.get_ident()] = collections.Counter()
+
+    @app.teardown_request
+    def _finish_profile(error):
+        with _lock:
+            stacks = _active.pop(threading.get_ident(), None)
+        if stacks is None or 'profile_start' not in g:
+            return
+        elapsed = time.perf_counter() - g.profile_start
+        if stacks and (elapsed >= threshold or g.profile_always):
+            path = write_profile(output_dir, stacks, elapsed)
+            if log:
+                log.info(f'profiled path={request.path} total_ms={elapsed * 1000:.1f} '
+                         f'samples={sum(stacks.values())} file={path}')
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 
+import database
 import item
+import logic
 import npc
 import spell
 import tradeskill
@@ -12,7 +14,7 @@ api_pages = Blueprint('apis', __name__, template_folder='templates')
 def get_loot_json():
     loot_id = request.args.get('id')
     npc_id = request.args.get('npc_id')
-    data = items.get_loot_json(loot_id=loot_id, npc_id=npc_id)
+    data = item.get_loot_json(loot_id=loot_id, npc_id=npc_id)
     return jsonify(data)
 
 
@@ -38,7 +40,7 @@ def get_item_json():
     name = request.args.get('name')
     item_id = request.args.get('id')
     i_type = request.args.get('type')
-    data = items.get_item_json(name=name, item_id=item_id, i_type=i_type)
+    data = item.get_item_json(name=name, item_id=item_id, i_type=i_type)
     return jsonify(data)
 
 
@@ -48,3 +50,8 @@ def get_spell_json():
     spell_id = request.args.get('id')
     data = spell.get_spell_raw_data(spell_id=spell_id, spell_name=name)
     return jsonify(data)
+
+
+@api_pages.route("/api/v1/pool")
+def get_pool_json():
+    return jsonify(database.get_pool_stats(logic.engine))
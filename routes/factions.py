@@ -4,6 +4,8 @@ import faction
 
 faction_pages = Blueprint('factions', __name__, template_folder='templates')
 
+PAGE_SIZE = 50
+
 
 @faction_pages.route("/faction/detail/<int:faction_id>")
 def faction_detail(faction_id):
@@ -25,5 +27,9 @@ def faction_search():
         if not faction_name.isascii():
             flash('Only ASCII characters are allowed.')
             return redirect(url_for('npc_search'))
-        data = faction.get_factions(faction_name)
-        return render_template('faction_search_result.html', data=data)
+        page = max(request.form.get('page', 1, type=int), 1)
+        # Ask for one extra row to know whether there is another page
+        data = faction.get_factions(faction_name, limit=PAGE_SIZE + 1, offset=(page - 1) * PAGE_SIZE)
+        has_next = len(data) > PAGE_SIZE
+        return render_template('faction_search_result.html', data=data[:PAGE_SIZE], faction_name=faction_name,
+                               page=page, has_next=has_next)
@@ -3,15 +3,18 @@ import time
 from math import ceil
 
 from sqlalchemy import and_
-from sqlalchemy.orm import Session
 
+import cache
 import item
 import logic
 import utils
 import zone
+from database import get_session
 from logic import SpellsNew, engine, Item
 
 LEVEL_CAP = 65
+# Parsed spell slots kept per content version, see get_spell_effects
+SPELL_EFFECT_CACHE_SIZE = 20000
 
 
 def get_full_spell_data(spell_id):
@@ -30,7 +33,7 @@ def get_full_spell_data(spell_id):
     bard = []
     scroll = []
 
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         # Find all the items that have this as a proc
         query = session.query(logic.Item.id, Item.Name, Item.icon).filter(Item.proceffect == spell_id)
         result = query.all()
@@ -128,12 +131,12 @@ def get_spell_tooltip(spell_id):
 
 def get_spells(spell_name):
     partial = "%%%s%%" % spell_name
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(SpellsNew.id, SpellsNew.name, SpellsNew.new_icon).\
             filter(SpellsNew.name.like(partial)).limit(50)
         result = query.all()
 
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(SpellsNew.id, SpellsNew.name, SpellsNew.new_icon).\
             filter(SpellsNew.name.like(partial)).limit(50)
         result2 = query.all()
@@ -160,7 +163,7 @@ def get_spell_raw_data(spell_id=None, spell_name=None):
     excl_list = utils.get_exclusion_list('spells')
     if spell_id in excl_list:
         return None
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         if spell_id:
             query = session.query(SpellsNew).filter(SpellsNew.id == spell_id)
             result = query.first()
@@ -195,13 +198,12 @@ def translate_result(entry):
     skill = utils.parse_skill(entry.skill)
     target = parse_target_type(int(entry.targettype))
     icon = entry.new_icon
-    slots = {}
+    slots = cache.get_versioned_item('spell_effects', (spell_id, True), lambda: parse_slots(entry, no_item_links=True),
+                                     maxsize=SPELL_EFFECT_CACHE_SIZE)
     dot = False
     for idx in range(1, 13):
-        if getattr(entry, f'effectid{idx}') != 254:
-            slots.update({f'slot_{idx}': parse_slot_data(idx, entry, no_item_links=True)})
-            if getattr(entry, f'effectid{idx}') == 0:
-                dot = True
+        if getattr(entry, f'effectid{idx}') == 0:
+            dot = True
     if entry.buffduration > 0:
         instant = False
     else:
@@ -219,7 +221,7 @@ def get_spells_by_class(class_id, min_level=1, max_level=65):
                getattr(SpellsNew, f'classes{class_id}') <= max_level]
     params = and_(*filters)
 
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         args = [SpellsNew.id, SpellsNew.classes1, SpellsNew.classes2,
                 SpellsNew.classes3, SpellsNew.classes4, SpellsNew.classes5,
                 SpellsNew.classes6, SpellsNew.classes7, SpellsNew.classes8,
@@ -268,7 +270,7 @@ def get_spells_by_class(class_id, min_level=1, max_level=65):
         level_list.append(parsed)
 
         if entry.RecourseLink > 0:
-            with Session(bind=engine) as session:
+            with get_session(engine) as session:
                 query = session.query(*args).filter(SpellsNew.id == entry.RecourseLink)
                 sub_result = query.one()
             parsed = translate_result(sub_result)
@@ -286,7 +288,7 @@ def get_spell_data(spell_id, basic_data=True, skip_effect=False):
         return None, None
 
     # Get the spell data
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(SpellsNew).filter(SpellsNew.id == spell_id)
         result = query.first()
 
@@ -330,10 +332,8 @@ def get_spell_data(spell_id, basic_data=True, skip_effect=False):
     else:
         base = {}
 
-    slots = {}
-    for idx in range(1, 13):
-        if getattr(result, f'effectid{idx}') != 254:
-            slots.update({f'slot_{idx}': parse_slot_data(idx, result)})
+    slots = cache.get_versioned_item('spell_effects', (spell_id, False), lambda: parse_slots(result),
+                                     maxsize=SPELL_EFFECT_CACHE_SIZE)
 
     if result.RecourseLink > 0:
         recourse_base, recourse_slots = get_spell_data(result.RecourseLink)
@@ -425,6 +425,41 @@ def get_spell_min_level(data):
     return min_level
 
 
+def _load_spell_effects(keys):
+    excl_list = utils.get_exclusion_list('spells')
+    effects = dict.fromkeys(keys)
+    spell_ids = [spell_id for spell_id, _ in keys if spell_id not in excl_list]
+    # Keep each IN list well under the bound parameter limits
+    for start in range(0, len(spell_ids), 500):
+        with get_session(engine) as session:
+            query = session.query(SpellsNew).filter(SpellsNew.id.in_(spell_ids[start:start + 500]))
+            result = query.all()
+        for entry in result:
+            for no_item_links in (False, True):
+                if (entry.id, no_item_links) in effects:
+                    effects[(entry.id, no_item_links)] = parse_slots(entry, no_item_links=no_item_links)
+    return effects
+
+
+def get_spell_effects(spell_ids, no_item_links=False):
+    """Returns {spell id: parsed slots, as get_spell_data returns them} for spell_ids.  Each spell is parsed once
+    and kept until the content changes, unknown and excluded spells are None.
+    """
+    spell_ids = list(dict.fromkeys(spell_ids))
+    effects = cache.get_versioned_items('spell_effects', [(spell_id, no_item_links) for spell_id in spell_ids],
+                                        _load_spell_effects, maxsize=SPELL_EFFECT_CACHE_SIZE)
+    return {spell_id: effects[(spell_id, no_item_links)] for spell_id in spell_ids}
+
+
+def parse_slots(data, no_item_links=False):
+    """Returns {slot name: parse_slot_data} for every slot of a spell that holds an effect."""
+    slots = {}
+    for idx in range(1, 13):
+        if getattr(data, f'effectid{idx}') != 254:
+            slots.update({f'slot_{idx}': parse_slot_data(idx, data, no_item_links=no_item_links)})
+    return slots
+
+
 def parse_slot_data(idx, data, no_item_links=False):
     spa = getattr(data, f'effectid{idx}')
     min_val = getattr(data, f'effect_base_value{idx}')
@@ -2520,7 +2555,7 @@ def get_spell_name(spell_id):
     excl_list = utils.get_exclusion_list('spells')
     if spell_id in excl_list:
         return None
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(SpellsNew.name).filter(SpellsNew.id == spell_id)
         result = query.first()
 
@@ -2532,7 +2567,7 @@ def get_spell_name(spell_id):
 
 def get_spell_group_name(group_id):
     excl_list = utils.get_exclusion_list('spells')
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(SpellsNew.id, SpellsNew.name).filter(SpellsNew.spellgroup == group_id)
         result = query.first()
 
@@ -1,7 +1,7 @@
 from sqlalchemy import and_
-from sqlalchemy.orm import Session
 
 import utils
+from database import get_session
 from logic import TradeskillRecipe, engine, TradeskillRecipeEntries, Item, expansion
 
 
@@ -11,7 +11,7 @@ def get_tradeskill_detail(ts_id):
         return None
     # Get the tradeskill base details
     base_data = {}
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         args = [TradeskillRecipe.name, TradeskillRecipe.tradeskill, TradeskillRecipe.skillneeded,
                 TradeskillRecipe.trivial, TradeskillRecipe.nofail, TradeskillRecipe.replace_container,
                 TradeskillRecipe.must_learn, TradeskillRecipe.enabled, TradeskillRecipe.min_expansion]
@@ -32,7 +32,7 @@ def get_tradeskill_detail(ts_id):
                       'expansion': expansion})
 
     # Get the items involved in making the recipe
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         args = [TradeskillRecipeEntries.item_id, Item.Name, TradeskillRecipeEntries.successcount,
                 TradeskillRecipeEntries.failcount, TradeskillRecipeEntries.componentcount, Item.icon]
         query = session.query(*args).filter(TradeskillRecipeEntries.recipe_id == ts_id).\
@@ -72,7 +72,7 @@ def get_tradeskill_detail(ts_id):
 
     # Get the containers
     containers = []
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(TradeskillRecipeEntries.item_id, TradeskillRecipeEntries.iscontainer).\
             filter(TradeskillRecipeEntries.recipe_id == ts_id).\
             filter(TradeskillRecipeEntries.iscontainer >= 1)
@@ -82,7 +82,7 @@ def get_tradeskill_detail(ts_id):
         try:
             containers.append({'container_type': utils.get_object_type(entry[0])})
         except NotImplementedError:
-            with Session(bind=engine) as session:
+            with get_session(engine) as session:
                 query = session.query(Item.Name).filter(Item.id == entry[0])
                 sub_result = query.one()
             containers.append({'container_type': sub_result[0]})
@@ -106,7 +106,7 @@ def get_tradeskills(name=None, trivial=None, tradeskill=None, remove_no_fail=Fal
         filters.append(TradeskillRecipe.nofail != 1)
 
     params = and_(*filters)
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(TradeskillRecipe.id, TradeskillRecipe.name, TradeskillRecipe.trivial).filter(params)
         result = query.all()
 
@@ -125,7 +125,7 @@ def get_tradeskill_json(ts_id=None, ts_name=None):
     excl_list = utils.get_exclusion_list('tradeskill')
     if ts_id in excl_list:
         return []
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         if ts_id:
             query = session.query(TradeskillRecipe).filter(TradeskillRecipe.id == ts_id)
             result = query.one()
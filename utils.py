@@ -1,8 +1,11 @@
 """Utilities for EQDB"""
+import functools
 import os
 
 from sqlalchemy import and_, or_
-from sqlalchemy.orm import Session
+
+import cache
+from database import get_session
 
 here = os.path.dirname(__file__)
 
@@ -96,169 +99,30 @@ def get_spell_class(class_num):
         return 'Berserker'
 
 
+def _parse_number(value):
+    return float(value) if '.' in value else int(value)
+
+
+def _load_zone_waypoints():
+    """Loads the zone waypoint table (short_name, x, y, z) from its data file."""
+    waypoints = {}
+    with open(os.path.join(here, 'item_files', 'waypoints.txt'), 'r') as fh:
+        for line in fh.read().split('\n'):
+            if not line.strip():
+                continue
+            short_name, x, y, z = line.split('\t')
+            waypoints.update({short_name: {'y': _parse_number(y), 'x': _parse_number(x), 'z': _parse_number(z)}})
+    return waypoints
+
+
+_zone_waypoints = _load_zone_waypoints()
+
+
 def get_zone_waypoint(short_name):
-    if short_name == 'blackburrow':
-        return {'y': 38, 'x': -7, 'z': 3}
-    elif short_name == 'commons':
-        return {'y': -127, 'x': 503, 'z': -51}
-    elif short_name == 'ecommons':
-        return {'y': -1603, 'x': -356, 'z': 3}
-    elif short_name == 'feerrott':
-        return {'y': -430, 'x': -1830, 'z': -51}
-    elif short_name == 'freportw':
-        return {'y': -283, 'x': -396, 'z': -23}
-    elif short_name == 'grobb':
-        return {'y': 223, 'x': -200, 'z': 3.75}
-    elif short_name == 'everfrost':
-        return {'y': 2133, 'x': -6972, 'z': -58}
-    elif short_name == 'halas':
-        return {'y': 26, 'x': 0, 'z': 3.75}
-    elif short_name == 'highkeep':
-        return {'y': -17, 'x': -1, 'z': -4}
-    elif short_name == 'lavastorm':
-        return {'y': 918, 'x': 1318, 'z': 119}
-    elif short_name == 'neriakb':
-        return {'y': 3, 'x': -493, 'z': -10}
-    elif short_name == 'northkarana':
-        return {'y': -688, 'x': -175, 'z': -7.5}
-    elif short_name == 'eastkarana':
-        return {'y': 1333, 'x': 423, 'z': 1}
-    elif short_name == 'oasis':
-        return {'y': 532, 'x': 110, 'z': 6}
-    elif short_name == 'oggok':
-        return {'y': 465, 'x': 513, 'z': 3.75}
-    elif short_name == 'oot':
-        return {'y': 394, 'x': -9172, 'z': 6}
-    elif short_name == 'qey2hh1':
-        return {'y': -3570, 'x': -14816, 'z': 36}
-    elif short_name == 'qeynos2':
-        return {'y': 165, 'x': 392, 'z': 4}
-    elif short_name == 'qrg':
-        return {'y': 45, 'x': -66, 'z': 4}
-    elif short_name == 'rivervale':
-        return {'y': -10, 'x': -140, 'z': 4}
-    elif short_name == 'gukbottom':
-        return {'y': 1157, 'x': -233, 'z': -80}
-    elif short_name == 'lakerathe':
-        return {'y': 2404, 'x': 2673, 'z': 95}
-    elif short_name == 'southkarana':
-        return {'y': -6689, 'x': 1027, 'z': 0}
-    elif short_name == 'akanon':
-        return {'y': 1279, 'x': -761, 'z': -24.25}
-    elif short_name == 'cauldron':
-        return {'y': -1790, 'x': -700, 'z': 100}
-    elif short_name == 'felwithea':
-        return {'y': 240, 'x': -626, 'z': -10.25}
-    elif short_name == 'gfaydark':
-        return {'y': 458, 'x': -385, 'z': 0}
-    elif short_name == 'kaladima':
-        return {'y': 90, 'x': 197, 'z': 3.75}
-    elif short_name == 'mistmoore':
-        return {'y': -294, 'x': 122, 'z': -179}
-    elif short_name == 'erudnext':
-        return {'y': -1216, 'x': -240, 'z': 52}
-    elif short_name == 'hole':
-        return {'y': 287, 'x': -543, 'z': -140}
-    elif short_name == 'paineel':
-        return {'y': 839, 'x': 210, 'z': 4}
-    elif short_name == 'tox':
-        return {'y': -1510, 'x': -916, 'z': -33}
-    elif short_name == 'stonebrunt':
-        return {'y': -4531, 'x': 673, 'z': 0}
-    elif short_name == 'dulak':
-        return {'y': -190, 'x': -1190, 'z': 4}
-    elif short_name == 'gunthak':
-        return {'y': 1402, 'x': -410, 'z': 3}
-    elif short_name == 'burningwood':
-        return {'y': 7407, 'x': -3876, 'z': -233}
-    elif short_name == 'cabeast':
-        return {'y': 969, 'x': -136, 'z': 4.68}
-    elif short_name == 'citymist':
-        return {'y': 249, 'x': -572, 'z': 4}
-    elif short_name == 'dreadlands':
-        return {'y': 3005, 'x': 9633, 'z': 1049}
-    elif short_name == 'fieldofbone':
-        return {'y': -1684, 'x': 1617, 'z': -55}
-    elif short_name == 'firiona':
-        return {'y': -2397, 'x': 1825, 'z': -98}
-    elif short_name == 'frontiermtns':
-        return {'y': 53, 'x': 392, 'z': -102}
-    elif short_name == 'karnor':
-        return {'y': 251, 'x': 160, 'z': 3.75}
-    elif short_name == 'lakeofillomen':
-        return {'y': 985, 'x': -1070, 'z': 78}
-    elif short_name == 'overthere':
-        return {'y': -2757, 'x': 1480, 'z': 11}
-    elif short_name == 'skyfire':
-        return {'y': -3100, 'x': 780, 'z': -158}
-    elif short_name == 'timorous':
-        return {'y': -12256.8, 'x': 4366.5, 'z': -278}
-    elif short_name == 'trakanon':
-        return {'y': -1620, 'x': -4720, 'z': -473}
-    elif short_name == 'chardokb':
-        return {'y': 315, 'x': -210, 'z': 1.5}
-    elif short_name == 'cobaltscar':
-        return {'y': -1064, 'x': -1633, 'z': 296}
-    elif short_name == 'eastwastes':
-        return {'y': -4037, 'x': 464, 'z': 144}
-    elif short_name == 'greatdivide':
-        return {'y': -6646, 'x': 3287, 'z': -35}
-    elif short_name == 'iceclad':
-        return {'y': 1300, 'x': 3127, 'z': 111}
-    elif short_name == 'wakening':
-        return {'y': 1455, 'x': 4552, 'z': -60}
-    elif short_name == 'westwastes':
-        return {'y': 1323, 'x': 808, 'z': -196}
-    elif short_name == 'cobaltscar':
-        return {'y': -1065, 'x': -1634, 'z': 299}
-    elif short_name == 'sirens':
-        return {'y': -590, 'x': 20, 'z': -93}
-    elif short_name == 'dawnshroud':
-        return {'y': -280, 'x': -1260, 'z': 97}
-    elif short_name == 'fungusgrove':
-        return {'y': 2398, 'x': 1359, 'z': -261}
-    elif short_name == 'sharvahl':
-        return {'y': 55, 'x': 250, 'z': -188}
-    elif short_name == 'ssratemple':
-        return {'y': 0, 'x': -6.5, 'z': 4}
-    elif short_name == 'tenebrous':
-        return {'y': -1514, 'x': -967, 'z': -56}
-    elif short_name == 'umbral':
-        return {'y': -640, 'x': 1840, 'z': 24}
-    elif short_name == 'twilight':
-        return {'y': 1338, 'x': -1028, 'z': 39}
-    elif short_name == 'scarlet':
-        return {'y': -956, 'x': -1777, 'z': -99}
-    elif short_name == 'paludal':
-        return {'y': -1175, 'x': 220, 'z': -236}
-    elif short_name == 'bazaar':
-        return {'y': -175, 'x': 105, 'z': -15}
-    elif short_name == 'airplane':
-        return {'y': 1560, 'x': 700, 'z': -680}
-    elif short_name == 'fearplane':
-        return {'y': -1305, 'x': 1065, 'z': 3}
-    elif short_name == 'hateplaneb':
-        return {'y': 680, 'x': -400, 'z': 4}
-    elif short_name == 'poknowledge':
-        return {'y': 50, 'x': -215, 'z': -160}
-    elif short_name == 'potranquility':
-        return {'y': -192, 'x': -8, 'z': -628}
-    elif short_name == 'potimea':
-        return {'y': 110, 'x': 0, 'z': 8}
-    elif short_name == 'barindu':
-        return {'y': -515, 'x': 210, 'z': -117}
-    elif short_name == 'kodtaz':
-        return {'y': -2422, 'x': 1536, 'z': -348}
-    elif short_name == 'natimbi':
-        return {'y': 125, 'x': -310, 'z': 520}
-    elif short_name == 'qvic':
-        return {'y': -1403, 'x': -1018, 'z': -490}
-    elif short_name == 'txevu':
-        return {'y': -20, 'x': -316, 'z': -420}
-    elif short_name == 'wallofslaughter':
-        return {'y': 13, 'x': -943, 'z': 130}
-    else:
+    waypoint = _zone_waypoints.get(short_name)
+    if waypoint is None:
         return {}
+    return dict(waypoint)
 
 
 def get_bane_dmg_body(num):
@@ -2386,7 +2250,7 @@ def lookup_slot(name):
 
 
 def get_focus_values(focus_type, sub_type, engine, SpellsNew):
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         ret_ids = []
         # "All" queries
         ignore_effects = []
@@ -2801,6 +2665,38 @@ def get_focus_values(focus_type, sub_type, engine, SpellsNew):
             raise Exception(f'Unknown focus type: {focus_type}')
 
 
+# Every focus type the item search offers and its sub types, as get_focus_values knows them
+FOCUS_SUB_TYPES = {'Beneficial': ['Preservation', 'Range', 'Haste', 'Duration', 'Healing'],
+                   'Detrimental': ['Preservation', 'Range', 'Haste', 'Duration', 'Damage (All)', 'Damage (Fire)',
+                                   'Damage (Cold)', 'Damage (Magic)', 'Damage (Poison)', 'Damage (Disease)',
+                                   'Damage (DoT)'],
+                   'Pet': ['Pet Power'],
+                   'Melee': ['Ferocity', 'Cleave', 'Dodging', 'Parry', 'Sharpshooting'],
+                   'Bard': ['Wind', 'Stringed', 'Brass', 'Percussion', 'Singing']}
+
+
+def _build_focus_ids(engine, SpellsNew):
+    focus_ids = {}
+    for focus_type, sub_types in FOCUS_SUB_TYPES.items():
+        for sub_type in sub_types:
+            focus_ids[(focus_type, sub_type)] = tuple(sorted(set(get_focus_values(focus_type, sub_type, engine,
+                                                                                  SpellsNew))))
+    return focus_ids
+
+
+def get_all_focus_ids(engine, SpellsNew):
+    """Returns {(focus type, sub type): sorted spell ids of get_focus_values}, kept until the content changes."""
+    return cache.get_versioned('focus_ids', lambda: _build_focus_ids(engine, SpellsNew))
+
+
+def get_focus_ids(focus_type, sub_type, engine, SpellsNew):
+    """Returns get_focus_values' spell ids, sorted, without asking the database again."""
+    focus_ids = get_all_focus_ids(engine, SpellsNew)
+    if (focus_type, sub_type) not in focus_ids:
+        raise Exception(f'Unknown focus type: {focus_type} {sub_type}')
+    return focus_ids[(focus_type, sub_type)]
+
+
 def get_map_data(short_name):
     lines = []
     if short_name == 'Unknown':
@@ -3143,6 +3039,13 @@ def get_era_zones(era_name):
         raise Exception(f'Unknown era: {era_name}')
 
 
+@functools.lru_cache(maxsize=None)
+def _read_zone_list():
+    with open(os.path.join(here, 'item_files/zonelist.txt'), 'r') as fh:
+        return fh.read().split('\n')
+
+
+@functools.lru_cache(maxsize=4096)
 def lookup_zone_name(item_id):
     if item_id == -1:
         return 'Quest'
@@ -3151,9 +3054,7 @@ def lookup_zone_name(item_id):
     if item_id == -3:
         return 'Special Drop'
     zone_id = int(int(item_id) / 1000)
-    with open(os.path.join(here, 'item_files/zonelist.txt'), 'r') as fh:
-        zone_list = fh.read()
-    for line in zone_list.split('\n'):
+    for line in _read_zone_list():
         if f'{zone_id}\t' in line:
             return line.split(str(zone_id))[1].strip()
 
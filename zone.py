@@ -1,8 +1,12 @@
 """EQDB Logic File for Zones."""
-from sqlalchemy import or_, and_
-from sqlalchemy.orm import Session
+from collections import namedtuple
+from types import MappingProxyType
 
+from sqlalchemy import and_
+
+import cache
 import utils
+from database import get_session
 from logic import Zone, engine, Spawn2, SpawnEntry, SpawnGroup, NPCTypes, Item, expansion, \
     ZonePoints, LootTableEntries, LootDropEntries
 
@@ -14,7 +18,64 @@ def _get_link_filters():
             LootDropEntries.item_id == Item.id]
 
 
+ZoneRecord = namedtuple('ZoneRecord', ['zone_id', 'short_name', 'long_name', 'expansion', 'zem'])
+
+
+class ZoneCatalog:
+    """Immutable view of every zone row, indexed by zone id and by short name."""
+    __slots__ = ('records', 'by_id', 'by_short_name')
+
+    def __init__(self, records):
+        by_id = {}
+        by_short_name = {}
+        for record in records:
+            # Instanced versions share an id and short name, the first (base) row wins
+            by_id.setdefault(record.zone_id, record)
+            by_short_name.setdefault(record.short_name, record)
+        self.records = tuple(records)
+        self.by_id = MappingProxyType(by_id)
+        self.by_short_name = MappingProxyType(by_short_name)
+
+    def get(self, zone_id):
+        return self.by_id.get(zone_id)
+
+    def get_by_short_name(self, short_name):
+        return self.by_short_name.get(short_name)
+
+
+def _load_zone_catalog():
+    with get_session(engine) as session:
+        query = session.query(Zone.zoneidnumber, Zone.short_name, Zone.long_name, Zone.expansion,
+                              Zone.zone_exp_multiplier).order_by(Zone.id)
+        result = query.all()
+    return ZoneCatalog([ZoneRecord(*entry) for entry in result])
+
+
+def get_zone_catalog():
+    """Returns the zone catalog, loading it once per content version."""
+    return cache.get_versioned('zone_catalog', _load_zone_catalog)
+
+
+def get_npc_zone(npc_id, session):
+    """Returns the zone record for an NPC, walking through its spawn points if the NPC id doesn't map to a zone."""
+    catalog = get_zone_catalog()
+    record = catalog.get(int(npc_id / 1000))
+    if record is None:
+        query = session.query(Spawn2.zone).\
+            filter(SpawnEntry.npcID == npc_id).\
+            filter(SpawnEntry.spawngroupID == Spawn2.spawngroupID)
+        result = query.first()
+        if result:
+            record = catalog.get_by_short_name(result[0])
+    return record
+
+
 def get_zone_listing():
+    """Returns the zone listing, built once per content version."""
+    return cache.get_versioned('zone_listing', _build_zone_listing)
+
+
+def _build_zone_listing():
     era_list = {'Classic': 0, 'Ruins of Kunark': 1, 'Legacy of Ykesha': 5, 'Scars of Velious': 2, 'Shadows of Luclin': 3,
                 #'Planes of Power': 4, 'Lost Dungeons of Norrath': 6, 'Gates of Discord': 7}
                 'Planes of Power': 4}
@@ -23,20 +84,19 @@ def get_zone_listing():
     # Massaging
     massage_list = {'nedaria': 7, 'bazaar': 3}
     add_to_later = {0: {}, 1: {}, 2: {}, 3: {}, 4: {}, 5: {}, 6: {}, 7: {}}
+    catalog = get_zone_catalog()
+    excl_list = utils.get_exclusion_list('zone')
     for era in era_list:
-        with Session(bind=engine) as session:
-            query = session.query(Zone.zoneidnumber, Zone.short_name, Zone.long_name, Zone.zone_exp_multiplier). \
-                filter(Zone.expansion == era_list[era])
-            result = query.all()
         era_zones = {}
-        for entry in result:
-            id_num = entry[0]
-            excl_list = utils.get_exclusion_list('zone')
+        for entry in catalog.records:
+            if entry.expansion != era_list[era]:
+                continue
+            id_num = entry.zone_id
             if id_num in excl_list:
                 continue
-            short_name = entry[1]
-            long_name = entry[2]
-            zem = entry[3]
+            short_name = entry.short_name
+            long_name = entry.long_name
+            zem = entry.zem
             if short_name in exclusion_list:
                 continue
             if short_name in massage_list.keys() and massage_list[short_name] != era_list[era]:
@@ -55,10 +115,8 @@ def get_zone_listing():
 
 
 def get_zone_long_name(zone_short_name):
-    with Session(bind=engine) as session:
-        query = session.query(Zone.zoneidnumber, Zone.long_name).filter(Zone.short_name == zone_short_name)
-        result = query.first()
-    return result[0], result[1]
+    result = get_zone_catalog().get_by_short_name(zone_short_name)
+    return result.zone_id, result.long_name
 
 
 def get_zone_detail(zone_id):
@@ -66,7 +124,7 @@ def get_zone_detail(zone_id):
     if zone_id in excl_list:
         return None
     # Get some zone details
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         args = [Zone.expansion, Zone.short_name, Zone.long_name, Zone.safe_x, Zone.safe_y, Zone.canbind, Zone.canlevitate,
                 Zone.castoutdoor]
         query = session.query(*args).filter(Zone.zoneidnumber == zone_id)
@@ -85,33 +143,24 @@ def get_zone_detail(zone_id):
                  'outdoor': result[7]}
 
     # Get all the zones this zone connects to
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(ZonePoints.target_zone_id).distinct().filter(ZonePoints.zone == base_data['short_name'])
         result = query.all()
 
-        if result:
-            target_zone_ids = []
-            for entry in result:
-                target_zone_ids.append(Zone.zoneidnumber == entry[0])
-
-            target_zone_params = or_(*target_zone_ids)
-            query = session.query(Zone.zoneidnumber, Zone.long_name, Zone.expansion).filter(target_zone_params)
-            result = query.all()
-        else:
-            result = []
-
+    catalog = get_zone_catalog()
     linked_zone_data = {}
     for entry in result:
-        if int(entry[2]) > expansion:
+        target = catalog.get(entry[0])
+        if not target or int(target.expansion) > expansion:
             continue
-        linked_zone_data.update({entry[0]: entry[1]})
+        linked_zone_data.update({target.zone_id: target.long_name})
     base_data.update({'linked_zones': linked_zone_data})
 
     # Get all the items that drop in this zone.
     known_ids = []
     link_filters = _get_link_filters()
     link_params = and_(*link_filters)
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(Item.id, Item.Name, Item.icon).filter(NPCTypes.id.like(f'{zone_id}___')).\
             filter(link_params)
         result = query.all()
@@ -132,7 +181,7 @@ def get_zone_detail(zone_id):
     # Get all the NPCs for this zone
     spawn_groups = {}
     npc_list = []
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(NPCTypes.id, NPCTypes.name, NPCTypes.hp, NPCTypes.race, NPCTypes.level).\
             filter(NPCTypes.id.like(f'{zone_id}___'))
         result = query.all()
@@ -190,7 +239,7 @@ def get_zone_detail(zone_id):
 
 def get_zone(name):
     partial = "%%%s%%" % name
-    with Session(bind=engine) as session:
+    with get_session(engine) as session:
         query = session.query(Zone.zoneidnumber, Zone.long_name).\
             filter(Zone.long_name.like(partial)).\
             filter(Zone.expansion <= expansion)
@@ -206,192 +255,40 @@ def get_zone(name):
     return out_zones
 
 
-def waypoint_listing():
-    antonica = {}
-    faydwer = {}
-    odus = {}
-    kunark = {}
-    velious = {}
-    luclin = {}
-    planes = {}
-    #taelosia = {}
-    #kuua = {}
-    entries = [Zone.short_name == 'blackburrow',
-               Zone.short_name == 'commons',
-               Zone.short_name == 'ecommons',
-               Zone.short_name == 'feerrott',
-               Zone.short_name == 'freportw',
-               Zone.short_name == 'grobb',
-               Zone.short_name == 'everfrost',
-               Zone.short_name == 'halas',
-               Zone.short_name == 'highkeep',
-               Zone.short_name == 'lavastorm',
-               Zone.short_name == 'neriakb',
-               Zone.short_name == 'northkarana',
-               Zone.short_name == 'eastkarana',
-               Zone.short_name == 'oasis',
-               Zone.short_name == 'oggok',
-               Zone.short_name == 'oot',
-               Zone.short_name == 'qey2hh1',
-               Zone.short_name == 'qeynos2',
-               Zone.short_name == 'qrg',
-               Zone.short_name == 'rivervale',
-               Zone.short_name == 'gukbottom',
-               Zone.short_name == 'lakerathe',
-               Zone.short_name == 'southkarana']
-    entry_params = or_(*entries)
-    with Session(bind=engine) as session:
-        query = session.query(Zone.short_name, Zone.zoneidnumber, Zone.long_name).filter(entry_params)
-        result = query.all()
-
-    for entry in result:
-        sub_data = utils.get_zone_waypoint(entry[0])
-        sub_data.update({'zone_id': entry[1]})
-        antonica.update({entry[2]: sub_data})
-
-    entries = [Zone.short_name == 'akanon',
-               Zone.short_name == 'cauldron',
-               Zone.short_name == 'felwithea',
-               Zone.short_name == 'gfaydark',
-               Zone.short_name == 'kaladmina',
-               Zone.short_name == 'mistmoore']
-    entry_params = or_(*entries)
-    with Session(bind=engine) as session:
-        query = session.query(Zone.short_name, Zone.zoneidnumber, Zone.long_name).filter(entry_params)
-        result = query.all()
-
-    for entry in result:
-        sub_data = utils.get_zone_waypoint(entry[0])
-        sub_data.update({'zone_id': entry[1]})
-        faydwer.update({entry[2]: sub_data})
-
-    entries = [Zone.short_name == 'erudnext',
-               Zone.short_name == 'hole',
-               Zone.short_name == 'paineel',
-               Zone.short_name == 'tox',
-               Zone.short_name == 'stonebrunt',
-               Zone.short_name == 'dulak',
-               Zone.short_name == 'gunthak']
-    entry_params = or_(*entries)
-    with Session(bind=engine) as session:
-        query = session.query(Zone.short_name, Zone.zoneidnumber, Zone.long_name).filter(entry_params)
-        result = query.all()
-
-    for entry in result:
-        sub_data = utils.get_zone_waypoint(entry[0])
-        sub_data.update({'zone_id': entry[1]})
-        odus.update({entry[2]: sub_data})
-
-    entries = [Zone.short_name == 'burningwood',
-               Zone.short_name == 'cabeast',
-               Zone.short_name == 'citymist',
-               Zone.short_name == 'dreadlands',
-               Zone.short_name == 'fieldofbone',
-               Zone.short_name == 'firiona',
-               Zone.short_name == 'frontiermtns',
-               Zone.short_name == 'karnor',
-               Zone.short_name == 'lakeofillomen',
-               Zone.short_name == 'overthere',
-               Zone.short_name == 'skyfire',
-               Zone.short_name == 'timorous',
-               Zone.short_name == 'trakanon',
-               Zone.short_name == 'chardokb']
-    entry_params = or_(*entries)
-    with Session(bind=engine) as session:
-        query = session.query(Zone.short_name, Zone.zoneidnumber, Zone.long_name).filter(entry_params)
-        result = query.all()
-
-    for entry in result:
-        sub_data = utils.get_zone_waypoint(entry[0])
-        sub_data.update({'zone_id': entry[1]})
-        kunark.update({entry[2]: sub_data})
-
-    entries = [Zone.short_name == 'cobaltscar',
-               Zone.short_name == 'eastwastes',
-               Zone.short_name == 'greatdivide',
-               Zone.short_name == 'iceclad',
-               Zone.short_name == 'wakening',
-               Zone.short_name == 'westwastes',
-               Zone.short_name == 'cobaltscar',
-               Zone.short_name == 'sirens']
-    entry_params = or_(*entries)
-    with Session(bind=engine) as session:
-        query = session.query(Zone.short_name, Zone.zoneidnumber, Zone.long_name).filter(entry_params)
-        result = query.all()
-
-    for entry in result:
-        sub_data = utils.get_zone_waypoint(entry[0])
-        sub_data.update({'zone_id': entry[1]})
-        velious.update({entry[2]: sub_data})
-
-    entries = [Zone.short_name == 'dawnshroud',
-               Zone.short_name == 'fungusgrove',
-               Zone.short_name == 'sharvahl',
-               Zone.short_name == 'ssratemple',
-               Zone.short_name == 'tenebrous',
-               Zone.short_name == 'umbral',
-               Zone.short_name == 'twilight',
-               Zone.short_name == 'scarlet',
-               Zone.short_name == 'paludal',
-               Zone.short_name == 'bazaar']
-    entry_params = or_(*entries)
-    with Session(bind=engine) as session:
-        query = session.query(Zone.short_name, Zone.zoneidnumber, Zone.long_name).filter(entry_params)
-        result = query.all()
+# Zones shown on the waypoint listing, by continent
+WAYPOINT_REGIONS = {
+    'Antonica': ['blackburrow', 'commons', 'ecommons', 'feerrott', 'freportw', 'grobb', 'everfrost', 'halas',
+                 'highkeep', 'lavastorm', 'neriakb', 'northkarana', 'eastkarana', 'oasis', 'oggok', 'oot', 'qey2hh1',
+                 'qeynos2', 'qrg', 'rivervale', 'gukbottom', 'lakerathe', 'southkarana'],
+    'Faydwer': ['akanon', 'cauldron', 'felwithea', 'gfaydark', 'kaladmina', 'mistmoore'],
+    'Odus': ['erudnext', 'hole', 'paineel', 'tox', 'stonebrunt', 'dulak', 'gunthak'],
+    'Kunark': ['burningwood', 'cabeast', 'citymist', 'dreadlands', 'fieldofbone', 'firiona', 'frontiermtns', 'karnor',
+               'lakeofillomen', 'overthere', 'skyfire', 'timorous', 'trakanon', 'chardokb'],
+    'Velious': ['cobaltscar', 'eastwastes', 'greatdivide', 'iceclad', 'wakening', 'westwastes', 'sirens'],
+    'Luclin': ['dawnshroud', 'fungusgrove', 'sharvahl', 'ssratemple', 'tenebrous', 'umbral', 'twilight', 'scarlet',
+               'paludal', 'bazaar'],
+    'Planes': ['airplane', 'fearplane', 'hateplaneb', 'poknowledge', 'potranquility', 'potimea'],
+    # 'Taelosia': ['barindu', 'kodtaz', 'natimbi', 'qvic', 'txevu'],
+    # 'Kuua': ['wallofslaughter'],
+}
 
-    for entry in result:
-        sub_data = utils.get_zone_waypoint(entry[0])
-        sub_data.update({'zone_id': entry[1]})
-        luclin.update({entry[2]: sub_data})
-
-    entries = [Zone.short_name == 'airplane',
-               Zone.short_name == 'fearplane',
-               Zone.short_name == 'hateplaneb',
-               Zone.short_name == 'poknowledge',
-               Zone.short_name == 'potranquility',
-               Zone.short_name == 'potimea']
-    entry_params = or_(*entries)
-    with Session(bind=engine) as session:
-        query = session.query(Zone.short_name, Zone.zoneidnumber, Zone.long_name).filter(entry_params)
-        result = query.all()
 
-    for entry in result:
-        sub_data = utils.get_zone_waypoint(entry[0])
-        sub_data.update({'zone_id': entry[1]})
-        planes.update({entry[2]: sub_data})
-
-    # entries = [Zone.short_name == 'barindu',
-    #            Zone.short_name == 'kodtaz',
-    #            Zone.short_name == 'natimbi',
-    #            Zone.short_name == 'qvic',
-    #            Zone.short_name == 'txevu']
-    # entry_params = or_(*entries)
-    # with Session(bind=engine) as session:
-    #     query = session.query(Zone.short_name, Zone.zoneidnumber, Zone.long_name).filter(entry_params)
-    #     result = query.all()
-    #
-    # for entry in result:
-    #     sub_data = utils.get_zone_waypoint(entry[0])
-    #     sub_data.update({'zone_id': entry[1]})
-    #     taelosia.update({entry[2]: sub_data})
-    #
-    # entries = [Zone.short_name == 'wallofslaughter']
-    # entry_params = or_(*entries)
-    # with Session(bind=engine) as session:
-    #     query = session.query(Zone.short_name, Zone.zoneidnumber, Zone.long_name).filter(entry_params)
-    #     result = query.all()
-    #
-    # for entry in result:
-    #     sub_data = utils.get_zone_waypoint(entry[0])
-    #     sub_data.update({'zone_id': entry[1]})
-    #     kuua.update({entry[2]: sub_data})
-
-    return {'Antonica': antonica,
-            'Faydwer': faydwer,
-            'Odus': odus,
-            'Kunark': kunark,
-            'Velious': velious,
-            'Luclin': luclin,
-            'Planes': planes}
-            #'Taelosia': taelosia,
-            #'Kuua': kuua}
\ No newline at end of file
+def waypoint_listing():
+    """Returns the waypoint listing, built once per content version."""
+    return cache.get_versioned('waypoint_listing', _build_waypoint_listing)
+
+
+def _build_waypoint_listing():
+    catalog = get_zone_catalog()
+    out_data = {}
+    for region, short_names in WAYPOINT_REGIONS.items():
+        zones = {}
+        for short_name in short_names:
+            record = catalog.get_by_short_name(short_name)
+            if not record:
+                continue
+            sub_data = utils.get_zone_waypoint(short_name)
+            sub_data.update({'zone_id': record.zone_id})
+            zones.update({record.long_name: sub_data})
+        out_data.update({region: zones})
+    return out_data